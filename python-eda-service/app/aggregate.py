@@ -0,0 +1,206 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+@dataclass
+class Reduction:
+    """Per-group sums for one dimension; arrays are aligned with `labels`."""
+    labels: np.ndarray
+    sales: np.ndarray
+    profit: np.ndarray
+    count: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def top(self, n: Optional[int] = None, field: str = "sales") -> Reduction:
+        """Groups ordered by `field` descending, optionally truncated to n."""
+        order = np.argsort(-getattr(self, field), kind="stable")[:n]
+        return self.take(order)
+
+    def take(self, idx: np.ndarray) -> Reduction:
+        return Reduction(self.labels[idx], self.sales[idx], self.profit[idx], self.count[idx])
+
+    def top_other(self, n: int, total: Optional[float] = None) -> Reduction:
+        """The n largest groups by sales, plus one "Other (k more)" group summing the long tail.
+
+        With `total` (overall sales when only some groups are tracked, as in
+        sketch reductions) the tail is what the top n leave of it.
+        """
+        top = self.top()
+        head = top.take(np.arange(min(n, len(top))))
+        tail = top.take(np.arange(len(head), len(top)))
+        if total is not None:
+            other = (max(total - head.sales.sum(), 0.0), np.nan, 0)
+        else:
+            other = (tail.sales.sum(), tail.profit.sum(), tail.count.sum())
+        if not len(tail) and not other[0]:
+            return head
+        label = f"Other ({len(tail)} more)" if len(tail) else "Other"
+        return Reduction(np.append(head.labels.astype(object), label), np.append(head.sales, other[0]),
+                         np.append(head.profit, other[1]), np.append(head.count, other[2]).astype("int64"))
+
+    def merge(self, other: Reduction) -> Reduction:
+        """Sum two reductions of the same dimension; labels keep first-seen order."""
+        codes, uniques = pd.factorize(np.concatenate([self.labels, other.labels]), sort=False)
+        n = len(uniques)
+        return Reduction(
+            labels=np.asarray(uniques),
+            sales=np.bincount(codes, weights=np.concatenate([self.sales, other.sales]), minlength=n),
+            profit=np.bincount(codes, weights=np.concatenate([self.profit, other.profit]), minlength=n),
+            count=np.bincount(codes, weights=np.concatenate([self.count, other.count]), minlength=n).astype("int64"),
+        )
+
+@dataclass
+class Aggregates:
+    by: Dict[str, Reduction]
+    rows: int
+    total_sales: float
+    total_profit: float
+    profit_rows: int            # rows that carry a profit value
+    sales_rows: int             # rows that carry a sales value
+
+    def get(self, dim: str) -> Optional[Reduction]:
+        return self.by.get(dim)
+
+    def merge(self, other: Aggregates) -> Aggregates:
+        """Aggregates over the union of both inputs' rows (e.g. state + appended rows)."""
+        by = dict(self.by)
+        for dim, r in other.by.items():
+            by[dim] = by[dim].merge(r) if dim in by else r
+        if "month" in by:
+            by["month"] = by["month"].take(np.argsort(by["month"].labels))
+        return Aggregates(by, self.rows + other.rows, self.total_sales + other.total_sales,
+                          self.total_profit + other.total_profit, self.profit_rows + other.profit_rows,
+                          self.sales_rows + other.sales_rows)
+
+class AggregateMerger:
+    """Folds a stream of partial Aggregates into one.
+
+    Partials are merged in binary-counter order (like a merge sort), so each
+    group is re-merged O(log chunks) times rather than once per chunk. Older
+    partials stay on the left, keeping first-seen label order.
+    """
+
+    def __init__(self):
+        self._stack: List[Tuple[int, Aggregates]] = []
+
+    def add(self, part: Aggregates) -> None:
+        level = 0
+        while self._stack and self._stack[-1][0] == level:
+            part = self._stack.pop()[1].merge(part)
+            level += 1
+        self._stack.append((level, part))
+
+    def result(self) -> Optional[Aggregates]:
+        merged = None
+        for _, part in self._stack:
+            merged = part if merged is None else merged.merge(part)
+        return merged
+
+def reservoir(sample: Optional[pd.DataFrame], seen: int, points: Optional[pd.DataFrame],
+              k: int) -> Tuple[Optional[pd.DataFrame], int]:
+    """Fold new points into a uniform sample of at most k rows (Algorithm R).
+
+    Returns the sample and the number of points offered so far. While fewer
+    than k points were seen the sample is all of them, in order.
+    """
+    if points is None or len(points) == 0:
+        return sample, seen
+    base = sample if sample is not None else points.iloc[:0]
+    combined = pd.concat([base, points], ignore_index=True)
+    keep = list(range(len(base)))
+    fill = min(max(k - len(keep), 0), len(points))
+    keep += range(len(base), len(base) + fill)
+    rest = np.arange(fill, len(points))
+    if len(rest):
+        rng = np.random.default_rng(seen)
+        slots = rng.integers(0, seen + rest + 1)  # the t-th point overall replaces a slot with probability k/(t+1)
+        for j, slot in zip(rest[slots < k], slots[slots < k]):
+            keep[slot] = len(base) + j
+    return combined.iloc[keep].reset_index(drop=True), seen + len(points)
+
+def _grid_edges(values: np.ndarray, bins: int) -> np.ndarray:
+    """Edges over the 0.5-99.5 percentile range; one bin per value for integers with a short range."""
+    lo, hi = np.quantile(values, [0.005, 0.995])
+    if hi - lo < bins and np.array_equal(values, np.round(values)):
+        return np.arange(np.round(lo) - 0.5, np.round(hi) + 1.0)
+    if hi <= lo:
+        return np.array([lo - 0.5, lo + 0.5])
+    return np.linspace(lo, hi, bins + 1)
+
+@dataclass
+class DensityGrid:
+    """Rows and sales per cell of a price x quantity grid, indexed [y, x] (as pcolormesh takes them).
+
+    The edges are fixed when the grid is created (see `fit`). Points beyond
+    them are counted in the outermost cells, so later chunks or appended rows
+    are added without re-binning and the shares always add up to 1.
+    """
+    x_edges: np.ndarray
+    y_edges: np.ndarray
+    rows: np.ndarray
+    sales: np.ndarray
+
+    @classmethod
+    def fit(cls, x: np.ndarray, y: np.ndarray, bins: Tuple[int, int] = (30, 20)) -> DensityGrid:
+        """Empty grid of at most `bins` cells with edges fitted to the points (x, y)."""
+        xe, ye = _grid_edges(x, bins[0]), _grid_edges(y, bins[1])
+        shape = (len(ye) - 1, len(xe) - 1)
+        return cls(xe, ye, np.zeros(shape), np.zeros(shape))
+
+    def add(self, x: np.ndarray, y: np.ndarray, sales: np.ndarray) -> None:
+        xc, yc = np.clip(x, self.x_edges[0], self.x_edges[-1]), np.clip(y, self.y_edges[0], self.y_edges[-1])
+        self.rows += np.histogram2d(yc, xc, bins=[self.y_edges, self.x_edges])[0]
+        self.sales += np.histogram2d(yc, xc, bins=[self.y_edges, self.x_edges], weights=sales)[0]
+
+    def shares(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(share of rows, share of sales) per cell."""
+        return self.rows / max(self.rows.sum(), 1), self.sales / (self.sales.sum() or 1)
+
+def factorize(values: pd.Series):
+    """Integer codes (-1 for missing) and uniques, reusing categorical codes when present."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories.to_numpy()
+    codes, uniques = pd.factorize(values, sort=False, use_na_sentinel=True)
+    return codes, np.asarray(uniques)
+
+def month_keys(dates: pd.Series) -> pd.Series:
+    # datetime64[M] truncation is vectorized, unlike .dt.to_period('M')
+    v = dates.to_numpy()
+    return pd.Series(v.astype("datetime64[M]").astype(v.dtype), index=dates.index)
+
+def reduce_codes(codes: np.ndarray, uniques: np.ndarray, sales: np.ndarray, profit: np.ndarray) -> Reduction:
+    valid = codes >= 0
+    c = codes[valid]
+    n = len(uniques)
+    r = Reduction(
+        labels=uniques,
+        sales=np.bincount(c, weights=sales[valid], minlength=n),
+        profit=np.bincount(c, weights=profit[valid], minlength=n),
+        count=np.bincount(c, minlength=n),
+    )
+    # Unused categorical levels would otherwise show up as empty groups
+    return r if r.count.all() else r.take(np.flatnonzero(r.count))
+
+class AggregationPlan:
+    """Factorize each dimension once, then compute every reduction in one batched pass."""
+
+    def __init__(self, dims: Dict[str, pd.Series]):
+        self.dims = {name: factorize(s) for name, s in dims.items() if s is not None}
+
+    def run(self, sales: pd.Series, profit: pd.Series) -> Aggregates:
+        s = sales.to_numpy(dtype="float64", na_value=np.nan)
+        p = profit.to_numpy(dtype="float64", na_value=np.nan)
+        # groupby().sum() skips NaN; zero-filling once gives the same totals for every dimension
+        s0 = np.where(np.isnan(s), 0.0, s)
+        p0 = np.where(np.isnan(p), 0.0, p)
+        by = {name: reduce_codes(codes, uniques, s0, p0) for name, (codes, uniques) in self.dims.items()}
+        if "month" in by:
+            m = by["month"]
+            by["month"] = m.take(np.argsort(m.labels))
+        return Aggregates(by, rows=len(s), total_sales=float(s0.sum()), total_profit=float(p0.sum()),
+                          profit_rows=int((~np.isnan(p)).sum()), sales_rows=int((~np.isnan(s)).sum()))
@@ -0,0 +1,307 @@
+from __future__ import annotations
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+EdaResult = Tuple[Dict[str, Any], List[Tuple[str, bytes]], Optional[BinaryIO]]
+
+@dataclass
+class CachedReport:
+    chart_json: Dict[str, Any]
+    images: List[Tuple[str, bytes]]
+    pdf: Optional[bytes]                # None when the PDF is only kept in the disk tier, or was not rendered
+    # owner (user id) -> {"pdf": path, "images": [paths]} already in storage
+    uploads: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    pdf_path: Optional[str] = None
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.pdf or b"") + sum(len(img) for _, img in self.images)
+
+    def open_pdf(self) -> Optional[BinaryIO]:
+        if self.pdf is not None:
+            return io.BytesIO(self.pdf)
+        return open(self.pdf_path, "rb") if self.pdf_path else None
+
+    def as_tuple(self) -> EdaResult:
+        return self.chart_json, self.images, self.open_pdf()
+
+def content_hash(content: Union[bytes, BinaryIO]) -> str:
+    """SHA-256 of an upload; a stream is read in chunks and rewound."""
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(content).hexdigest()
+    h = hashlib.sha256()
+    content.seek(0)
+    for chunk in iter(lambda: content.read(1024 * 1024), b""):
+        h.update(chunk)
+    content.seek(0)
+    return h.hexdigest()
+
+def cache_key(digest: str, *parts: str) -> str:
+    """Key of something derived from content with the given `content_hash`, so the upload is only hashed once."""
+    h = hashlib.sha256(digest.encode())
+    for p in parts:
+        h.update(b"\0" + str(p).encode())
+    return h.hexdigest()
+
+class ResultCache:
+    """Two-tier (memory, disk) LRU cache of EDA results keyed by content hash.
+
+    Concurrent `get_or_compute` calls for the same key wait for the first
+    caller's computation instead of running their own. With a disk tier the
+    PDF is streamed to disk and not held in memory.
+    """
+
+    def __init__(self, directory: Optional[str], memory_bytes: int, disk_bytes: int):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._mem: "OrderedDict[str, CachedReport]" = OrderedDict()
+        self._mem_used = 0
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[CachedReport]:
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key)
+                return entry
+        entry = self._disk_get(key)
+        if entry is not None:
+            with self._lock:
+                self._mem_put(key, entry)
+        return entry
+
+    def put(self, key: str, result: EdaResult) -> CachedReport:
+        chart_json, images, pdf = result
+        entry = self._disk_put(key, chart_json, images, pdf)
+        if entry is None:
+            data = None
+            if pdf is not None:
+                pdf.seek(0)
+                data = pdf.read()
+            entry = CachedReport(chart_json, images, data)
+        with self._lock:
+            self._mem_put(key, entry)
+        return entry
+
+    def get_or_compute(self, key: str, compute: Callable[[], EdaResult]) -> Tuple[EdaResult, bool]:
+        """Return (result, hit) with the result's PDF opened; `hit` is True when `compute` was not run by this caller.
+
+        An entry whose PDF was evicted from disk before it could be opened
+        counts as a miss and is computed again (an open PDF stays readable).
+        """
+        while True:
+            entry, hit = self._entry(key, compute)
+            try:
+                return entry.as_tuple(), hit
+            except FileNotFoundError:
+                self._mem_drop(key)
+
+    def _entry(self, key: str, compute: Callable[[], EdaResult]) -> Tuple[CachedReport, bool]:
+        entry = self.get(key)
+        if entry is not None:
+            return entry, True
+        with self._lock:
+            # The leader may have finished between the lookup above and here
+            if key in self._mem:
+                return self._mem[key], True
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+        if not leader:
+            return fut.result(), True
+        try:
+            entry = self.put(key, compute())
+            fut.set_result(entry)
+            return entry, False
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def uploads_for(self, key: str, owner: str) -> Optional[Dict[str, Any]]:
+        entry = self.get(key)
+        return entry.uploads.get(owner) if entry else None
+
+    def record_uploads(self, key: str, owner: str, pdf_path: str, image_paths: List[str]) -> None:
+        entry = self.get(key)
+        if entry is None:
+            return
+        with self._lock:
+            entry.uploads[owner] = {"pdf": pdf_path, "images": list(image_paths)}
+        if self.directory:
+            path = os.path.join(self.directory, key)
+            if os.path.isdir(path):
+                with open(os.path.join(path, "uploads.json"), "w") as f:
+                    json.dump(entry.uploads, f)
+
+    def _mem_put(self, key: str, entry: CachedReport) -> None:
+        if entry.nbytes > self.memory_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_used -= old.nbytes
+        self._mem[key] = entry
+        self._mem_used += entry.nbytes
+        while self._mem_used > self.memory_bytes:
+            _, evicted = self._mem.popitem(last=False)
+            self._mem_used -= evicted.nbytes
+
+    def _mem_drop(self, key: str) -> None:
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self._mem_used -= old.nbytes
+
+    def _disk_get(self, key: str) -> Optional[CachedReport]:
+        if not self.directory:
+            return None
+        path = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(path, "metrics.json")) as f:
+                meta = json.load(f)
+            images = []
+            for name in meta["images"]:
+                with open(os.path.join(path, "images", name), "rb") as f:
+                    images.append((name, f.read()))
+            uploads = {}
+            if os.path.exists(os.path.join(path, "uploads.json")):
+                with open(os.path.join(path, "uploads.json")) as f:
+                    uploads = json.load(f)
+            pdf_path = os.path.join(path, "report.pdf") if meta["pdf"] else None
+            if pdf_path and not os.path.exists(pdf_path):
+                return None  # being evicted
+            os.utime(path)  # mark as recently used
+        except (OSError, ValueError, KeyError):
+            return None
+        return CachedReport(meta["chart_json"], images, None, uploads, pdf_path=pdf_path)
+
+    def _disk_put(self, key: str, chart_json: Dict[str, Any], images: List[Tuple[str, bytes]], pdf: Optional[BinaryIO]) -> Optional[CachedReport]:
+        if not self.directory:
+            return None
+        final = os.path.join(self.directory, key)
+        if not os.path.isdir(final):
+            tmp = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+            try:
+                os.makedirs(os.path.join(tmp, "images"))
+                for name, img in images:
+                    with open(os.path.join(tmp, "images", name), "wb") as f:
+                        f.write(img)
+                if pdf is not None:
+                    pdf.seek(0)
+                    with open(os.path.join(tmp, "report.pdf"), "wb") as f:
+                        shutil.copyfileobj(pdf, f)
+                with open(os.path.join(tmp, "metrics.json"), "w") as f:
+                    json.dump({"chart_json": chart_json, "images": [n for n, _ in images], "pdf": pdf is not None}, f)
+                os.replace(tmp, final)
+            except OSError as e:
+                logging.warning(f"Result cache write failed for {key}: {e}")
+                shutil.rmtree(tmp, ignore_errors=True)
+                return None
+            self._disk_evict(keep=key)
+        return CachedReport(chart_json, images, None, pdf_path=os.path.join(final, "report.pdf") if pdf is not None else None)
+
+    def _disk_evict(self, keep: str) -> None:
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            size = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+            entries.append((os.path.getmtime(path), size, name))
+            total += size
+        for _, size, name in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            if name == keep:
+                continue
+            # Memory entries point at the disk copy of their PDF
+            self._mem_drop(name)
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            total -= size
+
+class SnapshotStore:
+    """Local LRU directory of Arrow dataset snapshots, kept on disk so they can be memory-mapped."""
+
+    def __init__(self, directory: Optional[str], disk_bytes: int):
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.arrow")
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.directory:
+            return None
+        path = self.path(key)
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            return None
+        return path
+
+    @contextmanager
+    def writing(self, key: str) -> Iterator[Optional[BinaryIO]]:
+        """File to write the snapshot to; published under `key` if the block succeeds and wrote anything.
+
+        Yields None when the store is disabled.
+        """
+        if not self.directory:
+            yield None
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield f
+                written = f.tell()
+            if written:
+                os.replace(tmp, self.path(key))
+                self._evict(keep=key)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def put(self, key: str, data: BinaryIO) -> Optional[str]:
+        with self.writing(key) as f:
+            if f is None:
+                return None
+            data.seek(0)
+            shutil.copyfileobj(data, f)
+        return self.get(key)
+
+    def _evict(self, keep: str) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            entries.append((os.path.getmtime(path), os.path.getsize(path), name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            if name == f"{keep}.arrow":
+                continue
+            # Frames already loaded keep their mapping; unlinking only frees the space afterwards
+            os.remove(os.path.join(self.directory, name))
+            total -= size
@@ -0,0 +1,185 @@
+from __future__ import annotations
+import io
+import logging
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional, Tuple
+
+import numpy as np
+import matplotlib.style as mstyle
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+
+from .specs import OUTPUTS, PRESETS, WEBP_QUALITY, ChartSpec, Preset, output_name
+from .spool import new_spool
+
+PALETTE = ["#4e79a7","#f28e2b","#e15759","#76b7b2","#59a14f","#edc949","#af7aa1","#ff9da7","#9c755f","#bab0ab"]
+STYLE = ["seaborn-v0_8-whitegrid", {"axes.prop_cycle": f"cycler('color', {PALETTE})"}]
+# Applied once per process at import: style.context() would save and restore the global rcParams
+# around every chart, racing with charts drawn on other threads when rendering in-process
+mstyle.use(STYLE)
+
+CHART_WORKERS = int(os.environ.get("CHART_WORKERS", os.cpu_count() or 1))
+
+# Line charts with more points than this are drawn without markers
+LINE_MARKERS = 120
+
+@dataclass(frozen=True)
+class RenderedChart:
+    name: str                   # file stem, e.g. 'trend_sales'
+    files: List[Tuple[str, bytes]]  # (file name, encoded image) per configured output
+    pdf: bytes                  # single-page PDF
+    seconds: float = 0.0        # render time, measured in the worker
+
+def _draw_line(fig: Figure, spec: ChartSpec):
+    ax = fig.add_subplot()
+    # Per-point markers cost a draw call each; long series read fine as a plain line
+    ax.plot(spec.data["x"], spec.data["y"], marker="o" if len(spec.data["x"]) <= LINE_MARKERS else None)
+    return ax
+
+def _draw_bar(fig: Figure, spec: ChartSpec):
+    ax = fig.add_subplot()
+    labels = spec.data["labels"]
+    ax.bar(range(len(labels)), spec.data["values"], color=PALETTE[0])
+    ax.set_xticks(range(len(labels)), labels, rotation=35, ha="right")
+    return ax
+
+def _draw_hist(fig: Figure, spec: ChartSpec):
+    ax = fig.add_subplot()
+    edges = np.asarray(spec.data["edges"])
+    ax.hist(edges[:-1], bins=edges, weights=spec.data["counts"])
+    return ax
+
+def _draw_pareto(fig: Figure, spec: ChartSpec):
+    ax1 = _draw_bar(fig, spec)
+    ax2 = ax1.twinx()
+    ax2.plot(range(len(spec.data["cumulative"])), spec.data["cumulative"], marker="o", color=PALETTE[1])
+    ax2.set_ylabel("Cumulative Share")
+    ax2.grid(False)
+    return ax1
+
+def _draw_density(fig: Figure, spec: ChartSpec):
+    # One quad per grid cell; empty cells stay blank
+    ax = fig.add_subplot()
+    rows = np.ma.masked_equal(np.asarray(spec.data["rows"]) * 100, 0)
+    mesh = ax.pcolormesh(spec.data["x_edges"], spec.data["y_edges"], rows, cmap="Blues")
+    fig.colorbar(mesh, ax=ax, label="% of rows")
+    return ax
+
+DRAWERS = {
+    "line": _draw_line,
+    "bar": _draw_bar,
+    "hist": _draw_hist,
+    "pareto": _draw_pareto,
+    "density": _draw_density,
+}
+
+def _encode(raster: Image.Image, fmt: str, scale: float) -> bytes:
+    if scale != 1:
+        raster = raster.resize((round(raster.width * scale), round(raster.height * scale)), Image.LANCZOS)
+    buf = io.BytesIO()
+    if fmt == "webp":
+        raster.save(buf, format="WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        raster.save(buf, format="PNG")
+    return buf.getvalue()
+
+def render_chart(spec: ChartSpec, outputs: Optional[List[Tuple[str, Preset]]] = None) -> RenderedChart:
+    """Draw one chart with the object-oriented API (no pyplot global state).
+
+    Layout is computed once and the figure is rasterized once with Agg at the
+    largest raster DPI; every PNG/WebP preset is encoded (and downscaled) from
+    that one buffer. SVG and the PDF page replay the same fixed layout.
+    """
+    t0 = time.perf_counter()
+    outputs = OUTPUTS if outputs is None else outputs
+    raster_dpi = max((p.dpi for fmt, p in outputs if fmt != "svg"), default=PRESETS["full"].dpi)
+    fig = Figure(figsize=spec.figsize, dpi=raster_dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = DRAWERS[spec.kind](fig, spec)
+    ax.set_title(spec.axes.get("title", ""))
+    ax.set_xlabel(spec.axes.get("xlabel", ""))
+    ax.set_ylabel(spec.axes.get("ylabel", ""))
+    fig.suptitle(spec.title, fontsize=14, fontweight="bold")
+    fig.tight_layout(rect=[0, 0.03, 1, 0.95])
+    fig.set_layout_engine("none")   # freeze the layout for every output below
+    raster = None
+    files = []
+    for fmt, preset in outputs:
+        name = output_name(spec.key, fmt, preset)
+        if fmt == "svg":
+            buf = io.BytesIO()
+            fig.savefig(buf, format="svg")
+            files.append((name, buf.getvalue()))
+            continue
+        if raster is None:
+            canvas.draw()
+            raster = Image.frombuffer("RGBA", canvas.get_width_height(), canvas.buffer_rgba()).convert("RGB")
+        files.append((name, _encode(raster, fmt, preset.dpi / raster_dpi)))
+    pdf = io.BytesIO()
+    fig.savefig(pdf, format="pdf")
+    return RenderedChart(spec.key, files, pdf.getvalue(), time.perf_counter() - t0)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a threaded server process is unsafe; start workers from a clean interpreter
+            method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+            ctx = mp.get_context(method)
+            if method == "forkserver":
+                # Import matplotlib & co. once in the fork server; workers fork from it already loaded
+                ctx.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=ctx)
+        return _pool
+
+def reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+WARMUP_SPEC = ChartSpec("warmup.png", "Warmup", "line", {"x": [0, 1], "y": [0, 1]}, {"title": "warmup"})
+
+def _warm(_=None) -> int:
+    render_chart(WARMUP_SPEC)
+    return os.getpid()
+
+def warmup() -> None:
+    """Load fonts/backends and start the worker pool before the first request needs them."""
+    _warm()
+    if CHART_WORKERS > 1:
+        pids = set(get_pool().map(_warm, range(CHART_WORKERS)))
+        logging.info(f"Chart pool ready ({len(pids)} workers)")
+
+def render_all(specs: List[ChartSpec]) -> List[RenderedChart]:
+    """Render specs across the process pool; results keep the order of `specs`."""
+    if CHART_WORKERS <= 1 or len(specs) <= 1:
+        return [render_chart(s) for s in specs]
+    try:
+        return list(get_pool().map(render_chart, specs))
+    except BrokenProcessPool:
+        logging.warning("Chart worker pool died, rendering in-process")
+        reset_pool()
+        return [render_chart(s) for s in specs]
+
+def merge_pdf(charts: List[RenderedChart]) -> BinaryIO:
+    """Concatenate the single-page PDFs into a spooled temp file (rolls over to disk when large)."""
+    writer = PdfWriter()
+    for c in charts:
+        writer.append(PdfReader(io.BytesIO(c.pdf)))
+    out = new_spool()
+    writer.write(out)
+    out.seek(0)
+    return out
@@ -0,0 +1,216 @@
+from __future__ import annotations
+import re
+import warnings
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+# Non-null values, spread over the column, looked at to infer its format
+SAMPLE_SIZE = 500
+
+# Tried for every date column in addition to what pandas guesses from the sampled values
+DATE_FORMATS = [
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y/%m/%d",
+    "%d/%m/%Y", "%m/%d/%Y", "%d-%m-%Y", "%m-%d-%Y", "%d.%m.%Y", "%d/%m/%y", "%m/%d/%y",
+    "%d/%m/%Y %H:%M", "%m/%d/%Y %H:%M", "%d/%m/%Y %H:%M:%S", "%m/%d/%Y %H:%M:%S",
+    "%d %b %Y", "%d-%b-%Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y",
+]
+
+# Currency symbol or code in front of or after the digits, e.g. "₦1,200", "NGN 1,200", "1.200 €"
+PREFIX = re.compile(r"^[-+(]?\s*([^\d\s.,()+-]+)")
+SUFFIX = re.compile(r"([^\d\s.,()+-]+)\s*\)?$")
+
+@dataclass(frozen=True)
+class NumberFormat:
+    thousands: Optional[str] = None
+    decimal: str = "."
+    currency: Optional[str] = None
+    kind: str = "number"
+
+@dataclass(frozen=True)
+class DateFormat:
+    format: Optional[str]       # None: parse each value on its own ("mixed")
+    dayfirst: bool = False
+    kind: str = "date"
+
+ColumnFormat = Union[NumberFormat, DateFormat]
+
+def _sample(values: pd.Series) -> pd.Series:
+    """Up to SAMPLE_SIZE values spread over the column (the first rows are often all the same day)."""
+    present = values.dropna()
+    if len(present) > SAMPLE_SIZE:
+        present = present.iloc[np.unique(np.linspace(0, len(present) - 1, SAMPLE_SIZE).astype(int))]
+    return present.astype(str).str.strip()
+
+def _is_text(values: pd.Series) -> np.ndarray:
+    """Mask of the string cells (workbook columns can mix numbers, datetimes and text)."""
+    if pd.api.types.is_string_dtype(values.dtype) and values.dtype != object:
+        return values.notna().to_numpy()
+    return values.map(lambda v: isinstance(v, str), na_action="ignore").fillna(False).to_numpy(dtype=bool)
+
+def infer_number_format(values: pd.Series) -> Optional[NumberFormat]:
+    """Currency, thousands and decimal separators used by the text values of a column (None without any)."""
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return None
+    sample = _sample(values[_is_text(values)])
+    sample = sample[sample.str.contains(r"\d")]  # "N/A", "-" and the like say nothing about the format
+    if not len(sample):
+        return None
+    currencies = Counter(m.group(1) for v in sample for m in (PREFIX.search(v), SUFFIX.search(v)) if m)
+    currency = currencies.most_common(1)[0][0] if currencies else None
+    votes = Counter()
+    for v in sample:
+        digits = re.sub(r"[^\d.,]", "", v)
+        seps = [c for c in digits if c in ".,"]
+        if not seps:
+            continue
+        last = seps[-1]
+        if len(set(seps)) == 2:
+            votes[f"decimal{last}"] += 1                    # "1.200,50": the last separator is the decimal one
+        elif len(seps) > 1:
+            votes[f"thousands{last}"] += 1                  # "1,200,000"
+        elif len(digits) - digits.rindex(last) - 1 == 3:
+            votes[f"grouped{last}"] += 1                    # "1,200" or "1.200": most likely thousands
+        else:
+            votes[f"decimal{last}"] += 1                    # "1,5" or "12.50"
+    if votes["decimal,"] + votes["thousands."] + votes["grouped."] > votes["decimal."] + votes["thousands,"] + votes["grouped,"]:
+        return NumberFormat(thousands=".", decimal=",", currency=currency)
+    return NumberFormat(thousands=",", decimal=".", currency=currency)
+
+def parse_numbers(values: pd.Series, fmt: NumberFormat) -> pd.Series:
+    """Column as float64; text is parsed with `fmt`, numeric cells are taken as they are."""
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        return values.astype("float64")
+    text = _is_text(values)
+    out = pd.to_numeric(values.mask(text), errors="coerce").astype("float64")
+    if not text.any():
+        return out
+    t = values[text].astype(str)
+    if fmt.decimal == ".":
+        # Plain numbers mean the same in this format; only the rest need cleaning up
+        parsed = pd.to_numeric(t, errors="coerce").astype("float64")
+        rest = parsed.isna().to_numpy()
+    else:
+        parsed = pd.Series(np.nan, index=t.index)
+        rest = np.ones(len(t), dtype=bool)
+    if rest.any():
+        r = t[rest].str.strip()
+        negative = r.str.startswith("(") & r.str.endswith(")")  # accounting style
+        if fmt.currency:
+            r = r.str.replace(fmt.currency, "", regex=False)
+        r = r.str.replace(r"[\s()]", "", regex=True)
+        if fmt.thousands:
+            r = r.str.replace(fmt.thousands, "", regex=False)
+        if fmt.decimal != ".":
+            r = r.str.replace(fmt.decimal, ".", regex=False)
+        cleaned = pd.to_numeric(r, errors="coerce").astype("float64")
+        parsed[rest] = cleaned.where(~negative, -cleaned).to_numpy()
+    out[text] = parsed.to_numpy()
+    return out
+
+def infer_date_format(values: pd.Series) -> Optional[DateFormat]:
+    """The format that parses most of the sampled text values (month-first wins ties, as in pandas).
+
+    None when the column has no text to infer it from.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values.dtype) or pd.api.types.is_numeric_dtype(values.dtype):
+        return None
+    sample = _sample(values[_is_text(values)])
+    if not len(sample):
+        return None
+    candidates: List[str] = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # "Parsing dates in %d/%m/%Y format when dayfirst=False"
+        for v in sample.iloc[:20]:
+            for dayfirst in (False, True):
+                guess = guess_datetime_format(v, dayfirst=dayfirst)
+                if guess and guess not in candidates:
+                    candidates.append(guess)
+    candidates += [f for f in DATE_FORMATS if f not in candidates]
+    best, hits = None, 0
+    for fmt in candidates:
+        n = int(pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum())
+        if n > hits:
+            best, hits = fmt, n
+    if best is None:
+        return DateFormat(None)
+    day, month = best.find("%d"), best.find("%m")
+    return DateFormat(best, dayfirst=0 <= day < month if month >= 0 else False)
+
+def parse_dates(values: pd.Series, fmt: DateFormat) -> pd.Series:
+    """Column as datetime64; text is parsed with `fmt` in one vectorized pass.
+
+    Text values the format rejects (a few rows typed differently) are tried
+    as ISO 8601 and then parsed one by one; values that are not dates at all
+    become NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values
+    text = _is_text(values)
+    if not text.any():
+        return pd.to_datetime(values, errors="coerce")
+    strings = values[text].astype(str).str.strip()
+    if fmt.format is not None:
+        parsed = pd.to_datetime(strings, format=fmt.format, errors="coerce")
+        for fallback in ("ISO8601", "mixed"):
+            rest = parsed.isna()
+            if not rest.any():
+                break
+            parsed[rest] = pd.to_datetime(strings[rest], format=fallback, dayfirst=fmt.dayfirst, errors="coerce")
+    else:
+        parsed = pd.to_datetime(strings, format="mixed", dayfirst=fmt.dayfirst, errors="coerce")
+    if text.all():
+        return parsed
+    out = pd.to_datetime(values.mask(text), errors="coerce")
+    if out.dtype != parsed.dtype:
+        out = out.astype(parsed.dtype)
+    out[text] = parsed.to_numpy()
+    return out
+
+def format_to_json(fmt: ColumnFormat) -> Dict[str, Any]:
+    return asdict(fmt)
+
+def format_from_json(d: Dict[str, Any]) -> ColumnFormat:
+    return DateFormat(**d) if d.get("kind") == "date" else NumberFormat(**d)
+
+class Coercer:
+    """Typed views of a frame's raw columns, each parsed at most once.
+
+    A column's format is inferred from a sample the first time it is
+    coerced and then remembered, so reusing one Coercer for successive
+    chunks (or refreshes, via `formats`) parses all of them the same way.
+    """
+
+    def __init__(self, formats: Optional[Dict[str, ColumnFormat]] = None):
+        self.formats: Dict[str, ColumnFormat] = dict(formats or {})
+        self._df: Optional[pd.DataFrame] = None
+        self._parsed: Dict[str, pd.Series] = {}
+
+    def bind(self, df: pd.DataFrame) -> Coercer:
+        """Coerce columns of `df` from now on; parsed columns of the previous frame are dropped."""
+        self._df = df
+        self._parsed = {}
+        return self
+
+    def _format(self, col: str, kind: type, infer: Callable[[pd.Series], Optional[ColumnFormat]]) -> ColumnFormat:
+        fmt = self.formats.get(col)
+        if not isinstance(fmt, kind):
+            fmt = infer(self._df[col])
+            if fmt is None:
+                return kind(None)  # nothing to infer from in this frame; a later chunk may have text
+            self.formats[col] = fmt
+        return fmt
+
+    def numbers(self, col: str) -> pd.Series:
+        if col not in self._parsed:
+            self._parsed[col] = parse_numbers(self._df[col], self._format(col, NumberFormat, infer_number_format))
+        return self._parsed[col]
+
+    def dates(self, col: str) -> pd.Series:
+        if col not in self._parsed:
+            self._parsed[col] = parse_dates(self._df[col], self._format(col, DateFormat, infer_date_format))
+        return self._parsed[col]
@@ -1,169 +1,422 @@
 from __future__ import annotations
-import io
-import json
-from typing import Dict, Any, List, Tuple
+import logging
+import os
+import time
+from contextlib import nullcontext
+from typing import BinaryIO, Dict, Any, List, Literal, Optional, Tuple
 
 import numpy as np
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
-
-from .schema_detect import detect_schema
-
-PALETTE = ["#4e79a7","#f28e2b","#e15759","#76b7b2","#59a14f","#edc949","#af7aa1","#ff9da7","#9c755f","#bab0ab"]
-sns.set_theme(style="whitegrid")
-
-def read_first_nonempty_sheet(content: bytes) -> pd.DataFrame:
-    xls = pd.ExcelFile(io.BytesIO(content))
-    for sh in xls.sheet_names:
-        df = pd.read_excel(io.BytesIO(content), sheet_name=sh)
-        if len(df) > 0:
-            return df
-    raise ValueError("No non-empty sheets found")
-
-def coerce_dates(df: pd.DataFrame, col: str) -> pd.Series:
-    s = pd.to_datetime(df[col], errors="coerce")
-    if s.isna().all():
-        s = pd.to_datetime(df[col], dayfirst=True, errors="coerce")
-    return s
-
-def eda_from_bytes(content: bytes) -> Tuple[Dict[str, Any], List[Tuple[str, bytes]], bytes]:
-    """Return (metrics_json, [(image_name, image_bytes)], pdf_bytes)."""
-    df = read_first_nonempty_sheet(content)
+
+from .aggregate import AggregateMerger, AggregationPlan, Aggregates, DensityGrid, month_keys, reservoir
+from .coercion import Coercer
+from .reader import Source, TableReader, write_snapshot
+from .schema_detect import CATEGORICAL, detect_schema, used_columns
+from .sketches import Sketches
+from .specs import ChartSpec, chart_series
+
+# "data": chart series only (matplotlib is never imported), "images": chart images + PDF, "both": all of it
+RenderMode = Literal["data", "images", "both"]
+
+# Bump whenever eda_from_bytes output changes; it is part of the result cache key
+EDA_VERSION = "12"
+
+# Bump whenever the snapshotted frame changes (projection, dtypes, coercion); it is part of the snapshot key
+SNAPSHOT_VERSION = "2"
+
+# Numeric columns add_helper_columns derives; they are stored in snapshots
+HELPER_COLUMNS = ["_qty", "_unit_price", "_sales", "_profit", "_discount"]
+
+# Cells of the price/quantity density grid (at most, x by y)
+DENSITY_BINS = (30, 20)
+# Approximate mode bins a uniform sample of this many rows instead of every row
+BUBBLE_POINTS = 5000
+
+# Bars per mix chart; smaller groups are summed into one "Other" bar
+MIX_BARS = 15
+
+# CSV uploads larger than EDA_STREAM_MB are read EDA_CHUNK_ROWS rows at a time and reduced chunk by chunk,
+# so peak memory follows the chunk size and the number of groups instead of the file size.
+# Keep it below MAX_UPLOAD_MB, or no accepted upload is ever streamed.
+STREAM_BYTES = int(os.environ.get("EDA_STREAM_MB", "64")) * 1024 * 1024
+CHUNK_ROWS = int(os.environ.get("EDA_CHUNK_ROWS", "200000"))
+
+# Approximate mode: labels tracked by the top-k sketches and t-digest compression for order values
+APPROX_TOP_K = int(os.environ.get("EDA_APPROX_TOP_K", "1000"))
+APPROX_COMPRESSION = float(os.environ.get("EDA_APPROX_COMPRESSION", "200"))
+
+# Bins of the order value histogram
+ORDER_BINS = 30
+
+def _span(trace, name: str):
+    """trace.span(name) when a metrics.Trace was passed in, else a no-op."""
+    return trace.span(name) if trace is not None else nullcontext()
+
+def projection(reader: TableReader, header: List[str], schema: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    """reader.load/chunks arguments that parse only the mapped columns, categoricals dictionary-encoded."""
+    raw = dict(zip(header, reader.columns))
+    return {"usecols": [raw[c] for c in used_columns(schema)] or None,
+            "categorical": [raw[schema[k]] for k in CATEGORICAL if schema.get(k)]}
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
     df.columns = [str(c).strip() for c in df.columns]
-    schema = detect_schema(df)
+    for c in df.select_dtypes("integer").columns:
+        df[c] = pd.to_numeric(df[c], downcast="integer")
+    for c in df.select_dtypes("float64").columns:
+        # Only when float32 holds every value exactly, e.g. whole numbers read as floats because of
+        # blank cells; rounding money to float32 would move totals by more than a cent
+        small = df[c].astype("float32")
+        if np.array_equal(small.to_numpy(), df[c].to_numpy(), equal_nan=True):
+            df[c] = small
+    return df
+
+def read_schema(reader: TableReader, trace=None) -> Tuple[List[str], Dict[str, Optional[str]]]:
+    if reader.snapshot is not None:
+        return reader.snapshot["header"], reader.snapshot["schema"]
+    with _span(trace, "read_header"):
+        header = [str(c).strip() for c in reader.columns]
+    with _span(trace, "schema"):
+        schema = detect_schema(header)
+    return header, schema
+
+def load_projected(source: Source, trace=None, skip_rows: int = 0) -> Tuple[pd.DataFrame, Dict[str, Optional[str]], List[str]]:
+    """Read the header, detect the schema, then parse only the mapped columns with compact dtypes.
+
+    `skip_rows` leaves out that many leading data rows (used by incremental refreshes).
+    """
+    with TableReader(source) as reader:
+        header, schema = read_schema(reader, trace)
+        with _span(trace, "read"):
+            df = reader.load(**projection(reader, header, schema), skip_rows=skip_rows)
+    return compact(df), schema, header
+
+def warmup() -> None:
+    """Import and exercise the chart stack (matplotlib, Pillow, pypdf) ahead of traffic."""
+    from .charts import warmup as warm_charts
+    warm_charts()
+
+def add_helper_columns(df: pd.DataFrame, schema: Dict[str, Optional[str]], coercer: Optional[Coercer] = None) -> Coercer:
+    """Coerce dates in place and add the numeric _qty/_unit_price/_sales/_profit/_discount columns.
+
+    Each source column is parsed once, in the format `coercer` inferred for it
+    (a new Coercer infers them from this frame). Returns the coercer so later
+    chunks or refreshes can reuse its formats.
+    """
+    c = (coercer or Coercer()).bind(df)
+    missing = pd.Series(np.nan, index=df.index)
+    def num(key: str) -> pd.Series:
+        return c.numbers(schema[key]) if schema.get(key) else missing
 
-    # Compute helper columns
     if schema.get('date'):
-        df[schema['date']] = coerce_dates(df, schema['date'])
+        df[schema['date']] = c.dates(schema['date'])
+    df["_qty"] = num('qty')
     if not schema.get('price') and schema.get('sales') and schema.get('qty'):
-        df["_unit_price"] = pd.to_numeric(df[schema['sales']], errors='coerce') / pd.to_numeric(df[schema['qty']], errors='coerce').replace(0, np.nan)
+        df["_unit_price"] = num('sales') / num('qty').replace(0, np.nan)
     else:
-        df["_unit_price"] = pd.to_numeric(df.get(schema.get('price'), pd.Series([np.nan]*len(df))), errors='coerce')
+        df["_unit_price"] = num('price')
 
     if not schema.get('sales') and schema.get('price') and schema.get('qty'):
-        df["_sales"] = pd.to_numeric(df[schema['price']], errors='coerce') * pd.to_numeric(df[schema['qty']], errors='coerce')
+        df["_sales"] = num('price') * num('qty')
     else:
-        df["_sales"] = pd.to_numeric(df.get(schema.get('sales'), pd.Series([np.nan]*len(df))), errors='coerce')
+        df["_sales"] = num('sales')
 
-    if schema.get('profit'):
-        df["_profit"] = pd.to_numeric(df[schema['profit']], errors='coerce')
-    else:
-        df["_profit"] = np.nan
+    df["_profit"] = num('profit')
+    df["_discount"] = num('discount')
+    return c
 
-    if schema.get('discount'):
-        df["_discount"] = pd.to_numeric(df[schema['discount']], errors='coerce')
-    else:
-        df["_discount"] = np.nan
+def aggregate(df: pd.DataFrame, schema: Dict[str, Optional[str]]) -> Tuple[Aggregates, Optional[str]]:
+    """Factorize every dimension once and reduce sales/profit for all of them in one pass.
 
-    # KPIs
-    kpi = {"rows": int(len(df)), "columns": int(len(df.columns))}
-    if "_sales" in df:
-        kpi["total_sales"] = float(np.nansum(df["_sales"].values))
-        if schema.get('order_id') and schema['order_id'] in df:
-            aov = df.groupby(schema['order_id'])["_sales"].sum().mean()
+    Returns the aggregates and the column used as the category dimension.
+    """
+    cat_dim = next((c for c in [schema.get('category'), schema.get('subcat'), schema.get('product')] if c and c in df), None)
+    def present(key: str):
+        return df[schema[key]] if schema.get(key) and schema[key] in df else None
+    plan = AggregationPlan({
+        "month": month_keys(df[schema['date']]) if schema.get('date') else None,
+        "category": df[cat_dim] if cat_dim else None,
+        "region": present('region'),
+        "customer": present('customer'),
+        "order": present('order_id'),
+    })
+    return plan.run(df["_sales"], df["_profit"]), cat_dim
+
+def bubble_points(df: pd.DataFrame, schema: Dict[str, Optional[str]]) -> Optional[pd.DataFrame]:
+    """Rows eligible for the price/quantity chart as (qty, price, sales)."""
+    if not schema.get('qty'):
+        return None
+    points = df[["_qty", "_unit_price", "_sales"]].replace([np.inf,-np.inf], np.nan).dropna()
+    points.columns = ["qty", "price", "sales"]
+    return points
+
+def fit_density(points: Optional[pd.DataFrame]) -> Optional[DensityGrid]:
+    """Price/quantity grid with edges fitted to `points`, holding all of them (None without points)."""
+    if points is None or not len(points):
+        return None
+    grid = DensityGrid.fit(points["price"].to_numpy(dtype="float64"), points["qty"].to_numpy(dtype="float64"), DENSITY_BINS)
+    add_density(grid, points)
+    return grid
+
+def add_density(grid: Optional[DensityGrid], points: Optional[pd.DataFrame]) -> Optional[DensityGrid]:
+    """`grid` with `points` added; a grid is fitted to them when there is none yet."""
+    if grid is None:
+        return fit_density(points)
+    if points is not None and len(points):
+        grid.add(points["price"].to_numpy(dtype="float64"), points["qty"].to_numpy(dtype="float64"),
+                 points["sales"].to_numpy(dtype="float64"))
+    return grid
+
+def sketch_chunk(sketches: Sketches, part: Aggregates, df: pd.DataFrame, schema: Dict[str, Optional[str]]) -> None:
+    """Move the per-label reductions of one chunk out of `part` and into the sketches."""
+    for dim, sketch in (("customer", sketches.customer), ("category", sketches.category)):
+        r = part.by.pop(dim, None)
+        if sketch is not None and r is not None:
+            sketch.update(r.labels, r.sales)
+    part.by.pop("order", None)
+    if sketches.orders is not None:
+        sales = df["_sales"].to_numpy(dtype="float64", na_value=np.nan)
+        sketches.orders.update(sketches.order_runs.update(df[schema['order_id']], np.nan_to_num(sales)))
+        sketches.order_ids.update(df[schema['order_id']])
+
+def aggregate_chunks(reader: TableReader, header: List[str], schema: Dict[str, Optional[str]], trace=None,
+                     chunk_rows: Optional[int] = None, sketches: Optional[Sketches] = None
+                     ) -> Tuple[Aggregates, Optional[str], Optional[DensityGrid]]:
+    """Stream the table in chunks, reducing each to partial aggregates and the price/quantity grid.
+
+    Matches aggregate + fit_density on the whole table, except that the grid
+    edges are fitted to the first chunk with price/quantity values (values
+    outside them land in the outermost cells).
+
+    With `sketches` (approximate mode) customers, categories and orders are
+    fed into them instead of being kept per label, and the grid is binned
+    from a uniform reservoir of BUBBLE_POINTS rows, so the state stays fixed-size.
+    """
+    merger = AggregateMerger()
+    coercer = Coercer()  # formats inferred from the first chunk apply to all of them
+    cat_dim, density, sample, seen, chunk_count = None, None, None, 0, 0
+    seconds = dict.fromkeys(("read", "coercion", "aggregation"), 0.0)
+    started = time.perf_counter()
+    chunks = reader.chunks(chunk_rows or CHUNK_ROWS, **projection(reader, header, schema))
+    while True:
+        t0 = time.perf_counter()
+        df = next(chunks, None)
+        t1 = time.perf_counter()
+        seconds["read"] += t1 - t0
+        if df is None:
+            break
+        chunk_count += 1
+        df = compact(df)
+        add_helper_columns(df, schema, coercer)
+        t2 = time.perf_counter()
+        part, cat_dim = aggregate(df, schema)
+        if sketches is not None:
+            sketch_chunk(sketches, part, df, schema)
+        merger.add(part)
+        if sketches is not None:
+            sample, seen = reservoir(sample, seen, bubble_points(df, schema), BUBBLE_POINTS)
         else:
-            aov = df["_sales"].mean()
-        kpi["average_order_value"] = float(aov)
-    if "_profit" in df and not pd.isna(df["_profit"]).all():
-        kpi["total_profit"] = float(np.nansum(df["_profit"].values))
+            density = add_density(density, bubble_points(df, schema))
+        seconds["coercion"] += t2 - t1
+        seconds["aggregation"] += time.perf_counter() - t2
+    agg = merger.result()
+    if agg is None or agg.rows == 0:
+        raise ValueError("No data rows found")
+    if sketches is not None:
+        sketches.points_seen = seen
+        density = fit_density(sample)
+        if sketches.orders is not None:
+            sketches.orders.update(sketches.order_runs.finish())
+    if trace is not None:
+        for name, secs in seconds.items():
+            trace.record(name, secs, start=started, chunks=chunk_count)
+    return agg, cat_dim, density
+
+def build_specs(schema: Dict[str, Optional[str]], header: List[str], agg: Aggregates, cat_dim: Optional[str],
+                density: Optional[DensityGrid], sketches: Optional[Sketches] = None) -> Tuple[Dict[str, Any], List[ChartSpec]]:
+    """KPIs and chart specs from the aggregates and the price/quantity grid.
+
+    In approximate mode customer/category rankings and order values come from `sketches`.
+    """
+    # KPIs
+    kpi = {"rows": agg.rows, "columns": len(header)}
+    kpi["total_sales"] = agg.total_sales
+    orders = agg.get("order")
+    order_digest = sketches.orders if sketches is not None and sketches.orders is not None and sketches.orders.n else None
+    if order_digest is not None:
+        aov = order_digest.sum / max(sketches.order_count(), 1.0)
+    else:
+        aov = orders.sales.mean() if orders is not None else (agg.total_sales / agg.sales_rows if agg.sales_rows else np.nan)
+    kpi["average_order_value"] = float(aov)
+    if agg.profit_rows:
+        kpi["total_profit"] = agg.total_profit
         if kpi.get("total_sales"):
             kpi["profit_margin"] = float(kpi["total_profit"]/kpi["total_sales"]) if kpi["total_sales"] else None
 
-    # Aggregations
-    images: List[Tuple[str, bytes]] = []
-    pdf_buf = io.BytesIO()
-    pp = PdfPages(pdf_buf)
-
-    def save_current_fig(name: str, title: str):
-        plt.suptitle(title, fontsize=14, fontweight="bold")
-        plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-        img = io.BytesIO()
-        plt.savefig(img, format='png', dpi=180, bbox_inches='tight')
-        img.seek(0)
-        images.append((name, img.getvalue()))
-        pp.savefig(plt.gcf())
-        plt.close()
+    # Aggregations -> chart specs (rendered below in a process pool)
+    specs: List[ChartSpec] = []
 
     # A) Monthly sales/profit
-    if schema.get('date') and "_sales" in df:
-        ts = df.dropna(subset=[schema['date']]).copy()
-        ts['month'] = ts[schema['date']].dt.to_period('M').dt.to_timestamp()
-        monthly = ts.groupby('month').agg(sales=("_sales","sum"), profit=("_profit","sum")).reset_index()
+    monthly = agg.get("month")
+    if monthly is not None:
         kpi["months"] = len(monthly)
-        plt.figure(figsize=(10,5))
-        sns.lineplot(data=monthly, x='month', y='sales', marker='o')
-        plt.title('Monthly Sales Trend')
-        plt.xlabel('Month'); plt.ylabel('Sales')
-        save_current_fig('trend_sales.png', 'Trend: Sales Over Time')
-        if not monthly['profit'].isna().all():
-            plt.figure(figsize=(10,5))
-            sns.lineplot(data=monthly, x='month', y='profit', marker='o')
-            plt.title('Monthly Profit Trend')
-            plt.xlabel('Month'); plt.ylabel('Profit')
-            save_current_fig('trend_profit.png', 'Trend: Profit Over Time')
+        specs.append(ChartSpec('trend_sales.png', 'Trend: Sales Over Time', 'line',
+                               {"x": monthly.labels, "y": monthly.sales},
+                               {"title": 'Monthly Sales Trend', "xlabel": 'Month', "ylabel": 'Sales'}, figsize=(10,5)))
+        if agg.profit_rows:
+            specs.append(ChartSpec('trend_profit.png', 'Trend: Profit Over Time', 'line',
+                                   {"x": monthly.labels, "y": monthly.profit},
+                                   {"title": 'Monthly Profit Trend', "xlabel": 'Month', "ylabel": 'Profit'}, figsize=(10,5)))
 
     # B) Best available categorical dimension for mix
-    cat_dim = next((c for c in [schema.get('category'), schema.get('subcat'), schema.get('product')] if c and c in df), None)
-    if cat_dim and "_sales" in df:
-        top = df.groupby(cat_dim)["_sales"].sum().sort_values(ascending=False).head(15)
-        plt.figure(figsize=(10,6))
-        sns.barplot(x=top.index, y=top.values)
-        plt.xticks(rotation=35, ha='right'); plt.ylabel('Sales')
-        plt.title(f'Top {min(15, len(top))} by Sales – {cat_dim}')
-        save_current_fig('mix_category.png', 'Category Contribution to Sales')
+    categories = sketches.category if sketches is not None else None
+    category = categories.reduction() if categories is not None else agg.get("category")
+    if category is not None and len(category):
+        top = category.top_other(MIX_BARS, total=categories.total if categories is not None else None)
+        specs.append(ChartSpec('mix_category.png', 'Category Contribution to Sales', 'bar',
+                               {"labels": [str(i) for i in top.labels], "values": top.sales},
+                               {"title": f'Top {min(MIX_BARS, len(category))} by Sales – {cat_dim}', "ylabel": 'Sales'}))
 
     # C) Region/Geo mix
-    if schema.get('region') and "_sales" in df and schema['region'] in df:
-        geo = df.groupby(schema['region'])["_sales"].sum().sort_values(ascending=False)
-        plt.figure(figsize=(10,6))
-        sns.barplot(x=geo.index, y=geo.values)
-        plt.xticks(rotation=35, ha='right'); plt.ylabel('Sales'); plt.title('Sales by Region')
-        save_current_fig('mix_region.png', 'Geographic Sales Mix')
+    if agg.get("region") is not None:
+        geo = agg.by["region"].top_other(MIX_BARS)
+        specs.append(ChartSpec('mix_region.png', 'Geographic Sales Mix', 'bar',
+                               {"labels": [str(i) for i in geo.labels], "values": geo.sales},
+                               {"title": 'Sales by Region', "ylabel": 'Sales'}))
 
     # D) Order value distribution
-    if schema.get('order_id') and "_sales" in df and schema['order_id'] in df:
-        order_sales = df.groupby(schema['order_id'])["_sales"].sum()
-        plt.figure(figsize=(9,5))
-        plt.hist(order_sales.dropna(), bins=30)
-        plt.title('Distribution of Order Values'); plt.xlabel('Order Value'); plt.ylabel('Frequency')
-        save_current_fig('hist_order_values.png', 'Order Value Distribution')
+    if order_digest is not None:
+        counts, edges, _ = order_digest.histogram(ORDER_BINS)
+    elif orders is not None:
+        counts, edges = np.histogram(orders.sales, bins=ORDER_BINS)
+    if order_digest is not None or orders is not None:
+        specs.append(ChartSpec('hist_order_values.png', 'Order Value Distribution', 'hist',
+                               {"counts": counts, "edges": edges},
+                               {"title": 'Distribution of Order Values', "xlabel": 'Order Value', "ylabel": 'Frequency'}, figsize=(9,5)))
 
     # E) Customer Pareto
-    if schema.get('customer') and "_sales" in df and schema['customer'] in df:
-        cust_sales = df.groupby(schema['customer'])["_sales"].sum().sort_values(ascending=False)
-        cum = cust_sales.cumsum() / cust_sales.sum()
-        plt.figure(figsize=(10,6))
-        ax1 = plt.gca()
-        sns.barplot(x=cust_sales.head(20).index, y=cust_sales.head(20).values, ax=ax1)
-        ax1.set_xlabel('Top Customers'); ax1.set_ylabel('Sales');
-        ax1.tick_params(axis='x', rotation=35)
-        ax2 = ax1.twinx(); ax2.plot(range(len(cust_sales.head(20))), cum.head(20).values, marker='o')
-        ax2.set_ylabel('Cumulative Share')
-        plt.title('Top Customers & Cumulative Share')
-        save_current_fig('pareto_customers.png', 'Customer Concentration (Pareto)')
-
-    # F) Price vs Quantity bubble
-    if schema.get('qty') and "_unit_price" in df and "_sales" in df:
-        sample = df[[schema['qty'], "_unit_price", "_sales"]].replace([np.inf,-np.inf], np.nan).dropna().copy()
-        if len(sample) > 5000:
-            sample = sample.sample(5000, random_state=42)
-        denom = sample["_sales"].max() or 1.0
-        sizes = (sample["_sales"] / denom) * 400 + 10
-        plt.figure(figsize=(9,6))
-        plt.scatter(sample["_unit_price"], sample[schema['qty']], s=sizes, alpha=0.6)
-        plt.title('Unit Price vs Quantity (bubble = Sales)'); plt.xlabel('Unit Price'); plt.ylabel('Quantity')
-        save_current_fig('bubble_price_qty.png', 'Price-Quantity Dynamics')
-
-    # Close PDF
-    pp.close()
-    pdf_buf.seek(0)
+    customers = sketches.customer if sketches is not None else None
+    cust = customers.reduction() if customers is not None else agg.get("customer")
+    if cust is not None and len(cust):
+        total = customers.total if customers is not None else cust.sales.sum()
+        cust = cust.top()
+        cum = np.cumsum(cust.sales[:20])
+        cum = cum / total if total else np.zeros_like(cum)  # all-zero sales: no share to accumulate
+        top20 = cust.take(np.arange(min(20, len(cust))))
+        specs.append(ChartSpec('pareto_customers.png', 'Customer Concentration (Pareto)', 'pareto',
+                               {"labels": [str(i) for i in top20.labels], "values": top20.sales, "cumulative": cum},
+                               {"title": 'Top Customers & Cumulative Share', "xlabel": 'Top Customers', "ylabel": 'Sales'}))
+
+    # F) Price vs Quantity density; a fixed-size grid, so drawing cost does not grow with rows
+    if density is not None:
+        rows, sales = density.shares()
+        specs.append(ChartSpec('bubble_price_qty.png', 'Price-Quantity Dynamics', 'density',
+                               {"x_edges": density.x_edges, "y_edges": density.y_edges, "rows": rows, "sales": sales},
+                               {"title": 'Unit Price vs Quantity (color = share of rows)', "xlabel": 'Unit Price', "ylabel": 'Quantity'}, figsize=(9,6)))
+
+    return kpi, specs
+
+def combine_kpis(kpis: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Cross-report summary of build_specs KPIs, keyed by report.
+
+    Totals are summed; the profit margin is recomputed over the reports that
+    have profit. Average order values cannot be combined without order counts
+    and are left per report.
+    """
+    def value(k: Dict[str, Any], key: str) -> float:
+        v = k.get(key)
+        return float(v) if v is not None and np.isfinite(v) else 0.0
+    sales = {r: value(k, "total_sales") for r, k in kpis.items()}
+    total_sales = sum(sales.values())
+    out: Dict[str, Any] = {
+        "reports": len(kpis),
+        "rows": sum(int(k.get("rows") or 0) for k in kpis.values()),
+        "total_sales": total_sales,
+    }
+    with_profit = [r for r, k in kpis.items() if "total_profit" in k]
+    if with_profit:
+        out["total_profit"] = sum(value(kpis[r], "total_profit") for r in with_profit)
+        profit_sales = sum(sales[r] for r in with_profit)
+        out["profit_margin"] = out["total_profit"] / profit_sales if profit_sales else None
+    ranked = sorted(sales, key=sales.get, reverse=True)
+    out["by_report"] = [{"reportId": r, "total_sales": sales[r], "share": sales[r] / total_sales if total_sales else None,
+                         "profit_margin": kpis[r].get("profit_margin"),
+                         "average_order_value": kpis[r].get("average_order_value")} for r in ranked]
+    return out
+
+def eda_from_bytes(source: Source, render: RenderMode = "images", trace=None, approximate: bool = False,
+                   snapshot: Optional[BinaryIO] = None) -> Tuple[Dict[str, Any], List[Tuple[str, bytes]], Optional[BinaryIO]]:
+    """Return (metrics_json, [(image_name, image_bytes)], pdf_file).
+
+    `source` may be bytes, a file path or a seekable binary file object.
+    In "data" mode no images or PDF are produced and pdf_file is None.
+    Stage timings are recorded on `trace` (a metrics.Trace) when given.
+    `approximate` reads the table in one chunked pass with fixed-size sketches for
+    the customer/category rankings and order values; their error bounds go to
+    chart_data["approximate"].
+
+    `source` may also be an Arrow snapshot, read without parsing or coercion.
+    Otherwise, when the table is loaded in memory, the coerced columns are
+    written to `snapshot` (see write_snapshot) for later runs.
+    """
+    df = None
+    sketches = None
+    coerced = False
+    with TableReader(source) as reader:
+        header, schema = read_schema(reader, trace)
+        if reader.kind == "arrow":
+            with _span(trace, "read"):
+                used = used_columns(schema)
+                df = reader.load(usecols=used + HELPER_COLUMNS if used else None)
+            coerced = True
+        elif approximate:
+            sketches = Sketches.for_schema(schema, APPROX_TOP_K, APPROX_COMPRESSION)
+            agg, cat_dim, density = aggregate_chunks(reader, header, schema, trace, sketches=sketches)
+        elif reader.kind == "csv" and reader.nbytes > STREAM_BYTES:
+            agg, cat_dim, density = aggregate_chunks(reader, header, schema, trace)
+        else:
+            with _span(trace, "read"):
+                df = compact(reader.load(**projection(reader, header, schema)))
+    if df is not None:
+        if not coerced:
+            with _span(trace, "coercion"):
+                add_helper_columns(df, schema)
+            if snapshot is not None:
+                with _span(trace, "snapshot_write"):
+                    try:
+                        write_snapshot(df, snapshot, {"version": SNAPSHOT_VERSION, "header": header, "schema": schema})
+                    except Exception as e:
+                        # e.g. a column mixing numbers and text that Arrow cannot type; the analysis
+                        # does not need the snapshot, so drop what was written and go on without it
+                        logging.warning(f"Skipping dataset snapshot: {e}")
+                        snapshot.seek(0)
+                        snapshot.truncate()
+        with _span(trace, "aggregation"):
+            agg, cat_dim = aggregate(df, schema)
+            density = fit_density(bubble_points(df, schema))
+        del df  # only the aggregates are needed from here on
+    with _span(trace, "specs"):
+        kpi, specs = build_specs(schema, header, agg, cat_dim, density, sketches)
 
     chart_data = {
         "kpi": kpi,
         "schema": schema,
-        "charts": [name for name, _ in images]
+        "charts": [s.name for s in specs],
     }
+    if sketches is not None:
+        chart_data["approximate"] = sketches.bounds(ORDER_BINS, BUBBLE_POINTS)
+    if render in ("data", "both"):
+        chart_data["series"] = chart_series(specs)
+    if render == "data":
+        return chart_data, [], None
 
-    return chart_data, images, pdf_buf.getvalue()
\ No newline at end of file
+    # Imported here so data-only requests never load matplotlib
+    from .charts import merge_pdf, render_all
+    with _span(trace, "charts"):
+        rendered = render_all(specs)
+    if trace is not None:
+        for c in rendered:
+            trace.record(f"chart:{c.name}", c.seconds)
+    images: List[Tuple[str, bytes]] = [f for c in rendered for f in c.files]
+    with _span(trace, "pdf"):
+        pdf_file = merge_pdf(rendered)
+    return chart_data, images, pdf_file
@@ -0,0 +1,195 @@
+from __future__ import annotations
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .aggregate import Aggregates, DensityGrid, Reduction
+from .coercion import Coercer, ColumnFormat, format_from_json, format_to_json
+from .eda import (EDA_VERSION, RenderMode, _span, add_density, add_helper_columns, aggregate, bubble_points,
+                  build_specs, fit_density, load_projected)
+from .reader import Source
+from .specs import ChartSpec, chart_series, spec_fingerprint
+
+# Rows just below the high-water mark that must be unchanged for a refresh to count as an append.
+# Edits further up the sheet are not detected; a refresh without state rebuilds from scratch.
+TAIL_ROWS = 16
+
+def _cell(v: Any) -> str:
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)  # 5 and 5.0 depending on whether the slice had missing values
+    return "" if pd.isna(v) else str(v)
+
+def tail_hash(rows: pd.DataFrame) -> str:
+    """Hash of raw (pre-coercion) rows that does not depend on the dtypes pandas inferred for the slice."""
+    h = hashlib.sha256("\x1e".join(map(str, rows.columns)).encode())
+    for row in rows.itertuples(index=False):
+        h.update(("\x1e" + "\x1f".join(_cell(v) for v in row)).encode())
+    return h.hexdigest()
+
+def _plain(values: List[Any]) -> List[Any]:
+    return [v.item() if isinstance(v, np.generic) else v for v in values]
+
+def _labels_to_json(labels: np.ndarray) -> Dict[str, Any]:
+    if np.issubdtype(labels.dtype, np.datetime64):
+        return {"datetime": True, "values": [str(v) for v in labels.astype("datetime64[ns]")]}
+    return {"values": _plain(labels.tolist())}
+
+def _labels_from_json(d: Dict[str, Any]) -> np.ndarray:
+    if d.get("datetime"):
+        return np.array(d["values"], dtype="datetime64[ns]")
+    out = np.empty(len(d["values"]), dtype=object)
+    out[:] = d["values"]
+    return out
+
+def aggregates_to_json(agg: Aggregates) -> Dict[str, Any]:
+    return {
+        "by": {dim: {"labels": _labels_to_json(r.labels), "sales": r.sales.tolist(), "profit": r.profit.tolist(),
+                     "count": r.count.tolist()} for dim, r in agg.by.items()},
+        "rows": agg.rows, "total_sales": agg.total_sales, "total_profit": agg.total_profit,
+        "profit_rows": agg.profit_rows, "sales_rows": agg.sales_rows,
+    }
+
+def aggregates_from_json(d: Dict[str, Any]) -> Aggregates:
+    by = {dim: Reduction(_labels_from_json(r["labels"]), np.array(r["sales"], dtype="float64"),
+                         np.array(r["profit"], dtype="float64"), np.array(r["count"], dtype="int64"))
+          for dim, r in d["by"].items()}
+    return Aggregates(by, d["rows"], d["total_sales"], d["total_profit"], d["profit_rows"], d["sales_rows"])
+
+@dataclass
+class EdaState:
+    """Mergeable aggregate state of one report, persisted between refreshes."""
+    header: List[str]
+    schema: Dict[str, Optional[str]]
+    cat_dim: Optional[str]
+    agg: Aggregates
+    tail_hash: str                       # hash of the TAIL_ROWS rows ending at agg.rows (the high-water mark)
+    density: Optional[DensityGrid]       # price/quantity grid over every row; edges fixed at the full build
+    charts: Dict[str, str] = field(default_factory=dict)  # chart key -> fingerprint of the stored artifacts
+    formats: Dict[str, ColumnFormat] = field(default_factory=dict)  # column -> format appended rows are parsed with
+    version: str = EDA_VERSION
+
+    def to_bytes(self) -> bytes:
+        density = None
+        if self.density is not None:
+            density = {k: getattr(self.density, k).tolist() for k in ("x_edges", "y_edges", "rows", "sales")}
+        return json.dumps({
+            "version": self.version, "header": self.header, "schema": self.schema, "cat_dim": self.cat_dim,
+            "agg": aggregates_to_json(self.agg), "tail_hash": self.tail_hash,
+            "density": density, "charts": self.charts,
+            "formats": {c: format_to_json(f) for c, f in self.formats.items()},
+        }, default=str).encode()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> EdaState:
+        d = json.loads(data)
+        density = DensityGrid(**{k: np.array(v, dtype="float64") for k, v in d["density"].items()}) if d["density"] else None
+        return cls(d["header"], d["schema"], d["cat_dim"], aggregates_from_json(d["agg"]), d["tail_hash"],
+                   density, d["charts"], {c: format_from_json(f) for c, f in d.get("formats", {}).items()},
+                   d["version"])
+
+@dataclass
+class Refresh:
+    chart_data: Dict[str, Any]
+    specs: List[ChartSpec]
+    changed: List[str]                   # chart keys whose data differs from the stored artifacts
+    mode: str                            # "full" | "append" | "unchanged"
+    new_rows: int
+    state: EdaState
+    fingerprints: Dict[str, str]
+
+    def state_bytes(self, rendered: List[str]) -> bytes:
+        """Serialized state; only charts in `rendered` are marked as stored at their new fingerprint."""
+        charts = {k: v for k, v in self.state.charts.items() if k in self.fingerprints}
+        charts.update({k: self.fingerprints[k] for k in rendered})
+        self.state.charts = charts
+        return self.state.to_bytes()
+
+def _load_state(previous: Optional[bytes]) -> Optional[EdaState]:
+    if not previous:
+        return None
+    try:
+        state = EdaState.from_bytes(previous)
+    except (ValueError, KeyError, TypeError):
+        return None
+    return state if state.version == EDA_VERSION else None
+
+def _try_append(source: Source, state: EdaState, trace) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]]:
+    """(raw frame from just below the high-water mark, appended rows) if the sheet only grew."""
+    skip = max(state.agg.rows - TAIL_ROWS, 0)
+    try:
+        df, schema, header = load_projected(source, trace, skip_rows=skip)
+    except ValueError:
+        return None
+    tail = state.agg.rows - skip
+    if header != state.header or schema != state.schema or len(df) < tail or tail_hash(df.iloc[:tail]) != state.tail_hash:
+        return None
+    return df, df.iloc[tail:].copy()
+
+def refresh(source: Source, previous: Optional[bytes], render: RenderMode = "images", trace=None) -> Refresh:
+    """Update the stored aggregate state with rows appended since the last refresh.
+
+    When the previous high-water-mark rows are unchanged only the new rows are
+    coerced and aggregated; otherwise (no state, edited/deleted rows, changed
+    header) the state is rebuilt from the whole sheet.
+    """
+    state = _load_state(previous)
+    appended = _try_append(source, state, trace) if state is not None else None
+    if appended is not None:
+        raw, new = appended
+        mode = "append" if len(new) else "unchanged"
+        state.tail_hash = tail_hash(raw.iloc[-TAIL_ROWS:])
+        if len(new):
+            with _span(trace, "coercion"):
+                state.formats = add_helper_columns(new, state.schema, Coercer(state.formats)).formats
+            with _span(trace, "aggregation"):
+                part, _ = aggregate(new, state.schema)
+                state.agg = state.agg.merge(part)
+                state.density = add_density(state.density, bubble_points(new, state.schema))
+        new_rows = len(new)
+    else:
+        mode = "full"
+        df, schema, header = load_projected(source, trace)
+        raw_tail = tail_hash(df.iloc[-TAIL_ROWS:])
+        with _span(trace, "coercion"):
+            formats = add_helper_columns(df, schema).formats
+        with _span(trace, "aggregation"):
+            agg, cat_dim = aggregate(df, schema)
+            density = fit_density(bubble_points(df, schema))
+        state = EdaState(header, schema, cat_dim, agg, raw_tail, density, formats=formats)
+        new_rows = len(df)
+
+    with _span(trace, "specs"):
+        kpi, specs = build_specs(state.schema, state.header, state.agg, state.cat_dim, state.density)
+        fingerprints = {s.key: spec_fingerprint(s) for s in specs}
+    changed = [k for k, fp in fingerprints.items() if state.charts.get(k) != fp]
+    chart_data = {
+        "kpi": kpi,
+        "schema": state.schema,
+        "charts": [s.name for s in specs],
+        "incremental": {"mode": mode, "new_rows": new_rows, "changed_charts": changed},
+    }
+    if render in ("data", "both"):
+        chart_data["series"] = chart_series(specs)
+    return Refresh(chart_data, specs, changed, mode, new_rows, state, fingerprints)
+
+def render_refresh(result: Refresh, stored_pages: Dict[str, bytes], trace=None) -> Tuple[List[Tuple[str, bytes]], List[Tuple[str, bytes]], BinaryIO]:
+    """Render charts without a stored page and merge the full PDF.
+
+    Returns (new image files, new single-page PDFs as (key, bytes), merged PDF).
+    """
+    from .charts import RenderedChart, merge_pdf, render_all
+    todo = [s for s in result.specs if s.key not in stored_pages]
+    with _span(trace, "charts"):
+        rendered = {c.name: c for c in render_all(todo)}
+    if trace is not None:
+        for c in rendered.values():
+            trace.record(f"chart:{c.name}", c.seconds)
+    pages = [rendered.get(s.key) or RenderedChart(s.key, [], stored_pages[s.key]) for s in result.specs]
+    with _span(trace, "pdf"):
+        pdf_file = merge_pdf(pages)
+    images = [f for c in rendered.values() for f in c.files]
+    return images, [(c.name, c.pdf) for c in rendered.values()], pdf_file
@@ -0,0 +1,251 @@
+from __future__ import annotations
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+class InsightsError(RuntimeError):
+    """Every available provider failed."""
+
+class ProviderError(RuntimeError):
+    def __init__(self, provider: str, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(f"{provider}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Stops calling a provider for `cooldown` seconds once it keeps failing.
+
+    A rate-limit (429) or quota (402) answer opens the breaker at once; other
+    failures open it after `threshold` in a row. When the cooldown is over the
+    breaker is half-open: one trial call goes through, and its outcome closes
+    the breaker or opens it for another cooldown.
+    """
+
+    TRIP_STATUSES = (402, 429)
+
+    def __init__(self, cooldown: float, threshold: int = 3):
+        self.cooldown = cooldown
+        self.threshold = threshold
+        self.open_until = 0.0           # 0 while closed
+        self.failures = 0               # consecutive
+        self._probing = False           # a half-open trial call is in flight
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if not self.open_until:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until or self._probing else "half_open"
+
+    def ready(self) -> bool:
+        """Whether a call would be let through now (does not claim the half-open trial)."""
+        return self.state != "open"
+
+    def allow(self) -> bool:
+        """Claim a call; in the half-open state only the first caller gets through."""
+        with self._lock:
+            state = self.state
+            if state == "half_open":
+                self._probing = True
+            return state != "open"
+
+    def success(self) -> None:
+        with self._lock:
+            self.open_until = 0.0
+            self.failures = 0
+            self._probing = False
+
+    def failure(self, status: Optional[int] = None, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or status in self.TRIP_STATUSES or self.failures >= self.threshold:
+                self.open_until = time.monotonic() + max(self.cooldown, retry_after or 0)
+                self._probing = False
+
+class Provider:
+    """OpenAI-compatible chat completions endpoint on a long-lived keep-alive session."""
+
+    def __init__(self, name: str, base_url: str, api_key: Optional[str], model: str,
+                 timeout: float = 30, cooldown: float = 60, extra: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.extra = extra or {}
+        self.breaker = CircuitBreaker(cooldown)
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"})
+        self.session.mount(base_url, HTTPAdapter(pool_maxsize=8))
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key) and self.breaker.ready()
+
+    def complete(self, system: str, prompt: str) -> Dict[str, Any]:
+        """Parsed JSON answer; every outcome is recorded on the circuit breaker."""
+        if not self.breaker.allow():
+            raise ProviderError(self.name, "circuit open")
+        try:
+            result = self._complete(system, prompt)
+        except ProviderError as e:
+            self.breaker.failure(e.status, e.retry_after)
+            raise
+        self.breaker.success()
+        return result
+
+    def _complete(self, system: str, prompt: str) -> Dict[str, Any]:
+        body = {
+            "model": self.model,
+            "messages": [{"role": "system", "content": system}, {"role": "user", "content": prompt}],
+            "temperature": 0.0,
+            "max_tokens": 900,
+            **self.extra,
+        }
+        try:
+            r = self.session.post(self.url, json=body, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ProviderError(self.name, str(e))
+        if r.status_code != 200:
+            retry_after = r.headers.get("Retry-After")
+            retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
+            raise ProviderError(self.name, f"status {r.status_code}", r.status_code, retry_after)
+        try:
+            return json.loads(r.json()["choices"][0]["message"]["content"])
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise ProviderError(self.name, f"unparseable response: {e}")
+
+    def close(self) -> None:
+        self.session.close()
+
+class ResponseCache:
+    """Small thread-safe LRU of parsed responses keyed by (model, rendered prompt)."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, system: str, prompt: str) -> str:
+        return hashlib.sha256("\0".join((model, system, prompt)).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None or time.monotonic() - hit[0] > self.ttl:
+                self._data.pop(key, None)
+                return None
+            self._data.move_to_end(key)
+            return copy.deepcopy(hit[1])
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), copy.deepcopy(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+class Insights:
+    """Narrative generation across providers in priority order.
+
+    The primary is asked first. If it has not answered after `hedge_delay`
+    seconds (or fails earlier), the next provider is asked as well and the
+    first successful answer wins. Slower answers still land in the cache.
+    """
+
+    def __init__(self, providers: List[Provider], hedge_delay: float = 2.0, cache: Optional[ResponseCache] = None):
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.cache = cache or ResponseCache(256, 24 * 3600)
+        self._pool = ThreadPoolExecutor(max_workers=4 * max(len(providers), 1), thread_name_prefix="insights")
+
+    @classmethod
+    def from_env(cls) -> "Insights":
+        cooldown = float(os.environ.get("INSIGHTS_BREAKER_COOLDOWN_S", "60"))
+        timeout = float(os.environ.get("INSIGHTS_TIMEOUT_S", "30"))
+        json_mode = {"response_format": {"type": "json_object"}}
+        providers = [
+            Provider("Lovable AI", os.environ.get("LOVABLE_AI_BASE_URL", "https://ai.gateway.lovable.dev/v1"),
+                     os.environ.get("LOVABLE_API_KEY"), os.environ.get("LOVABLE_AI_MODEL", "google/gemini-2.5-flash"),
+                     timeout, cooldown, json_mode),
+            Provider("OpenAI", os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+                     os.environ.get("OPENAI_API_KEY"), os.environ.get("OPENAI_MODEL", "gpt-4o-mini"),
+                     timeout, cooldown),
+        ]
+        cache = ResponseCache(int(os.environ.get("INSIGHTS_CACHE_SIZE", "256")),
+                              float(os.environ.get("INSIGHTS_CACHE_TTL_S", str(24 * 3600))))
+        return cls(providers, float(os.environ.get("INSIGHTS_HEDGE_DELAY_S", "2")), cache)
+
+    def _call(self, provider: Provider, system: str, prompt: str, trace=None) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        try:
+            result = provider.complete(system, prompt)
+        except ProviderError as e:
+            if trace is not None:
+                trace.record(f"llm:{provider.name}", time.perf_counter() - t0, status=e.status or "error")
+            raise
+        if trace is not None:
+            trace.record(f"llm:{provider.name}", time.perf_counter() - t0, status=200)
+        self.cache.put(ResponseCache.key(provider.model, system, prompt), result)
+        return result
+
+    def generate(self, system: str, prompt: str, trace=None) -> Optional[Dict[str, Any]]:
+        """Parsed JSON answer, or None when no provider is configured/available.
+
+        Raises InsightsError when every provider that was tried failed. Each
+        provider call is recorded on `trace` (a metrics.Trace) when given.
+        """
+        candidates = [p for p in self.providers if p.available]
+        for p in candidates:
+            hit = self.cache.get(ResponseCache.key(p.model, system, prompt))
+            if hit is not None:
+                logging.info(f"Insights served from cache ({p.name})")
+                return hit
+        if not candidates:
+            return None
+
+        pending: Dict[Future, Provider] = {}
+        errors: List[str] = []
+        queue = list(candidates)
+        while queue or pending:
+            if queue and not pending:
+                p = queue.pop(0)
+                logging.info(f"Attempting {p.name} for insights generation")
+                pending[self._pool.submit(self._call, p, system, prompt, trace)] = p
+            # Wait for an answer; after hedge_delay start the next provider alongside
+            done, _ = wait(pending, timeout=self.hedge_delay if queue else None, return_when=FIRST_COMPLETED)
+            if not done and queue:
+                p = queue.pop(0)
+                logging.info(f"{pending[next(iter(pending))].name} is slow, also asking {p.name}")
+                pending[self._pool.submit(self._call, p, system, prompt, trace)] = p
+                continue
+            for f in done:
+                p = pending.pop(f)
+                try:
+                    result = f.result()
+                except ProviderError as e:
+                    logging.warning(f"Insights provider failed: {e}")
+                    errors.append(str(e))
+                    continue
+                logging.info(f"{p.name} insights generated successfully")
+                return result
+        raise InsightsError("; ".join(errors))
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False)
+        for p in self.providers:
+            p.close()
@@ -0,0 +1,172 @@
+from __future__ import annotations
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Job states after which nothing about the job changes; only these are pruned
+FINISHED = ("completed", "failed")
+
+class QueueFull(Exception):
+    pass
+
+class JobFailed(Exception):
+    """Raised by a job function with a user-facing message; the report is already marked failed."""
+
+@dataclass
+class Job:
+    id: str
+    report_id: str
+    request_id: str = ""             # X-Request-ID of the /analyze call, used for tracing
+    batch_id: Optional[str] = None   # set for items of an /analyze/batch call
+    status: str = "queued"          # queued | running | completed | failed
+    stage: str = "queued"
+    progress: int = 0
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+class StageLimits:
+    """Per-stage concurrency limits shared by every job (e.g. downloads, EDA, uploads).
+
+    Jobs wait in `slot(stage)` until one of the stage's slots is free, so many
+    jobs can be in flight while each stage runs at most its limit at a time.
+    Stages without a limit are not bounded.
+    """
+
+    def __init__(self, limits: Dict[str, int]):
+        self.limits = dict(limits)
+        self._sems = {stage: threading.BoundedSemaphore(n) for stage, n in limits.items() if n > 0}
+
+    @contextmanager
+    def slot(self, stage: str) -> Iterator[None]:
+        sem = self._sems.get(stage)
+        if sem is None:
+            yield
+            return
+        with sem:
+            yield
+
+# fn(job, payload, progress) -> result dict; progress(stage, percent)
+JobFn = Callable[["Job", Any, Callable[[str, int], None]], Dict[str, Any]]
+
+class JobQueue:
+    """Bounded FIFO of analysis jobs drained by a fixed number of worker threads.
+
+    The most recent `retain` jobs and batches stay available for status
+    lookups; older ones are forgotten once they have finished.
+    """
+
+    def __init__(self, fn: JobFn, workers: int, max_depth: int, retain: int = 1000,
+                 on_progress: Optional[Callable[[Job], None]] = None):
+        self.fn = fn
+        self.on_progress = on_progress
+        self.retain = retain
+        self._queue: "queue.Queue[tuple[Job, Any]]" = queue.Queue(maxsize=max_depth)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._batches: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._worker, name=f"analyze-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, report_id: str, payload: Any, request_id: Optional[str] = None) -> Job:
+        return self.submit_many([(report_id, payload)], request_id)[0]
+
+    def submit_many(self, items: List[Tuple[str, Any]], request_id: Optional[str] = None,
+                    batch_id: Optional[str] = None) -> List[Job]:
+        """Queue (report_id, payload) items all at once, or none of them if they do not fit."""
+        jobs = []
+        for i, (report_id, _) in enumerate(items):
+            job_id = uuid.uuid4().hex
+            rid = f"{request_id}-{i}" if request_id and batch_id else request_id
+            jobs.append(Job(id=job_id, report_id=report_id, request_id=rid or job_id, batch_id=batch_id))
+        with self._submit_lock:
+            # Only submitters add to the queue, so the room checked here cannot shrink before the puts
+            if self._queue.maxsize and self._queue.maxsize - self._queue.qsize() < len(items):
+                raise QueueFull(f"Analysis queue is full ({self._queue.qsize()} of {self._queue.maxsize} jobs waiting)")
+            with self._lock:
+                for job in jobs:
+                    self._jobs[job.id] = job
+                if batch_id:
+                    self._batches[batch_id] = [job.id for job in jobs]
+                self._prune()
+            for job, (_, payload) in zip(jobs, items):
+                self._queue.put_nowait((job, payload))
+        return jobs
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def batch(self, batch_id: str) -> Optional[List[Job]]:
+        """Jobs of a batch that are still retained; None for an unknown batch."""
+        with self._lock:
+            ids = self._batches.get(batch_id)
+            return None if ids is None else [self._jobs[i] for i in ids if i in self._jobs]
+
+    def _prune(self) -> None:
+        """Drop the oldest finished jobs and batches beyond `retain` (call with the lock held).
+
+        Queued and running jobs, and batches with one of them, are kept even
+        past the limit; they are dropped once finished and old enough.
+        """
+        excess = len(self._jobs) - self.retain
+        if excess > 0:
+            for job_id in [i for i, job in self._jobs.items() if job.status in FINISHED][:excess]:
+                del self._jobs[job_id]
+        excess = len(self._batches) - self.retain
+        if excess > 0:
+            done = [b for b, ids in self._batches.items()
+                    if all(i not in self._jobs or self._jobs[i].status in FINISHED for i in ids)]
+            for batch_id in done[:excess]:
+                del self._batches[batch_id]
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def _update(self, job: Job, **changes) -> None:
+        for k, v in changes.items():
+            setattr(job, k, v)
+        job.updated_at = time.time()
+
+    def _worker(self) -> None:
+        while True:
+            job, payload = self._queue.get()
+            try:
+                self._run(job, payload)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Job, payload: Any) -> None:
+        def progress(stage: str, percent: int) -> None:
+            self._update(job, stage=stage, progress=percent)
+            if self.on_progress:
+                try:
+                    self.on_progress(job)
+                except Exception as e:
+                    logging.warning(f"Progress update failed for job {job.id}: {e}")
+
+        self._update(job, status="running")
+        try:
+            result = self.fn(job, payload, progress)
+            self._update(job, status="completed", stage="completed", progress=100, result=result)
+        except JobFailed as e:
+            self._update(job, status="failed", stage="failed", error=str(e))
+        except Exception as e:
+            logging.error(f"Job {job.id} for report {job.report_id} crashed: {e}", exc_info=True)
+            self._update(job, status="failed", stage="failed", error="An error occurred during processing")
+        with self._lock:
+            self._prune()
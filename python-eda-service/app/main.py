@@ -3,16 +3,44 @@ import logging
 logging.basicConfig(level=logging.INFO)
 from dotenv import load_dotenv
 load_dotenv()
-import os, json, requests
-from fastapi import FastAPI, HTTPException, Header
+import os, json, mimetypes, requests, tempfile, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import BinaryIO, Dict, List, Tuple
+from urllib.parse import unquote
+from fastapi import FastAPI, HTTPException, Header, Response
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from openai import OpenAI
 
-from eda import eda_from_bytes
-from supa import Supa
-from prompts import SYSTEM_PROMPT, USER_PROMPT_TEMPLATE
+from .cache import ResultCache, SnapshotStore, cache_key, content_hash
+from .insights import Insights, InsightsError
+from .jobs import Job, JobFailed, JobQueue, QueueFull, StageLimits
+from .metrics import JOBS, Gauge, Trace, register, render_metrics
+from .eda import EDA_VERSION, SNAPSHOT_VERSION, STREAM_BYTES, RenderMode, combine_kpis, eda_from_bytes, warmup
+from .incremental import refresh, render_refresh
+from .specs import OUTPUT_SIGNATURE, output_names
+from .spool import CHUNK_BYTES, PayloadTooLarge, spool_chunks, stream_size
+from .supa import ReportUpdates, Supa
+from .prompts import SYSTEM_PROMPT, USER_PROMPT_TEMPLATE
 
-app = FastAPI()
+# Set EDA_WARMUP=0 to skip preloading the chart stack (e.g. for data-only deployments)
+EDA_WARMUP = os.environ.get("EDA_WARMUP", "1") != "0"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs before uvicorn accepts connections, so the first /analyze does not pay for imports
+    if EDA_WARMUP:
+        t0 = time.perf_counter()
+        try:
+            warmup()
+            logging.info(f"Warmup finished in {time.perf_counter() - t0:.2f}s")
+        except Exception as e:
+            logging.warning(f"Warmup failed, charts will load on first use: {e}")
+    yield
+    report_updates.flush(force=True)
+    snapshot_uploads.shutdown(wait=False)
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 async def read_root():
@@ -21,17 +49,43 @@ async def read_root():
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
 REPORTS_BUCKET = os.environ.get("REPORTS_BUCKET", "reports")
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_MB", "200")) * 1024 * 1024
 AUTH_TOKEN = os.environ.get("PY_SERVICE_TOKEN")  # shared secret
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
 if not (SUPABASE_URL and SUPABASE_SERVICE_KEY):
     raise RuntimeError("Missing Supabase env vars")
+if STREAM_BYTES >= MAX_UPLOAD_BYTES:
+    logging.warning("EDA_STREAM_MB is not below MAX_UPLOAD_MB: CSV uploads are never streamed and are loaded whole")
 
 supa = Supa(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+result_cache = ResultCache(
+    os.environ.get("EDA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "eda-cache")),
+    memory_bytes=int(os.environ.get("EDA_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+    disk_bytes=int(os.environ.get("EDA_CACHE_DISK_MB", "1024")) * 1024 * 1024,
+)
+# Arrow snapshots of parsed datasets; memory-mapped from here, also stored next to the report artifacts
+snapshots = SnapshotStore(
+    os.environ.get("EDA_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "eda-snapshots")),
+    disk_bytes=int(os.environ.get("EDA_SNAPSHOT_DISK_MB", "2048")) * 1024 * 1024,
+)
+# Snapshots are copied to storage in the background; no report waits for them
+snapshot_uploads = ThreadPoolExecutor(max_workers=2, thread_name_prefix="snapshot-upload")
+insights = Insights.from_env()
+
+# Jobs in flight at once may exceed these; each stage still runs at most this many at a time (0: unbounded)
+stages = StageLimits({
+    "download": int(os.environ.get("ANALYZE_DOWNLOAD_SLOTS", "8")),
+    "eda": int(os.environ.get("ANALYZE_EDA_SLOTS", str(os.cpu_count() or 1))),
+    "upload": int(os.environ.get("ANALYZE_UPLOAD_SLOTS", "4")),
+})
+# Batch items report progress and results through this buffer instead of one PATCH per step
+report_updates = ReportUpdates(supa, interval=float(os.environ.get("REPORT_UPDATE_INTERVAL_S", "1")))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "100"))
 
 def sanitize_error_message(error: Exception) -> str:
     """Return user-friendly error without internal details"""
     error_map = {
+        PayloadTooLarge: "File is too large",
         requests.exceptions.RequestException: "Failed to download file",
         FileNotFoundError: "File not found",
         ValueError: "Invalid data format",
@@ -53,81 +107,346 @@ class AnalyzePayload(BaseModel):
     skipAI: bool = False
     aiInsights: dict | None = None
     analysisContext: dict | None = None
+    # "data": chart series in chart_data only, "images": PNG/PDF artifacts, "both"
+    render: RenderMode = "images"
+    # Live sheets: merge rows appended since the last refresh into the stored state instead of a full EDA
+    incremental: bool = False
+    # Sketch-based one-pass EDA for very large uploads; error bounds are reported in chart_data.approximate
+    approximate: bool = False
+
+class BatchPayload(BaseModel):
+    items: List[AnalyzePayload]
 
-def download_with_fallback(signed_url: str) -> bytes:
+SIGNED_PATH = "/storage/v1/object/sign/"
+LIVE_STATE = "eda_state.json"
+
+def download_with_fallback(signed_url: str) -> BinaryIO:
+    """Stream the upload into a spooled temp file, enforcing MAX_UPLOAD_BYTES."""
     if not signed_url.lower().startswith("http"):
-        data = supa.download(signed_url)
+        data = supa.download(signed_url, max_bytes=MAX_UPLOAD_BYTES)
         if data is None:
             raise RuntimeError("Failed to download object from Supabase via service key.")
         return data
 
-    r = requests.get(signed_url, timeout=60)
-    if r.status_code == 200:
-        return r.content
+    with requests.get(signed_url, timeout=60, stream=True) as r:
+        if r.status_code == 200:
+            declared = int(r.headers.get("Content-Length") or 0)
+            return spool_chunks(r.iter_content(CHUNK_BYTES), MAX_UPLOAD_BYTES, declared)
+    # Signed URLs are short-lived and a queued job may start after expiry
+    if SIGNED_PATH in signed_url:
+        obj_path = unquote(signed_url.split(SIGNED_PATH, 1)[1].split("?", 1)[0])
+        data = supa.download(obj_path, max_bytes=MAX_UPLOAD_BYTES)
+        if data is not None:
+            return data
     raise RuntimeError(f"Failed to download signed URL (status={r.status_code}).")
 
-@app.post("/analyze")
-def analyze(payload: AnalyzePayload, authorization: str = Header(None)):
+def check_auth(authorization: str | None) -> None:
+    expected = f"Bearer {AUTH_TOKEN}" if AUTH_TOKEN else None
+    if expected and authorization != expected:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+def report_progress(job: Job, db=None) -> None:
+    (db or supa).update_report(job.report_id, {"processing_stage": job.stage, "processing_progress": job.progress})
+
+@app.post("/analyze", status_code=202)
+async def analyze(payload: AnalyzePayload, response: Response, authorization: str = Header(None),
+                  x_request_id: str | None = Header(None)):
     logging.info(f"=== Analyze Request Started ===")
     logging.info(f"Report ID: {payload.reportId}")
     logging.info(f"User ID: {payload.userId}")
     logging.info(f"Signed URL: {payload.signedUrl[:60]}...")
     logging.info(f"Skip AI: {payload.skipAI}")
     logging.info(f"Has Pre-computed Insights: {payload.aiInsights is not None}")
-    
-    expected = f"Bearer {AUTH_TOKEN}" if AUTH_TOKEN else None
-    if expected and authorization != expected:
+
+    try:
+        check_auth(authorization)
+    except HTTPException:
         logging.error(f"Unauthorized request for report {payload.reportId}")
-        raise HTTPException(status_code=401, detail="Unauthorized")
+        raise
 
-    # 1) Download file
-    logging.info(f"Downloading file from signed URL for report {payload.reportId}")
     try:
-        content = download_with_fallback(payload.signedUrl)
-        logging.info(f"File downloaded successfully: {len(content)} bytes")
+        job = jobs.submit(payload.reportId, payload, request_id=x_request_id)
+    except QueueFull as e:
+        logging.warning(f"Rejecting report {payload.reportId}: {e}")
+        raise HTTPException(503, detail="Analysis queue is full, please retry shortly", headers={"Retry-After": "30"})
+    logging.info(f"Queued job {job.id} for report {payload.reportId} (queue depth {jobs.depth}, request {job.request_id})")
+    response.headers["X-Request-ID"] = job.request_id
+    return {"ok": True, "jobId": job.id, "requestId": job.request_id, "status": job.status, "statusUrl": f"/jobs/{job.id}"}
+
+@app.post("/analyze/batch", status_code=202)
+async def analyze_batch(payload: BatchPayload, response: Response, authorization: str = Header(None),
+                        x_request_id: str | None = Header(None)):
+    check_auth(authorization)
+    report_ids = [item.reportId for item in payload.items]
+    if not report_ids:
+        raise HTTPException(400, detail="Batch has no items")
+    if len(report_ids) > BATCH_MAX_ITEMS:
+        raise HTTPException(413, detail=f"Batch has {len(report_ids)} items, limit is {BATCH_MAX_ITEMS}")
+    if len(set(report_ids)) != len(report_ids):
+        raise HTTPException(400, detail="Each report may appear only once in a batch")
+    batch_id = uuid.uuid4().hex
+    try:
+        batch = batch_jobs.submit_many([(item.reportId, item) for item in payload.items],
+                                       request_id=x_request_id, batch_id=batch_id)
+    except QueueFull as e:
+        logging.warning(f"Rejecting batch of {len(report_ids)} reports: {e}")
+        raise HTTPException(503, detail="Analysis queue is full, please retry shortly", headers={"Retry-After": "30"})
+    logging.info(f"Queued batch {batch_id} with {len(batch)} reports (queue depth {batch_jobs.depth})")
+    response.headers["X-Request-ID"] = x_request_id or batch_id
+    return {"ok": True, "batchId": batch_id, "statusUrl": f"/batches/{batch_id}",
+            "jobs": [{"reportId": j.report_id, "jobId": j.id, "statusUrl": f"/jobs/{j.id}"} for j in batch]}
+
+@app.get("/batches/{batch_id}")
+async def batch_status(batch_id: str, authorization: str = Header(None)):
+    """Per-report status of a batch, and the combined KPIs of the reports completed so far."""
+    check_auth(authorization)
+    batch = batch_jobs.batch(batch_id)
+    if batch is None:
+        raise HTTPException(404, detail="Batch not found")
+    counts: Dict[str, int] = {}
+    for j in batch:
+        counts[j.status] = counts.get(j.status, 0) + 1
+    kpis = {j.report_id: j.result["chart_data"].get("kpi") or {} for j in batch if j.status == "completed" and j.result}
+    return {
+        "batchId": batch_id,
+        "done": all(j.status in ("completed", "failed") for j in batch),
+        "counts": counts,
+        "items": [{"reportId": j.report_id, "jobId": j.id, "status": j.status, "stage": j.stage,
+                   "progress": j.progress, "error": j.error, "pdf": (j.result or {}).get("pdf")} for j in batch],
+        "summary": combine_kpis(kpis),
+    }
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, authorization: str = Header(None)):
+    check_auth(authorization)
+    job = jobs.get(job_id) or batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/metrics")
+async def metrics(authorization: str = Header(None)):
+    check_auth(authorization)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def analyze_job(job: Job, payload: AnalyzePayload, progress, db=None) -> dict:
+    """Run one analysis; report rows are updated through `db` (Supa or ReportUpdates, default supa)."""
+    db = db or supa
+    trace = Trace(job.request_id)
+    try:
+        result = run_analysis(payload, progress, trace, db)
+        JOBS.inc(status="completed")
+        return result
+    except JobFailed:
+        JOBS.inc(status="failed")
+        raise
     except Exception as e:
+        JOBS.inc(status="failed")
         user_message = sanitize_error_message(e)
-        logging.error(f"Download failed for report {payload.reportId}: {e}", exc_info=True)
-        supa.update_report(payload.reportId, {"processing_status": "failed", "error_message": user_message})
-        raise HTTPException(400, detail=user_message)
+        logging.error(f"Analysis failed for report {payload.reportId}: {e}", exc_info=True)
+        db.update_report(payload.reportId, {"processing_status": "failed", "error_message": user_message})
+        raise JobFailed(user_message)
+
+def analyze_batch_item(job: Job, payload: AnalyzePayload, progress) -> dict:
+    """analyze_job through the buffered report updates; returns once the report row is written.
+
+    Otherwise /batches/{id} could show an item as done while its row still
+    says it is processing.
+    """
+    try:
+        result = analyze_job(job, payload, progress, db=report_updates)
+    except JobFailed:
+        report_updates.wait(payload.reportId)
+        raise
+    if not report_updates.wait(payload.reportId):
+        raise JobFailed("Failed to save the report")
+    return result
+
+def eda_with_snapshot(payload: AnalyzePayload, source: BinaryIO, upload: str, trace: Trace):
+    """eda_from_bytes over the dataset's Arrow snapshot when one exists (locally or in storage).
+
+    Otherwise the upload is parsed and its snapshot written, then stored in
+    the background at {userId}/datasets/<hash>.arrow, so later reports on the
+    same file (on any instance) find it. `upload` is the content_hash of `source`.
+    """
+    if payload.approximate or not snapshots.directory:
+        return eda_from_bytes(source, render=payload.render, trace=trace, approximate=payload.approximate)
+    digest = cache_key(upload, SNAPSHOT_VERSION)
+    remote = f"{payload.userId}/datasets/{digest}.arrow"
+    with trace.span("snapshot_fetch") as span:
+        local = snapshots.get(digest)
+        span["source"] = "local" if local else None
+        if local is None:
+            data = supa.download(f"{REPORTS_BUCKET}/{remote}")
+            if data is not None:
+                local = snapshots.put(digest, data)
+                data.close()
+                span["source"] = "storage"
+    if local is not None:
+        try:
+            return eda_from_bytes(local, render=payload.render, trace=trace)
+        except Exception as e:
+            logging.warning(f"Snapshot {digest[:12]} unusable, parsing the upload instead: {e}")
+            os.remove(local)
+
+    with snapshots.writing(digest) as out:
+        result = eda_from_bytes(source, render=payload.render, trace=trace, snapshot=out)
+    local = snapshots.get(digest)
+    if local is not None:
+        snapshot_uploads.submit(upload_snapshot, local, remote)
+    return result
 
+def upload_snapshot(local: str, remote: str) -> None:
+    try:
+        with open(local, "rb") as f:
+            supa.upload(REPORTS_BUCKET, remote, f, "application/vnd.apache.arrow.file")
+    except Exception as e:
+        # No report depends on it; the next run on another instance just parses the upload again
+        logging.warning(f"Snapshot upload to {remote} failed: {e}")
+
+def run_full(payload: AnalyzePayload, source: BinaryIO, progress, trace: Trace, db) -> Tuple[dict, str | None, List[str]]:
+    """Full EDA of the upload (through the result cache); outputs go to a new timestamped folder."""
     # 2) Run EDA
+    progress("analyzing", 20)
     logging.info(f"Running EDA analysis for report {payload.reportId}")
     try:
-        chart_json, images, pdf_bytes = eda_from_bytes(content)
-        logging.info(f"EDA completed: {len(images)} images generated, PDF size: {len(pdf_bytes)} bytes")
+        upload = content_hash(source)
+        key = cache_key(upload, EDA_VERSION, payload.render, OUTPUT_SIGNATURE, payload.approximate)
+
+        def compute():
+            with stages.slot("eda"):
+                return eda_with_snapshot(payload, source, upload, trace)
+
+        with trace.span("eda") as span:
+            (chart_json, images, pdf_file), cache_hit = result_cache.get_or_compute(key, compute)
+            span["cache_hit"] = cache_hit
+        if cache_hit:
+            logging.info(f"EDA result served from cache ({key[:12]})")
+        pdf_size = stream_size(pdf_file) if pdf_file else 0
+        logging.info(f"EDA completed ({payload.render}): {len(images)} images generated, PDF size: {pdf_size} bytes")
     except Exception as e:
         user_message = sanitize_error_message(e)
         logging.error(f"EDA failed for report {payload.reportId}: {e}", exc_info=True)
-        supa.update_report(payload.reportId, {"processing_status": "failed", "error_message": user_message})
-        raise HTTPException(500, detail=user_message)
-
-    # 3) Upload outputs
-    logging.info(f"Uploading outputs to {REPORTS_BUCKET} bucket for report {payload.reportId}")
-    from datetime import datetime
-    ts = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
-    base = f"{payload.userId}/{payload.reportId}/{ts}"
+        db.update_report(payload.reportId, {"processing_status": "failed", "error_message": user_message})
+        raise JobFailed(user_message)
+    finally:
+        source.close()
+
+    # 3) Upload outputs (nothing to upload when only chart series were requested)
+    progress("uploading", 60)
+    previous = result_cache.uploads_for(key, payload.userId) if cache_hit else None
+    if pdf_file is None:
+        pdf_path, image_paths = None, []
+    elif previous and supa.exists(REPORTS_BUCKET, previous["pdf"]):
+        pdf_path, image_paths = previous["pdf"], previous["images"]
+        logging.info(f"Reusing stored outputs for identical upload: {pdf_path}")
+    else:
+        logging.info(f"Uploading outputs to {REPORTS_BUCKET} bucket for report {payload.reportId}")
+        from datetime import datetime
+        ts = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        base = f"{payload.userId}/{payload.reportId}/{ts}"
+        pdf_path = f"{base}/eda_report.pdf"
+        uploads = [(pdf_path, pdf_file, "application/pdf")]
+        uploads += [(f"{base}/images/{name}", img, mimetypes.guess_type(name)[0] or "application/octet-stream")
+                    for name, img in images]
+        with stages.slot("upload"), trace.span("uploads"):
+            image_paths = supa.upload_many(REPORTS_BUCKET, uploads,
+                                           on_uploaded=lambda path, secs: trace.record("upload", secs, path=path))[1:]
+        logging.info(f"PDF uploaded: {pdf_path}")
+        logging.info(f"Uploaded {len(image_paths)} images")
+        result_cache.record_uploads(key, payload.userId, pdf_path, image_paths)
+    if pdf_file is not None:
+        pdf_file.close()
+    return chart_json, pdf_path, image_paths
+
+def run_incremental(payload: AnalyzePayload, source: BinaryIO, progress, trace: Trace, db) -> Tuple[dict, str | None, List[str]]:
+    """Refresh a live report from its stored state, re-rendering only charts whose data changed.
+
+    State and artifacts live at stable paths under {userId}/{reportId}/live/. The
+    state is uploaded last, so a failed upload leaves the previous state (and
+    the artifacts it describes) in charge and the next refresh redoes the work.
+    """
+    base = f"{payload.userId}/{payload.reportId}/live"
+    state_path = f"{base}/{LIVE_STATE}"
+    progress("analyzing", 20)
+    try:
+        with trace.span("state_download") as span:
+            state_file = supa.download(f"{REPORTS_BUCKET}/{state_path}")
+            previous = state_file.read() if state_file is not None else None
+            span["found"] = previous is not None
+        with stages.slot("eda"), trace.span("eda") as span:
+            result = refresh(source, previous, render=payload.render, trace=trace)
+            span["mode"] = result.mode
+        logging.info(f"Incremental refresh ({result.mode}): {result.new_rows} new rows, "
+                     f"{len(result.changed)}/{len(result.specs)} charts changed")
+    except Exception as e:
+        user_message = sanitize_error_message(e)
+        logging.error(f"Incremental EDA failed for report {payload.reportId}: {e}", exc_info=True)
+        db.update_report(payload.reportId, {"processing_status": "failed", "error_message": user_message})
+        raise JobFailed(user_message)
+    finally:
+        source.close()
+
+    progress("uploading", 60)
+    if payload.render == "data":
+        # Stored artifacts were not refreshed; keep their old fingerprints so a later image refresh redraws them
+        supa.upload(REPORTS_BUCKET, state_path, result.state_bytes(rendered=[]), "application/json")
+        return result.chart_data, None, []
+
     pdf_path = f"{base}/eda_report.pdf"
-    supa.upload(REPORTS_BUCKET, pdf_path, pdf_bytes, content_type="application/pdf")
-    logging.info(f"PDF uploaded: {pdf_path}")
+    image_paths = [f"{base}/images/{name}" for s in result.specs for name in output_names(s.key)]
+    uploads = []
+    rendered: List[str] = []
+    if result.changed or not supa.exists(REPORTS_BUCKET, pdf_path):
+        stored_pages = {}
+        with trace.span("page_download"):
+            for s in result.specs:
+                if s.key in result.changed:
+                    continue
+                page = supa.download(f"{REPORTS_BUCKET}/{base}/charts/{s.key}.pdf")
+                if page is not None:  # missing pages are simply rendered again
+                    stored_pages[s.key] = page.read()
+        with stages.slot("eda"):
+            images, pages, pdf_file = render_refresh(result, stored_pages, trace)
+        rendered = [key for key, _ in pages]
+        uploads += [(f"{base}/images/{name}", img, mimetypes.guess_type(name)[0] or "application/octet-stream")
+                    for name, img in images]
+        uploads += [(f"{base}/charts/{key}.pdf", page, "application/pdf") for key, page in pages]
+        uploads.append((pdf_path, pdf_file, "application/pdf"))
+    with stages.slot("upload"), trace.span("uploads"):
+        supa.upload_many(REPORTS_BUCKET, uploads, on_uploaded=lambda path, secs: trace.record("upload", secs, path=path))
+        supa.upload(REPORTS_BUCKET, state_path, result.state_bytes(rendered), "application/json")
+    logging.info(f"Uploaded {len(rendered)} re-rendered charts to {base}")
+    return result.chart_data, pdf_path, image_paths
+
+def run_analysis(payload: AnalyzePayload, progress, trace: Trace, db) -> dict:
+    # 1) Download file
+    progress("downloading", 5)
+    logging.info(f"Downloading file from signed URL for report {payload.reportId}")
+    try:
+        with stages.slot("download"), trace.span("download") as span:
+            source = download_with_fallback(payload.signedUrl)
+            span["bytes"] = stream_size(source)
+        logging.info(f"File downloaded successfully: {stream_size(source)} bytes")
+    except Exception as e:
+        user_message = sanitize_error_message(e)
+        logging.error(f"Download failed for report {payload.reportId}: {e}", exc_info=True)
+        db.update_report(payload.reportId, {"processing_status": "failed", "error_message": user_message})
+        raise JobFailed(user_message)
 
-    image_paths = []
-    for name, img in images:
-        p = f"{base}/images/{name}"
-        supa.upload(REPORTS_BUCKET, p, img, content_type="image/png")
-        image_paths.append(p)
-    logging.info(f"Uploaded {len(image_paths)} images")
+    # 2-3) Run EDA and upload outputs
+    if payload.incremental:
+        chart_json, pdf_path, image_paths = run_incremental(payload, source, progress, trace, db)
+    else:
+        chart_json, pdf_path, image_paths = run_full(payload, source, progress, trace, db)
 
     # 4) AI narrative - use pre-computed insights if skipAI flag is set
+    progress("summarizing", 75)
     if payload.skipAI and payload.aiInsights:
         # Use pre-computed insights from TypeScript pipeline
         summary_json = payload.aiInsights
         logging.info("Using pre-computed AI insights from process-spreadsheet pipeline")
     else:
-        # Try AI providers in priority order: Lovable AI → OpenAI → Basic fallback
-        LOVABLE_API_KEY = os.getenv("LOVABLE_API_KEY")
-        OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-        
         summary_json = {"summary": "No summary generated.", "keyFindings": [], "recommendations": [], "nextSteps": []}
         
         # Prepare context for AI
@@ -145,75 +464,29 @@ def analyze(payload: AnalyzePayload, authorization: str = Header(None)):
             domain_type=domain_type
         )
         
-        # Try Lovable AI first
-        if LOVABLE_API_KEY:
-            logging.info("Attempting Lovable AI for insights generation")
-            try:
-                import requests
-                response = requests.post(
-                    "https://ai.gateway.lovable.dev/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {LOVABLE_API_KEY}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "google/gemini-2.5-flash",
-                        "messages": [
-                            {"role": "system", "content": SYSTEM_PROMPT},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": 0.0,
-                        "max_tokens": 900,
-                        "response_format": {"type": "json_object"}
-                    },
-                    timeout=30
-                )
-                if response.status_code == 200:
-                    result = response.json()
-                    content = result["choices"][0]["message"]["content"]
-                    summary_json = json.loads(content)
-                    logging.info("Lovable AI insights generated successfully")
-                elif response.status_code == 429:
-                    logging.warning("Lovable AI rate limit exceeded, trying OpenAI")
-                elif response.status_code == 402:
-                    logging.warning("Lovable AI quota exceeded, trying OpenAI")
-                else:
-                    logging.warning(f"Lovable AI failed with status {response.status_code}, trying OpenAI")
-            except Exception as e:
-                logging.error(f"Lovable AI error: {e}, trying OpenAI")
-        
-        # Try OpenAI if Lovable AI failed or is unavailable
-        if OPENAI_API_KEY and summary_json.get("summary") == "No summary generated.":
-            logging.info("Attempting OpenAI for insights generation")
-            try:
-                client = OpenAI(api_key=OPENAI_API_KEY)
-                resp = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": prompt},
-                    ],
-                    temperature=0.0,
-                    max_tokens=900,
-                )
-                msg = resp.choices[0].message.content
-                summary_json = json.loads(msg)
-                logging.info("OpenAI insights generated successfully")
-            except Exception as e:
-                logging.error(f"OpenAI error: {e}")
-                summary_json = {"summary": f"AI generation failed: {e}", "keyFindings": [], "recommendations": [], "nextSteps": []}
+        # Lovable AI first, OpenAI hedged after a short delay, basic fallback if neither answers
+        try:
+            summary_json = insights.generate(SYSTEM_PROMPT, prompt, trace=trace) or summary_json
+        except InsightsError as e:
+            logging.error(f"AI generation failed: {e}")
+            summary_json = {"summary": f"AI generation failed: {e}", "keyFindings": [], "recommendations": [], "nextSteps": []}
         
-        # If both AI providers failed, summary_json will have the default "No summary generated."
+        # If no AI provider was available, summary_json will have the default "No summary generated."
         if summary_json.get("summary") == "No summary generated.":
             logging.warning("All AI providers unavailable or failed, using basic fallback")
 
     # 5) Update DB - only update PDF paths and status, don't overwrite text_summary if skipAI
+    progress("saving", 95)
     logging.info(f"Updating database for report {payload.reportId}")
+    # Copy: chart_json may be the cached entry shared with other reports
+    chart_json = {**chart_json, "timings": trace.to_dict()}
     update_data = {
         "processing_status": "completed",
-        "report_pdf_path": pdf_path,
-        "image_paths": image_paths,
+        "processing_stage": "completed",
+        "processing_progress": 100,
     }
+    if pdf_path:
+        update_data.update({"report_pdf_path": pdf_path, "image_paths": image_paths})
     
     # Only update text_summary and chart_data if we generated them (not using pre-computed)
     if not payload.skipAI:
@@ -223,7 +496,26 @@ def analyze(payload: AnalyzePayload, authorization: str = Header(None)):
     else:
         logging.info(f"Using pre-computed insights from process-spreadsheet")
     
-    supa.update_report(payload.reportId, update_data)
+    with trace.span("db_update"):
+        db.update_report(payload.reportId, update_data)
     
+    logging.info(f"Stage timings [{trace.request_id}]: {trace.summary()}")
     logging.info(f"=== Analysis Completed Successfully for report {payload.reportId} ===")
     return {"ok": True, "pdf": pdf_path, "images": image_paths, "summary": summary_json, "chart_data": chart_json}
+
+jobs = JobQueue(
+    analyze_job,
+    workers=int(os.environ.get("ANALYZE_WORKERS", "2")),
+    max_depth=int(os.environ.get("ANALYZE_QUEUE_DEPTH", "20")),
+    on_progress=report_progress,
+)
+# Batch items get their own workers so a large batch neither waits behind nor starves single /analyze jobs;
+# the stage limits above are shared by both queues
+batch_jobs = JobQueue(
+    analyze_batch_item,
+    workers=int(os.environ.get("BATCH_WORKERS", "16")),
+    max_depth=int(os.environ.get("BATCH_QUEUE_DEPTH", "200")),
+    on_progress=lambda job: report_progress(job, db=report_updates),
+)
+register(Gauge("eda_job_queue_depth", "Analysis jobs waiting for a worker", lambda: jobs.depth))
+register(Gauge("eda_batch_queue_depth", "Batch analysis items waiting for a worker", lambda: batch_jobs.depth))
@@ -0,0 +1,156 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = tuple(float(2 ** p) for p in range(20, 33, 2))  # 1 MiB .. 4 GiB
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Histogram:
+    """Prometheus-style cumulative histogram with labels."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # counts per bucket + [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            s = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for key, s in sorted(series.items()):
+            for b, c in zip(self.buckets, s):
+                le = f'le="{b:g}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {c:g}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {s[-1]:g}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {s[-2]:g}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {s[-1]:g}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {v:g}" for k, v in sorted(values.items())]
+        return lines
+
+class Gauge:
+    """Gauge read from a callback at scrape time."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.fn():g}"]
+
+REGISTRY: List[Any] = []
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for m in REGISTRY:
+        lines += m.render()
+    return "\n".join(lines) + "\n"
+
+STAGE_SECONDS = register(Histogram("eda_stage_seconds", "Wall time per pipeline stage", ["stage"]))
+STAGE_RSS_BYTES = register(Histogram("eda_stage_rss_growth_bytes", "Resident memory growth per pipeline stage",
+                                     ["stage"], BYTES_BUCKETS))
+JOBS = register(Counter("eda_jobs_total", "Finished analysis jobs", ["status"]))
+
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def rss_bytes() -> int:
+    """Current resident set size (Linux); 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+class Trace:
+    """Spans of one analysis, keyed to a request ID; every span also feeds the stage histograms.
+
+    Span names are used as the histogram label, so keep them to a fixed set
+    (put per-item detail such as an upload path in attributes).
+
+    Thread-safe: uploads and LLM calls record spans from pool threads.
+    """
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, rss_growth: Optional[int] = None, start: Optional[float] = None, **attrs: Any) -> None:
+        STAGE_SECONDS.observe(seconds, stage=name)
+        span = {"name": name, "start": round((start or time.perf_counter() - seconds) - self.started, 4),
+                "seconds": round(seconds, 4)}
+        if rss_growth is not None:
+            STAGE_RSS_BYTES.observe(max(rss_growth, 0), stage=name)
+            span["rss_growth_mb"] = round(rss_growth / 1024 / 1024, 2)
+        span.update(attrs)
+        with self._lock:
+            self.spans.append(span)
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+        """Time the block; attributes added to the yielded dict end up on the span."""
+        rss0 = rss_bytes()
+        t0 = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException:
+            attrs["error"] = True
+            raise
+        finally:
+            self.record(name, time.perf_counter() - t0, rss_bytes() - rss0 if rss0 else None, start=t0, **attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start"])
+        return {"request_id": self.request_id, "total_seconds": round(time.perf_counter() - self.started, 4), "spans": spans}
+
+    def summary(self) -> str:
+        with self._lock:
+            return ", ".join(f"{s['name']}={s['seconds']:.3f}s" for s in self.spans)
@@ -0,0 +1,187 @@
+from __future__ import annotations
+import csv
+import importlib.util
+import io
+import json
+import os
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+
+# Leading bytes of the container formats we accept
+ZIP_MAGIC = b"PK\x03\x04"                         # xlsx / xlsm / ods
+OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"   # legacy xls
+ARROW_MAGIC = b"ARROW1"                           # Arrow IPC file (our dataset snapshots)
+
+# Schema metadata key holding the snapshot's header and schema mapping
+SNAPSHOT_META = b"eda.snapshot"
+
+SNIFF_BYTES = 64 * 1024
+
+# Raw bytes, a filesystem path, or a seekable binary file object
+Source = Union[bytes, str, os.PathLike, BinaryIO]
+DELIMITERS = ",;\t|"
+
+# python-calamine parses workbooks in Rust and is several times faster than openpyxl
+EXCEL_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else None
+
+def sniff_format(head: bytes) -> str:
+    """Classify an upload from its leading bytes as 'excel', 'arrow' or 'csv'."""
+    if head.startswith(ZIP_MAGIC) or head.startswith(OLE_MAGIC):
+        return "excel"
+    if head.startswith(ARROW_MAGIC):
+        return "arrow"
+    if b"\x00" in head:
+        raise ValueError("Unsupported file format")
+    return "csv"
+
+def decode_sample(head: bytes) -> tuple[str, str]:
+    try:
+        return head.decode("utf-8-sig"), "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut at the sample boundary is still UTF-8
+        if e.start >= len(head) - 3:
+            return head[:e.start].decode("utf-8-sig"), "utf-8-sig"
+    return head.decode("latin-1"), "latin-1"
+
+def sniff_delimiter(sample: str) -> str:
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        first = sample.splitlines()[0] if sample else ""
+        return max(DELIMITERS, key=first.count)
+
+def as_input(source: Source) -> Union[str, os.PathLike, BinaryIO]:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)  # shares the caller's buffer until written to
+    return source
+
+def read_head(src: Union[str, os.PathLike, BinaryIO], n: int = SNIFF_BYTES) -> bytes:
+    if isinstance(src, (str, os.PathLike)):
+        with open(src, "rb") as f:
+            return f.read(n)
+    src.seek(0)
+    head = src.read(n)
+    src.seek(0)
+    return head
+
+def first_nonempty_sheet(xls: pd.ExcelFile) -> Optional[Tuple[str, List[Any]]]:
+    for sh in xls.sheet_names:
+        # Only the header and the first data row are parsed here
+        peek = xls.parse(sh, nrows=1)
+        if len(peek) > 0:
+            return sh, list(peek.columns)
+    return None
+
+def write_snapshot(df: pd.DataFrame, sink: BinaryIO, meta: Dict[str, Any]) -> None:
+    """Write `df` as an uncompressed Arrow IPC file (memory-mappable) with `meta` in the schema metadata."""
+    import pyarrow as pa
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, SNAPSHOT_META: json.dumps(meta).encode()})
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+class TableReader:
+    """Opens an upload once: exposes its header, then loads selected columns on demand.
+
+    Arrow snapshots (see write_snapshot) are memory-mapped when given as a
+    path; their stored metadata is exposed as `snapshot`.
+    """
+
+    def __init__(self, source: Source):
+        self.src = as_input(source)
+        head = read_head(self.src)
+        self.kind = sniff_format(head[:4096])
+        self._xls: Optional[pd.ExcelFile] = None
+        self.snapshot: Optional[Dict[str, Any]] = None
+        if self.kind == "arrow":
+            import pyarrow as pa
+            if isinstance(self.src, (str, os.PathLike)):
+                data = pa.memory_map(str(self.src))
+            else:
+                self.src.seek(0)
+                data = pa.PythonFile(self.src, mode="r")
+            self._ipc = pa.ipc.open_file(data)
+            meta = self._ipc.schema.metadata or {}
+            if SNAPSHOT_META not in meta:
+                raise ValueError("Unsupported file format")
+            self.snapshot = json.loads(meta[SNAPSHOT_META])
+            self.columns = list(self._ipc.schema.names)
+        elif self.kind == "excel":
+            self._xls = pd.ExcelFile(self.src, engine=EXCEL_ENGINE)
+            found = first_nonempty_sheet(self._xls)
+            if found is None:
+                self.close()
+                raise ValueError("No non-empty sheets found")
+            self.sheet, self.columns = found
+        else:
+            text, self.encoding = decode_sample(head)
+            self.sep = sniff_delimiter(text)
+            self.columns = list(self._read_csv(nrows=0).columns)
+
+    def _read_csv(self, **kwargs):
+        if not isinstance(self.src, (str, os.PathLike)):
+            self.src.seek(0)
+        return pd.read_csv(self.src, sep=self.sep, encoding=self.encoding, low_memory=False,
+                           memory_map=isinstance(self.src, (str, os.PathLike)), **kwargs)
+
+    def load(self, usecols: Optional[List[Any]] = None, categorical: Iterable[Any] = (), skip_rows: int = 0) -> pd.DataFrame:
+        """Parse the table, optionally only `usecols`, with `categorical` columns as category dtype.
+
+        `skip_rows` drops that many data rows after the header (CSV skips them without converting).
+        """
+        skiprows = range(1, skip_rows + 1) if skip_rows else None
+        if self.kind == "arrow":
+            table = self._ipc.read_all()  # zero-copy over the memory map
+            if usecols is not None:
+                table = table.select([c for c in usecols if c in self.columns])
+            # Each column keeps its own block, so numeric columns without nulls stay views of the map
+            df = table.slice(skip_rows).to_pandas(split_blocks=True)
+        elif self.kind == "excel":
+            df = self._xls.parse(self.sheet, usecols=usecols, skiprows=skiprows)
+            for c in categorical:
+                if c in df and df[c].dtype == object:
+                    df[c] = df[c].astype("category")
+        else:
+            # CSV columns are dictionary-encoded while parsing, never materialized as objects
+            df = self._read_csv(usecols=usecols, dtype={c: "category" for c in categorical} or None, skiprows=skiprows)
+            if len(df) == 0 and not skip_rows:
+                raise ValueError("No data rows found")
+        return df
+
+    def chunks(self, chunk_rows: int, usecols: Optional[List[Any]] = None, categorical: Iterable[Any] = ()) -> Iterator[pd.DataFrame]:
+        """Yield the table in frames of at most `chunk_rows` rows; like `load` otherwise.
+
+        Workbooks cannot be parsed incrementally and come back as a single frame.
+        """
+        if self.kind != "csv":
+            yield self.load(usecols, categorical)
+            return
+        with self._read_csv(usecols=usecols, dtype={c: "category" for c in categorical} or None,
+                            chunksize=chunk_rows) as frames:
+            yield from frames
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the upload in bytes."""
+        if isinstance(self.src, (str, os.PathLike)):
+            return os.path.getsize(self.src)
+        pos = self.src.tell()
+        size = self.src.seek(0, os.SEEK_END)
+        self.src.seek(pos)
+        return size
+
+    def close(self) -> None:
+        if self._xls is not None:
+            self._xls.close()
+
+    def __enter__(self) -> TableReader:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def read_dataset(source: Source) -> pd.DataFrame:
+    """Load the first sheet with data rows from a workbook, or a CSV/TSV upload."""
+    with TableReader(source) as reader:
+        return reader.load()
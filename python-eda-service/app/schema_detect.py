@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Optional, Dict, List
+from typing import Iterable, Optional, Dict, List, Union
 import pandas as pd
 
 CANDIDATES = {
@@ -18,8 +18,11 @@ CANDIDATES = {
     'rep': ["rep","sales rep","salesperson","agent"]
 }
 
-def find_col(df: pd.DataFrame, keys: List[str]) -> Optional[str]:
-    cols = [c for c in df.columns if isinstance(c, str)]
+# Columns EDA reads as dictionary-encoded categoricals
+CATEGORICAL = ('customer', 'product', 'category', 'subcat', 'region', 'rep')
+
+def find_col(df: Union[pd.DataFrame, Iterable], keys: List[str]) -> Optional[str]:
+    cols = [c for c in getattr(df, "columns", df) if isinstance(c, str)]
     for c in cols:
         lc = c.strip().lower()
         for k in keys:
@@ -27,8 +30,12 @@ def find_col(df: pd.DataFrame, keys: List[str]) -> Optional[str]:
                 return c
     return None
 
-def detect_schema(df: pd.DataFrame) -> Dict[str, Optional[str]]:
+def detect_schema(df: Union[pd.DataFrame, Iterable]) -> Dict[str, Optional[str]]:
+    """Map each role in CANDIDATES to a column; accepts a DataFrame or just its header."""
     d = {}
     for name, keys in CANDIDATES.items():
         d[name] = find_col(df, keys)
-    return d
\ No newline at end of file
+    return d
+
+def used_columns(schema: Dict[str, Optional[str]]) -> List[str]:
+    return list(dict.fromkeys(c for c in schema.values() if c))
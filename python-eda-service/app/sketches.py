@@ -0,0 +1,238 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .aggregate import Reduction
+
+class SpaceSaving:
+    """Weighted Space-Saving heavy hitters: at most `capacity` labels with overestimated sums.
+
+    Updates are exact per-chunk group sums. A label not tracked before may
+    have been evicted with up to `floor` weight, so it is admitted at its
+    chunk sum plus `floor`. Every tracked estimate exceeds the true sum by at
+    most `max_error`, and any label not tracked has a true sum of at most
+    that much. Assumes non-negative weights.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.labels = np.empty(0, dtype=object)
+        self.sums = np.empty(0)
+        self.errors = np.empty(0)
+        self.total = 0.0
+        self.floor = 0.0  # bound on the sum of any untracked label
+
+    def update(self, labels: np.ndarray, weights: np.ndarray) -> None:
+        self.total += float(weights.sum())
+        known = pd.Index(self.labels)
+        pos = known.get_indexer(labels)
+        hit = pos >= 0
+        sums = self.sums.copy()
+        np.add.at(sums, pos[hit], weights[hit])
+        labels = np.concatenate([self.labels, np.asarray(labels, dtype=object)[~hit]])
+        sums = np.concatenate([sums, weights[~hit] + self.floor])
+        errors = np.concatenate([self.errors, np.full((~hit).sum(), self.floor)])
+        if len(labels) > self.capacity:
+            keep = np.argsort(-sums, kind="stable")[:self.capacity]
+            self.floor = max(self.floor, float(np.delete(sums, keep).max()))
+            keep.sort()  # keep first-seen order among ties
+            labels, sums, errors = labels[keep], sums[keep], errors[keep]
+        self.labels, self.sums, self.errors = labels, sums, errors
+
+    @property
+    def max_error(self) -> float:
+        return float(max(self.floor, self.errors.max(initial=0.0)))
+
+    def reduction(self) -> Reduction:
+        """Tracked labels as a Reduction; only `sales` is meaningful."""
+        n = len(self.labels)
+        return Reduction(self.labels, self.sums, np.full(n, np.nan), np.zeros(n, dtype="int64"))
+
+    def bounds(self) -> Dict[str, Any]:
+        return {"tracked": len(self.labels), "capacity": self.capacity, "total": self.total,
+                "max_overestimate": self.max_error, "untracked_max": self.floor}
+
+class TDigest:
+    """Merging t-digest (k1 scale) of a stream of values; memory bounded by `compression`."""
+
+    def __init__(self, compression: float = 200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+        self.sum = 0.0
+
+    @property
+    def n(self) -> float:
+        return float(self.weights.sum())
+
+    def update(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.sum += float(values.sum())
+        means = np.concatenate([self.means, values])
+        weights = np.concatenate([self.weights, np.ones(len(values))])
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        # Each centroid covers at most one unit of k(q) = compression/(2*pi) * asin(2q - 1)
+        q = (np.cumsum(weights) - weights) / weights.sum()
+        k = np.floor(self.compression / (2 * np.pi) * np.arcsin(2 * q - 1))
+        starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def cdf(self, x: np.ndarray) -> np.ndarray:
+        """Approximate number of values <= x."""
+        if not len(self.means):
+            return np.zeros(len(x))
+        mid = np.cumsum(self.weights) - self.weights / 2
+        return np.interp(x, np.r_[self.min, self.means, self.max], np.r_[0.0, mid, self.n])
+
+    def histogram(self, bins: int) -> Tuple[np.ndarray, np.ndarray, float]:
+        """Equal-width (counts, edges) like np.histogram, plus the largest bin-count error estimate.
+
+        The rank of a bin edge is interpolated between the two centroids
+        around it, so it can be off by up to half of their combined weight
+        (t-digest has no hard bound; this is the usual per-centroid estimate).
+        """
+        edges = np.linspace(self.min, self.max, bins + 1)
+        counts = np.diff(self.cdf(edges))
+        i = np.searchsorted(self.means, edges)
+        w = np.r_[0.0, self.weights, 0.0]
+        edge_error = (w[i] + w[i + 1]) / 2
+        edge_error[[0, -1]] = 0.0  # min and max are exact
+        return counts, edges, float((edge_error[:-1] + edge_error[1:]).max())
+
+    def bounds(self) -> Dict[str, Any]:
+        return {"centroids": len(self.means), "compression": self.compression, "values": self.n}
+
+class HyperLogLog:
+    """Distinct count estimate from 2**p one-byte registers (relative standard error 1.04 / sqrt(2**p)).
+
+    Keys are hashed by their text, with integral floats written as integers,
+    so an ID read as 1001 in one chunk and 1001.0 or "1001" in another is
+    counted once.
+    """
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    @staticmethod
+    def _text(keys: pd.Series) -> np.ndarray:
+        keys = keys.dropna()
+        if pd.api.types.is_float_dtype(keys.dtype) and np.all(np.mod(keys.to_numpy(), 1) == 0):
+            keys = keys.astype("int64")
+        return keys.astype(str).to_numpy(dtype=object)
+
+    def update(self, keys: pd.Series) -> None:
+        text = self._text(keys)
+        if not len(text):
+            return
+        h = pd.util.hash_array(text)
+        rest_bits = 64 - self.p
+        index = (h >> np.uint64(rest_bits)).astype(np.intp)
+        # Rank = position of the first set bit in the remaining bits; frexp is exact below 2**53
+        _, exponent = np.frexp((h & np.uint64((1 << rest_bits) - 1)).astype("float64"))
+        rank = (rest_bits + 1 - exponent).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / float(np.ldexp(1.0, -self.registers.astype(int)).sum())
+        zeros = int((self.registers == 0).sum())
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)  # linear counting is more accurate for small counts
+        return raw
+
+    def bounds(self) -> Dict[str, Any]:
+        return {"estimate": self.estimate(), "relative_std_error": self.relative_error, "registers": len(self.registers)}
+
+class RunTotals:
+    """Sums of contiguous runs of equal keys in a stream of chunks.
+
+    The run still open at the end of a chunk is carried over to the next
+    one, so a key whose rows are adjacent gets one total even when a chunk
+    boundary splits it. Rows with a missing key are skipped.
+    """
+
+    def __init__(self):
+        self.open: Optional[Tuple[Any, float]] = None
+
+    def update(self, keys: pd.Series, values: np.ndarray) -> np.ndarray:
+        """Totals of the runs closed by this chunk."""
+        present = keys.notna().to_numpy()
+        keys, values = keys.to_numpy(dtype=object)[present], values[present]
+        if not len(keys):
+            return np.empty(0)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        sums = np.add.reduceat(values, starts)
+        if self.open is not None:
+            if self.open[0] == keys[0]:
+                sums[0] += self.open[1]
+                closed = sums[:-1]
+            else:
+                closed = np.r_[self.open[1], sums[:-1]]
+        else:
+            closed = sums[:-1]
+        self.open = (keys[starts[-1]], float(sums[-1]))
+        return closed
+
+    def finish(self) -> np.ndarray:
+        closed = np.array([self.open[1]]) if self.open is not None else np.empty(0)
+        self.open = None
+        return closed
+
+@dataclass
+class Sketches:
+    """Fixed-size summaries used in approximate mode instead of exact per-label reductions."""
+    customer: Optional[SpaceSaving]
+    category: Optional[SpaceSaving]
+    orders: Optional[TDigest]           # values of runs of adjacent rows with the same order ID
+    order_ids: Optional[HyperLogLog]    # distinct order IDs, wherever their rows are
+    order_runs: RunTotals = field(default_factory=RunTotals)
+    points_seen: int = 0        # rows offered to the bubble-chart reservoir
+
+    @classmethod
+    def for_schema(cls, schema: Dict[str, Optional[str]], top_k: int = 1000, compression: float = 200) -> Sketches:
+        return cls(SpaceSaving(top_k) if schema.get('customer') else None,
+                   SpaceSaving(top_k) if any(schema.get(k) for k in ('category', 'subcat', 'product')) else None,
+                   TDigest(compression) if schema.get('order_id') else None,
+                   HyperLogLog() if schema.get('order_id') else None)
+
+    def order_count(self) -> Optional[float]:
+        """Estimated number of distinct orders (None without an order ID column)."""
+        return self.order_ids.estimate() if self.order_ids is not None else None
+
+    def bounds(self, hist_bins: int, sample_size: int) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        if self.customer is not None:
+            out["customer_ranking"] = self.customer.bounds()
+        if self.category is not None:
+            out["category_ranking"] = self.category.bounds()
+        if self.orders is not None and self.orders.n:
+            distinct = self.order_ids.bounds()
+            # The histogram counts runs of adjacent rows; an order whose rows are split into k runs
+            # is missing from its bin and adds k runs elsewhere, at most 2 * (k - 1) misplaced counts
+            low = distinct["estimate"] * (1 - 3 * distinct["relative_std_error"])
+            extra_runs = max(self.orders.n - low, 0.0)
+            out["order_values"] = {**self.orders.bounds(), "orders_from_adjacent_rows": True,
+                                   "split_runs_max": extra_runs,
+                                   "max_bin_count_error": self.orders.histogram(hist_bins)[2] + 2 * extra_runs}
+            # Average order value divides the exact sales of rows with an order ID by the distinct estimate
+            out["distinct_orders"] = distinct
+            out["average_order_value"] = {"relative_std_error": distinct["relative_std_error"]}
+        out["bubble_sample"] = {"points": min(sample_size, self.points_seen), "of": self.points_seen}
+        return out
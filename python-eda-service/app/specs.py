@@ -0,0 +1,102 @@
+from __future__ import annotations
+import hashlib
+import json
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+@dataclass(frozen=True)
+class Preset:
+    dpi: int
+    suffix: str                 # appended to the file stem, '' for the main image
+
+PRESETS = {
+    "full": Preset(180, ""),
+    "thumb": Preset(48, "_thumb"),
+}
+
+# Comma separated format:preset pairs written for every chart, e.g. "png:full,webp:full,webp:thumb,svg".
+# The PDF report page is always produced.
+CHART_OUTPUTS = os.environ.get("CHART_OUTPUTS", "png:full")
+WEBP_QUALITY = int(os.environ.get("WEBP_QUALITY", "80"))
+
+def parse_outputs(value: str) -> List[Tuple[str, Preset]]:
+    outputs = []
+    for item in value.split(","):
+        fmt, _, preset = item.strip().lower().partition(":")
+        if fmt not in ("png", "webp", "svg"):
+            raise ValueError(f"Unsupported chart format: {fmt}")
+        outputs.append((fmt, PRESETS[preset or "full"]))
+    return outputs
+
+OUTPUTS = parse_outputs(CHART_OUTPUTS)
+# Part of the result cache key: changing the outputs changes the artifacts
+OUTPUT_SIGNATURE = f"{CHART_OUTPUTS};q={WEBP_QUALITY}"
+
+def output_name(key: str, fmt: str, preset: Preset) -> str:
+    return f"{key}{preset.suffix}.{fmt}"
+
+def output_names(key: str) -> List[str]:
+    """Image file names written for the chart `key` with the configured outputs."""
+    return [output_name(key, fmt, preset) for fmt, preset in OUTPUTS]
+
+@dataclass(frozen=True)
+class ChartSpec:
+    """Picklable description of one chart, built from already aggregated data."""
+    name: str                   # image file name, e.g. 'trend_sales.png'
+    title: str                  # page title (suptitle)
+    kind: str                   # key into charts.DRAWERS
+    data: Dict[str, Any]        # small arrays / lists consumed by the drawer
+    axes: Dict[str, str] = field(default_factory=dict)  # title, xlabel, ylabel
+    figsize: Tuple[float, float] = (10, 6)
+
+    @property
+    def key(self) -> str:
+        return self.name.rsplit(".", 1)[0]
+
+def _values(a, digits: int = 2) -> List[Any]:
+    arr = np.asarray(a)
+    if np.issubdtype(arr.dtype, np.datetime64):
+        return [str(d) for d in arr.astype("datetime64[D]")]
+    if np.issubdtype(arr.dtype, np.number):
+        # null rather than NaN/inf, which json.dumps would write as invalid JSON
+        return [v if math.isfinite(v) else None for v in np.round(arr.astype("float64"), digits).tolist()]
+    return [str(v) for v in arr]
+
+def spec_series(spec: ChartSpec) -> Dict[str, Any]:
+    """JSON-ready series for drawing `spec` client-side."""
+    d = spec.data
+    out: Dict[str, Any] = {"kind": spec.kind, "title": spec.title, **spec.axes}
+    if spec.kind == "line":
+        out.update(x=_values(d["x"]), y=_values(d["y"]))
+    elif spec.kind in ("bar", "pareto"):
+        out.update(labels=_values(d["labels"]), values=_values(d["values"]))
+        if spec.kind == "pareto":
+            out["cumulative"] = _values(d["cumulative"], 4)
+    elif spec.kind == "hist":
+        out.update(edges=_values(d["edges"]), counts=_values(d["counts"], 0))
+    elif spec.kind == "density":
+        # rows/sales are [y][x] grids of shares, one cell per pair of adjacent edges
+        out.update(x_edges=_values(d["x_edges"]), y_edges=_values(d["y_edges"]),
+                   rows=[_values(r, 4) for r in d["rows"]], sales=[_values(r, 4) for r in d["sales"]])
+    return out
+
+def chart_series(specs: List[ChartSpec]) -> Dict[str, Dict[str, Any]]:
+    return {s.key: spec_series(s) for s in specs}
+
+def spec_fingerprint(spec: ChartSpec) -> str:
+    """Hash of everything that affects the rendered chart, including the output config."""
+    h = hashlib.sha256(json.dumps([spec.name, spec.title, spec.kind, spec.axes, list(spec.figsize), OUTPUT_SIGNATURE]).encode())
+    for k in sorted(spec.data):
+        a = np.asarray(spec.data[k])
+        # Normalized so the same values hash alike whether aggregated now or restored from saved state
+        if a.dtype.kind in "iuf":
+            a = a.astype("float64")
+        elif a.dtype.kind == "M":
+            a = a.astype("datetime64[ns]")
+        h.update(f"\0{k}:{a.dtype}:{a.shape}".encode())
+        h.update("\x1f".join(map(str, a.tolist())).encode() if a.dtype == object else a.tobytes())
+    return h.hexdigest()
@@ -0,0 +1,49 @@
+from __future__ import annotations
+import os
+import tempfile
+from typing import BinaryIO, Iterable, Optional
+
+# Payloads up to this size stay in memory; larger ones roll over to a temp file on disk
+SPOOL_MEMORY_BYTES = int(os.environ.get("SPOOL_MEMORY_MB", "8")) * 1024 * 1024
+CHUNK_BYTES = 1024 * 1024
+
+class PayloadTooLarge(ValueError):
+    pass
+
+def new_spool() -> BinaryIO:
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+
+class LimitedSpool:
+    """Spooled temp file that refuses to grow past max_bytes."""
+
+    def __init__(self, max_bytes: Optional[int] = None, declared: Optional[int] = None):
+        if max_bytes and declared and declared > max_bytes:
+            raise PayloadTooLarge(f"File is {declared} bytes, limit is {max_bytes}")
+        self.max_bytes = max_bytes
+        self.total = 0
+        self.file = new_spool()
+
+    def write(self, chunk: bytes) -> None:
+        self.total += len(chunk)
+        if self.max_bytes and self.total > self.max_bytes:
+            self.file.close()
+            raise PayloadTooLarge(f"File exceeds the {self.max_bytes} byte limit")
+        self.file.write(chunk)
+
+    def finish(self) -> BinaryIO:
+        self.file.seek(0)
+        return self.file
+
+def spool_chunks(chunks: Iterable[bytes], max_bytes: Optional[int] = None, declared: Optional[int] = None) -> BinaryIO:
+    """Write a stream of chunks to a spooled temp file, aborting once it exceeds max_bytes."""
+    spool = LimitedSpool(max_bytes, declared)
+    for chunk in chunks:
+        spool.write(chunk)
+    return spool.finish()
+
+def stream_size(f: BinaryIO) -> int:
+    pos = f.tell()
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(pos)
+    return size
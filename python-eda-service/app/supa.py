@@ -1,36 +1,302 @@
-import requests
+import asyncio
 import json
-from typing import Optional
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .spool import CHUNK_BYTES, LimitedSpool, spool_chunks
+
+RETRY_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+# (object path, bytes or a seekable binary stream, content type)
+UploadItem = Tuple[str, Union[bytes, BinaryIO], str]
+
+class SupaError(RuntimeError):
+    """Unexpected response status from Supabase."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+def upload_ok(status: int, text: str) -> bool:
+    if status not in (200, 201, 204):
+        raise SupaError(f"Upload failed: {status} {text}", status)
+    return True
+
+def update_ok(status: int, text: str) -> dict:
+    if status not in (200, 204):
+        raise SupaError(f"Failed to update report: {status} {text}", status)
+    return json.loads(text) if text else {}
+
+def retryable(error: Exception) -> bool:
+    """Whether a failed request may succeed later: connection errors, timeouts, 5xx and 408/425/429."""
+    if isinstance(error, requests.RequestException):
+        return True
+    status = getattr(error, "status", None)
+    return status is not None and (status >= 500 or status in RETRY_STATUSES)
 
 class Supa:
-    def __init__(self, url: str, service_key: str):
+    """Supabase storage/REST client on a pooled keep-alive session."""
+
+    def __init__(self, url: str, service_key: str, pool_size: int = 16, upload_concurrency: int = 8,
+                 max_retries: int = 3, backoff: float = 0.5):
         self.url = url.rstrip("/")
         self.service_key = service_key
         self.headers = {
             "apikey": self.service_key,
             "Authorization": f"Bearer {self.service_key}",
         }
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        # Storage PUT (upsert) and the report PATCH are idempotent, so every method may be retried
+        retry = Retry(total=max_retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=None, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Grouped updates are retried by ReportUpdates with its own backoff; retrying here as well
+        # would multiply the attempts, so they go out once
+        self._once = requests.Session()
+        self._once.headers.update(self.headers)
+        once = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+        self._once.mount("http://", once)
+        self._once.mount("https://", once)
+        self._uploads = ThreadPoolExecutor(max_workers=upload_concurrency, thread_name_prefix="supa-upload")
 
-    def download(self, path: str) -> Optional[bytes]:
+    def download(self, path: str, max_bytes: Optional[int] = None) -> Optional[BinaryIO]:
+        """Stream an object into a spooled temp file; None if it does not exist."""
         bucket, obj_path = path.split("/", 1)
         endpoint = f"{self.url}/storage/v1/object/{bucket}/{obj_path}"
-        r = requests.get(endpoint, headers=self.headers, timeout=60)
-        return r.content if r.status_code == 200 else None
+        with self.session.get(endpoint, timeout=60, stream=True) as r:
+            if r.status_code != 200:
+                return None
+            declared = int(r.headers.get("Content-Length") or 0)
+            return spool_chunks(r.iter_content(CHUNK_BYTES), max_bytes, declared)
 
-    def upload(self, bucket: str, path: str, data: bytes, content_type="application/octet-stream") -> bool:
+    def exists(self, bucket: str, path: str) -> bool:
         endpoint = f"{self.url}/storage/v1/object/{bucket}/{path}"
-        headers = dict(self.headers)
-        headers["Content-Type"] = content_type
-        r = requests.put(endpoint, headers=headers, data=data, timeout=120)
-        if r.status_code not in (200, 201, 204):
-            raise RuntimeError(f"Upload failed: {r.status_code} {r.text}")
-        return True
+        r = self.session.head(endpoint, timeout=30)
+        return r.status_code == 200
+
+    def upload(self, bucket: str, path: str, data: Union[bytes, BinaryIO], content_type="application/octet-stream") -> bool:
+        endpoint = f"{self.url}/storage/v1/object/{bucket}/{path}"
+        if hasattr(data, "seek"):
+            data.seek(0)  # streamed from the file; urllib3 rewinds it again on retries
+        r = self.session.put(endpoint, headers={"Content-Type": content_type}, data=data, timeout=120)
+        return upload_ok(r.status_code, r.text)
+
+    def upload_many(self, bucket: str, items: Iterable[UploadItem],
+                    on_uploaded: Optional[Callable[[str, float], None]] = None) -> List[str]:
+        """Upload all items concurrently (bounded by upload_concurrency); returns their paths in order.
+
+        `on_uploaded(path, seconds)` is called from the upload thread after each upload.
+        """
+        items = list(items)
+
+        def one(path: str, data, ct: str) -> None:
+            t0 = time.perf_counter()
+            self.upload(bucket, path, data, ct)
+            if on_uploaded:
+                on_uploaded(path, time.perf_counter() - t0)
+
+        futures = [self._uploads.submit(one, path, data, ct) for path, data, ct in items]
+        for f in futures:
+            f.result()
+        return [path for path, _, _ in items]
 
     def update_report(self, report_id: str, payload: dict):
         endpoint = f"{self.url}/rest/v1/reports?id=eq.{report_id}"
-        headers = dict(self.headers)
-        headers.update({"Content-Type": "application/json", "Prefer": "return=representation"})
-        r = requests.patch(endpoint, headers=headers, data=json.dumps(payload), timeout=30)
-        if r.status_code not in (200, 204):
-            raise RuntimeError(f"Failed to update report: {r.status_code} {r.text}")
-        return r.json() if r.text else {}
+        headers = {"Content-Type": "application/json", "Prefer": "return=representation"}
+        r = self.session.patch(endpoint, headers=headers, data=json.dumps(payload), timeout=30)
+        return update_ok(r.status_code, r.text)
+
+    def update_reports(self, report_ids: List[str], payload: dict):
+        """Apply the same update to several reports in one request, without retries (see ReportUpdates)."""
+        ids = ",".join(f'"{i}"' for i in report_ids)
+        endpoint = f"{self.url}/rest/v1/reports?id=in.({ids})"
+        headers = {"Content-Type": "application/json", "Prefer": "return=minimal"}
+        r = self._once.patch(endpoint, headers=headers, data=json.dumps(payload), timeout=30)
+        return update_ok(r.status_code, r.text)
+
+    def close(self) -> None:
+        self._uploads.shutdown(wait=False)
+        self.session.close()
+        self._once.close()
+
+class ReportUpdates:
+    """Drop-in for Supa.update_report that buffers updates and sends them grouped.
+
+    Pending updates for the same report merge (later keys win), so progress
+    steps between flushes collapse into one write, and reports whose pending
+    updates are identical share one `id=in.(...)` request. A daemon thread
+    flushes every `interval` seconds. Updates that fail with a connection
+    error or a retryable status are sent again after an exponential backoff,
+    at most `max_attempts` times; other failures (4xx) are logged and dropped.
+    """
+
+    def __init__(self, supa: Supa, interval: float = 1.0, max_ids: int = 100,
+                 max_attempts: int = 5, backoff: float = 1.0):
+        self.supa = supa
+        self.interval = interval
+        self.max_ids = max_ids
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._pending: Dict[str, dict] = {}
+        self._sending: Dict[str, dict] = {}             # taken by the flush in progress
+        self._retries: Dict[str, Tuple[int, float]] = {}  # report id -> (failed attempts, monotonic time of next try)
+        self._dropped: Dict[str, Exception] = {}        # last update given up on, until wait() reports it
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        threading.Thread(target=self._run, name="report-updates", daemon=True).start()
+
+    def update_report(self, report_id: str, payload: dict) -> None:
+        with self._lock:
+            self._pending.setdefault(report_id, {}).update(payload)
+
+    def flush(self, force: bool = False) -> int:
+        """Send everything pending (with `force`, also updates still backing off); returns the number of requests made."""
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._lock:
+                due = [r for r in self._pending if force or self._retries.get(r, (0, 0.0))[1] <= now]
+                self._sending = {r: self._pending.pop(r) for r in due}
+            groups: Dict[str, List[str]] = {}
+            for report_id, payload in self._sending.items():
+                groups.setdefault(json.dumps(payload, sort_keys=True), []).append(report_id)
+            sent = 0
+            try:
+                for ids in groups.values():
+                    for i in range(0, len(ids), self.max_ids):
+                        chunk = ids[i:i + self.max_ids]
+                        try:
+                            self.supa.update_reports(chunk, self._sending[chunk[0]])
+                            sent += 1
+                        except Exception as e:
+                            self._failed(chunk, e)
+                        else:
+                            with self._lock:
+                                for report_id in chunk:
+                                    self._retries.pop(report_id, None)
+                                    self._dropped.pop(report_id, None)
+            finally:
+                with self._lock:
+                    self._sending = {}
+                    self._changed.notify_all()
+            return sent
+
+    def _failed(self, chunk: List[str], error: Exception) -> None:
+        attempts = max(self._retries.get(r, (0, 0.0))[0] for r in chunk) + 1
+        if retryable(error) and attempts < self.max_attempts:
+            delay = self.backoff * 2 ** (attempts - 1)
+            logging.warning(f"Grouped update of {len(chunk)} reports failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+            with self._lock:
+                for report_id in chunk:
+                    self._pending[report_id] = {**self._sending[report_id], **self._pending.get(report_id, {})}
+                    self._retries[report_id] = (attempts, time.monotonic() + delay)
+            return
+        logging.error(f"Dropping update of reports {', '.join(chunk)} after {attempts} attempt(s): "
+                      f"{self._sending[chunk[0]]}: {error}")
+        with self._lock:
+            for report_id in chunk:
+                self._retries.pop(report_id, None)
+                self._dropped[report_id] = error
+
+    def wait(self, report_id: str, timeout: Optional[float] = None) -> bool:
+        """Block until no update of `report_id` is pending; False if the last one was dropped (or on timeout)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while report_id in self._pending or report_id in self._sending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            return self._dropped.pop(report_id, None) is None
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Report update flush crashed: {e}", exc_info=True)
+
+class AsyncSupa:
+    """asyncio counterpart of Supa for use directly on the FastAPI event loop.
+
+    Requests share one pooled keep-alive client. Retries (connection errors
+    and RETRY_STATUSES, with jittered exponential backoff) happen in
+    `_request` only; the transport itself does not retry.
+    """
+
+    def __init__(self, url: str, service_key: str, pool_size: int = 16, upload_concurrency: int = 8,
+                 max_retries: int = 3, backoff: float = 0.5):
+        self.url = url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.upload_concurrency = upload_concurrency
+        self.client = httpx.AsyncClient(
+            headers={"apikey": service_key, "Authorization": f"Bearer {service_key}"},
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def _request(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            try:
+                r = await self.client.request(method, endpoint, **kwargs)
+                if r.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return r
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            await asyncio.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+        raise AssertionError("unreachable")
+
+    async def download(self, path: str, max_bytes: Optional[int] = None) -> Optional[BinaryIO]:
+        """Stream an object into a spooled temp file; None if it does not exist."""
+        bucket, obj_path = path.split("/", 1)
+        endpoint = f"{self.url}/storage/v1/object/{bucket}/{obj_path}"
+        async with self.client.stream("GET", endpoint, timeout=60) as r:
+            if r.status_code != 200:
+                return None
+            spool = LimitedSpool(max_bytes, int(r.headers.get("Content-Length") or 0))
+            async for chunk in r.aiter_bytes(CHUNK_BYTES):
+                spool.write(chunk)
+            return spool.finish()
+
+    async def upload(self, bucket: str, path: str, data: Union[bytes, BinaryIO], content_type="application/octet-stream") -> bool:
+        if hasattr(data, "read"):
+            # httpx cannot rewind a file body between our retries; report artifacts are small
+            data.seek(0)
+            data = data.read()
+        r = await self._request("PUT", f"{self.url}/storage/v1/object/{bucket}/{path}",
+                                headers={"Content-Type": content_type}, content=data, timeout=120)
+        return upload_ok(r.status_code, r.text)
+
+    async def upload_many(self, bucket: str, items: Iterable[UploadItem]) -> List[str]:
+        """Upload all items concurrently, at most upload_concurrency at a time; returns their paths in order."""
+        items = list(items)
+        sem = asyncio.Semaphore(self.upload_concurrency)
+
+        async def one(path: str, data, ct: str) -> None:
+            async with sem:
+                await self.upload(bucket, path, data, ct)
+
+        await asyncio.gather(*(one(*item) for item in items))
+        return [path for path, _, _ in items]
+
+    async def update_report(self, report_id: str, payload: dict):
+        r = await self._request("PATCH", f"{self.url}/rest/v1/reports?id=eq.{report_id}",
+                                headers={"Content-Type": "application/json", "Prefer": "return=representation"},
+                                content=json.dumps(payload), timeout=30)
+        return update_ok(r.status_code, r.text)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
@@ -0,0 +1,100 @@
+"""Synthetic sales workbooks for benchmarking.
+
+Column names are ones `detect_schema` recognises, plus a few it should ignore.
+Dates can be made messy (mixed formats, blanks, junk) the way exports from
+real spreadsheets are.
+
+Usage: python bench/generate.py out.xlsx --rows 100000 [--customers 5000] [--products 800] [--sheets 3] [--messy 0.05]
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+CATEGORIES = {
+    "Furniture": ["Chairs", "Tables", "Bookcases", "Furnishings"],
+    "Office Supplies": ["Paper", "Binders", "Storage", "Art", "Labels", "Envelopes"],
+    "Technology": ["Phones", "Accessories", "Machines", "Copiers"],
+}
+REGIONS = ["East", "West", "Central", "South", "North-East", "Pacific"]
+SHIP_MODES = ["Standard Class", "Second Class", "First Class", "Same Day"]
+DATE_FORMATS = ["%m/%d/%Y", "%d %b %Y", "%Y/%m/%d", "%B %d, %Y"]
+# Beyond this xlsx cannot hold the sheet; larger cases are written as CSV
+XLSX_MAX_ROWS = 1_000_000
+
+def make_sales(rows: int, customers: int = 2000, products: int = 500, messy: float = 0.0, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    subcats = [(cat, sub) for cat, subs in CATEGORIES.items() for sub in subs]
+    product_sub = rng.integers(0, len(subcats), products)
+    product_price = np.round(rng.lognormal(3.5, 1.0, products), 2)
+    # Zipf-ish popularity so a few customers/products dominate, like real sales data
+    cust = np.minimum(rng.zipf(1.3, rows) - 1, customers - 1)
+    prod = np.minimum(rng.zipf(1.2, rows) - 1, products - 1)
+    qty = rng.integers(1, 15, rows)
+    discount = rng.choice([0, 0, 0, 0.1, 0.2, 0.3], rows)
+    sales = np.round(product_price[prod] * qty * (1 - discount), 2)
+    profit = np.round(sales * rng.normal(0.12, 0.2, rows), 2)
+    dates = pd.Timestamp("2021-01-01") + pd.to_timedelta(np.sort(rng.integers(0, 3 * 365 * 24, rows)), unit="h")
+    df = pd.DataFrame({
+        "Order ID": [f"SO-{i:08d}" for i in np.arange(rows) // 3],
+        "Order Date": dates,
+        "Ship Mode": rng.choice(SHIP_MODES, rows),
+        "Customer Name": [f"Customer {i:06d}" for i in cust],
+        "Region": rng.choice(REGIONS, rows, p=[0.3, 0.25, 0.15, 0.15, 0.1, 0.05]),
+        "Product Name": [f"Product {i:05d}" for i in prod],
+        "Category": [subcats[product_sub[i]][0] for i in prod],
+        "Sub-Category": [subcats[product_sub[i]][1] for i in prod],
+        "Sales": sales,
+        "Quantity": qty,
+        "Discount": discount,
+        "Profit": profit,
+        "Sales Rep": rng.choice([f"Rep {i}" for i in range(25)], rows),
+        "Notes": np.where(rng.random(rows) < 0.02, "expedite", ""),
+    })
+    if messy > 0:
+        df["Order Date"] = messy_dates(df["Order Date"], messy, rng)
+    return df
+
+def messy_dates(dates: pd.Series, fraction: float, rng: np.random.Generator) -> pd.Series:
+    """Turn `fraction` of the dates into strings in other formats, blanks or junk."""
+    out = dates.astype(object)
+    idx = np.flatnonzero(rng.random(len(out)) < fraction)
+    kinds = rng.integers(0, len(DATE_FORMATS) + 2, len(idx))
+    for i, k in zip(idx, kinds):
+        if k < len(DATE_FORMATS):
+            out.iat[i] = dates.iat[i].strftime(DATE_FORMATS[k])
+        elif k == len(DATE_FORMATS):
+            out.iat[i] = None
+        else:
+            out.iat[i] = "n/a"
+    return out
+
+def write_workbook(df: pd.DataFrame, path: str, sheets: int = 1) -> str:
+    """Write `df` as xlsx (data on the second sheet when sheets > 1) or CSV; returns the path written."""
+    if path.endswith(".csv") or len(df) > XLSX_MAX_ROWS:
+        path = os.path.splitext(path)[0] + ".csv"
+        df.to_csv(path, index=False)
+        return path
+    with pd.ExcelWriter(path) as xw:
+        if sheets > 1:
+            # An empty cover sheet first, as many exported reports have
+            pd.DataFrame().to_excel(xw, sheet_name="Cover", index=False)
+        df.to_excel(xw, sheet_name="Orders", index=False)
+        for i in range(2, sheets):
+            lookup = df[["Region"]].drop_duplicates().assign(Manager=lambda d: "Manager " + d["Region"])
+            lookup.to_excel(xw, sheet_name=f"Lookup{i - 1}", index=False)
+    return path
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("out")
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--customers", type=int, default=2000)
+    ap.add_argument("--products", type=int, default=500)
+    ap.add_argument("--sheets", type=int, default=1)
+    ap.add_argument("--messy", type=float, default=0.0, help="fraction of dates to make messy")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    df = make_sales(args.rows, args.customers, args.products, args.messy, args.seed)
+    print(write_workbook(df, args.out, args.sheets))
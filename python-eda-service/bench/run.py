@@ -0,0 +1,215 @@
+"""Stage-by-stage EDA benchmark with saved baselines and regression checks.
+
+Stages: read (header + projected load), schema, coercion, aggregation, specs,
+one stage per chart, pdf, and end-to-end /analyze against a stub Supabase.
+Times are the median of --repeat runs; peak memory comes from one extra
+tracemalloc pass (kept separate so tracing does not skew the timings).
+
+Usage:
+  python bench/run.py --rows 10000 100000 --save bench/baselines/local.json
+  python bench/run.py --rows 10000 100000 --compare bench/baselines/local.json --threshold 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, HERE, os.path.join(ROOT, "scripts")]
+
+import matplotlib
+import pandas as pd
+
+from app import charts
+from app.eda import EDA_VERSION, add_helper_columns, aggregate, bubble_points, build_specs, compact, fit_density, projection
+from app.reader import TableReader
+from app.schema_detect import detect_schema
+from generate import make_sales, write_workbook
+
+Stage = Tuple[str, Callable[[], None]]
+
+def pipeline_stages(path: str) -> List[Stage]:
+    """The steps of eda_from_bytes as separately timed closures sharing one state dict."""
+    st: Dict = {}
+
+    def read_header():
+        st["reader"] = TableReader(path)
+        st["header"] = [str(c).strip() for c in st["reader"].columns]
+
+    def schema():
+        st["schema"] = detect_schema(st["header"])
+
+    def read():
+        reader = st["reader"]
+        with reader:
+            st["df"] = compact(reader.load(**projection(reader, st["header"], st["schema"])))
+
+    def coercion():
+        add_helper_columns(st["df"], st["schema"])
+
+    def aggregation():
+        st["agg"], st["cat_dim"] = aggregate(st["df"], st["schema"])
+
+    def specs():
+        st["kpi"], st["specs"] = build_specs(st["schema"], st["header"], st["agg"], st["cat_dim"],
+                                             fit_density(bubble_points(st["df"], st["schema"])))
+        st["rendered"] = []
+
+    stages = [("read_header", read_header), ("schema", schema), ("read", read),
+              ("coercion", coercion), ("aggregation", aggregation), ("specs", specs)]
+    # Charts are rendered one by one in-process (render_chart, not the pool) so each gets its own timing.
+    # Specs are only known after `specs` ran; resolve them lazily by position
+    for i, name in enumerate(CHART_NAMES):
+        def chart(i=i):
+            if i < len(st["specs"]):
+                st["rendered"].append(charts.render_chart(st["specs"][i]))
+        stages.append((f"chart:{name}", chart))
+
+    def pdf():
+        charts.merge_pdf(st["rendered"]).close()
+
+    stages.append(("pdf", pdf))
+    return stages
+
+CHART_NAMES = ["trend_sales", "trend_profit", "mix_category", "mix_region",
+               "hist_order_values", "pareto_customers", "bubble_price_qty"]
+
+def run_pipeline(path: str, traced: bool) -> Dict[str, Dict[str, float]]:
+    out = {}
+    for name, fn in pipeline_stages(path):
+        if traced:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        fn()
+        out[name] = {"seconds": time.perf_counter() - t0}
+        if traced:
+            out[name]["peak_mb"] = (tracemalloc.get_traced_memory()[1] - before) / 1024 / 1024
+    return out
+
+def load_service():
+    """Import app.main against a local stub Supabase, with the result cache and dataset snapshots disabled."""
+    import stub_supabase
+    url, _ = stub_supabase.start()
+    os.environ.update(SUPABASE_URL=url, SUPABASE_SERVICE_ROLE_KEY="bench", EDA_CACHE_DIR="",
+                      EDA_CACHE_MEMORY_MB="0", EDA_WARMUP="0", EDA_SNAPSHOT_DIR="")
+    os.environ.pop("PY_SERVICE_TOKEN", None)
+    from app import main
+    from fastapi.testclient import TestClient
+    return url, stub_supabase, TestClient(main.app)
+
+def run_analyze(service, path: str, run: int) -> float:
+    url, stub, client = service
+    with open(path, "rb") as f:
+        stub.FILES[f"/bench/{run}"] = f.read()
+    t0 = time.perf_counter()
+    r = client.post("/analyze", json={"reportId": f"bench-{run}", "userId": "bench",
+                                      "signedUrl": f"{url}/bench/{run}", "skipAI": True})
+    job_id = r.json()["jobId"]
+    while True:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.005)
+    if job["status"] != "completed":
+        raise RuntimeError(f"/analyze failed: {job['error']}")
+    return time.perf_counter() - t0
+
+def bench_case(path: str, repeat: int, service) -> Dict[str, Dict[str, float]]:
+    runs = [run_pipeline(path, traced=False) for _ in range(repeat)]
+    tracemalloc.start()
+    try:
+        traced = run_pipeline(path, traced=True)
+    finally:
+        tracemalloc.stop()
+    stages = {name: {"seconds": statistics.median(r[name]["seconds"] for r in runs),
+                     "peak_mb": round(traced[name]["peak_mb"], 2)} for name in runs[0]}
+    if service is not None:
+        stages["analyze"] = {"seconds": statistics.median(run_analyze(service, path, i) for i in range(repeat))}
+    return stages
+
+def compare(result: Dict, baseline: Dict, threshold: float, min_seconds: float) -> List[str]:
+    """Stages more than `threshold` (relative) and `min_seconds` (absolute) slower than the baseline."""
+    regressions = []
+    for case, stages in result["cases"].items():
+        base_stages = baseline.get("cases", {}).get(case)
+        if not base_stages:
+            continue
+        for name, cur in stages.items():
+            base = base_stages.get(name)
+            if not base:
+                continue
+            delta = cur["seconds"] - base["seconds"]
+            ratio = cur["seconds"] / base["seconds"] if base["seconds"] else float("inf")
+            if delta > min_seconds and ratio > 1 + threshold:
+                regressions.append(f"{case} {name}: {base['seconds']:.3f}s -> {cur['seconds']:.3f}s (+{100 * (ratio - 1):.0f}%)")
+    return regressions
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    ap.add_argument("--customers", type=int, default=2000)
+    ap.add_argument("--products", type=int, default=500)
+    ap.add_argument("--sheets", type=int, default=3)
+    ap.add_argument("--messy", type=float, default=0.02, help="fraction of messy dates")
+    ap.add_argument("--format", choices=("xlsx", "csv"), default="xlsx")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--no-analyze", action="store_true", help="skip the end-to-end /analyze stage")
+    ap.add_argument("--save", help="write results as a JSON baseline")
+    ap.add_argument("--compare", help="baseline JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=0.15, help="relative slowdown that counts as a regression")
+    ap.add_argument("--min-seconds", type=float, default=0.005, help="ignore slowdowns smaller than this")
+    args = ap.parse_args()
+
+    service = None if args.no_analyze else load_service()
+    result = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "eda_version": EDA_VERSION,
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "matplotlib": matplotlib.__version__,
+            "machine": platform.machine(),
+            "options": {k: v for k, v in vars(args).items() if k not in ("save", "compare")},
+        },
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            case = f"rows={rows},format={args.format},customers={args.customers},products={args.products}"
+            df = make_sales(rows, args.customers, args.products, args.messy)
+            path = write_workbook(df, os.path.join(tmp, f"sales_{rows}.{args.format}"), args.sheets)
+            del df
+            print(f"== {case}")
+            stages = bench_case(path, args.repeat, service)
+            result["cases"][case] = stages
+            for name, s in stages.items():
+                peak = f"{s['peak_mb']:9.1f} MB" if "peak_mb" in s else ""
+                print(f"  {name:26} {s['seconds']:8.3f}s {peak}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"saved {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.threshold, args.min_seconds)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for r in regressions:
+                print(f"  {r}")
+            return 1
+        print(f"no regressions over {args.threshold:.0%} against {args.compare}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
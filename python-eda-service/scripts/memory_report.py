@@ -0,0 +1,40 @@
+"""Compare DataFrame memory for a full load vs. the projected, compact-dtype load EDA uses.
+
+Usage: python scripts/memory_report.py path/to/workbook.xlsx [more files...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.eda import load_projected
+from app.reader import read_dataset
+
+def mb(n: int) -> str:
+    return f"{n / 1024 / 1024:8.2f} MB"
+
+def report(path: str) -> None:
+    t0 = time.perf_counter()
+    full = read_dataset(path)
+    full.columns = [str(c).strip() for c in full.columns]
+    t1 = time.perf_counter()
+    compact, schema, header = load_projected(path)
+    t2 = time.perf_counter()
+    before = int(full.memory_usage(deep=True).sum())
+    after = int(compact.memory_usage(deep=True).sum())
+    print(f"== {path}")
+    print(f"rows {len(full)}, columns {len(full.columns)} -> {len(compact.columns)} used")
+    print(f"before {mb(before)}  ({t1 - t0:.2f}s parse)")
+    print(f"after  {mb(after)}  ({t2 - t1:.2f}s parse)  {100 * (1 - after / max(before, 1)):.0f}% smaller")
+    print(f"{'column':30} {'before':>16} {'after':>16}  dtype")
+    full_usage = full.memory_usage(deep=True, index=False)
+    compact_usage = compact.memory_usage(deep=True, index=False)
+    for col in compact.columns:
+        print(f"{col[:30]:30} {mb(int(full_usage[col])):>16} {mb(int(compact_usage[col])):>16}  {compact[col].dtype}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    for p in sys.argv[1:]:
+        report(p)
@@ -0,0 +1,111 @@
+"""Measure cold-start latency: import time of app.main and time to the first finished /analyze.
+
+Each run starts a fresh interpreter against an in-process stub Supabase, so the
+numbers approximate a newly scheduled container (minus image pull).
+
+Usage: python scripts/startup_bench.py [--runs 3] [--rows 20000] [--no-warmup] [--render images|data|both]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HEAVY = ("pandas", "matplotlib", "pypdf", "PIL")
+
+def make_workbook(path: str, rows: int) -> None:
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(7)
+    df = pd.DataFrame({
+        "Order Date": pd.date_range("2023-01-01", periods=rows, freq="h"),
+        "Order ID": [f"O{i // 3}" for i in range(rows)],
+        "Customer Name": rng.choice([f"C{i}" for i in range(300)], rows),
+        "Category": rng.choice(["Furniture", "Technology", "Office Supplies"], rows),
+        "Region": rng.choice(["East", "West", "Central", "South"], rows),
+        "Quantity": rng.integers(1, 10, rows),
+        "Unit Price": rng.uniform(5, 500, rows).round(2),
+        "Profit": rng.normal(20, 50, rows).round(2),
+    })
+    df.to_excel(path, index=False)
+
+def child(workbook: str, render: str) -> dict:
+    """One cold start, run in a fresh interpreter."""
+    sys.path[:0] = [ROOT, os.path.dirname(os.path.abspath(__file__))]
+    import stub_supabase
+    url, _ = stub_supabase.start()
+    with open(workbook, "rb") as f:
+        stub_supabase.FILES["/bench.xlsx"] = f.read()
+    os.environ.update(SUPABASE_URL=url, SUPABASE_SERVICE_ROLE_KEY="bench",
+                      EDA_CACHE_DIR=tempfile.mkdtemp(prefix="eda-bench-"),
+                      EDA_SNAPSHOT_DIR=tempfile.mkdtemp(prefix="eda-bench-snapshots-"))
+    os.environ.pop("PY_SERVICE_TOKEN", None)
+
+    t0 = time.perf_counter()
+    from app import main
+    t_import = time.perf_counter()
+    loaded = [m for m in HEAVY if m in sys.modules]
+
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as client:  # runs the lifespan (warmup) like uvicorn does
+        t_ready = time.perf_counter()
+        client.get("/")
+        t_root = time.perf_counter()
+        r = client.post("/analyze", json={"reportId": "bench", "userId": "bench", "signedUrl": f"{url}/bench.xlsx",
+                                          "skipAI": True, "render": render})
+        job_id = r.json()["jobId"]
+        t_accept = time.perf_counter()
+        while True:
+            job = client.get(f"/jobs/{job_id}").json()
+            if job["status"] not in ("queued", "running"):
+                break
+            time.sleep(0.01)
+        t_done = time.perf_counter()
+    return {
+        "import_s": t_import - t0,
+        "ready_s": t_ready - t0,
+        "first_root_s": t_root - t0,
+        "first_accept_s": t_accept - t0,
+        "first_analyze_s": t_done - t0,
+        "analyze_only_s": t_done - t_ready,
+        "status": job["status"],
+        "loaded_at_import": loaded,
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--render", default="images", choices=("images", "data", "both"))
+    ap.add_argument("--no-warmup", action="store_true", help="set EDA_WARMUP=0 for the service")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.child, args.render)))
+        return
+
+    env = dict(os.environ, EDA_WARMUP="0" if args.no_warmup else "1")
+    with tempfile.TemporaryDirectory() as tmp:
+        workbook = os.path.join(tmp, "bench.xlsx")
+        make_workbook(workbook, args.rows)
+        results = []
+        for i in range(args.runs):
+            out = subprocess.run([sys.executable, __file__, "--child", workbook, "--render", args.render],
+                                 env=env, capture_output=True, text=True, check=True)
+            res = json.loads(out.stdout.strip().splitlines()[-1])
+            results.append(res)
+            print(f"run {i + 1}: import {res['import_s']:.2f}s  ready {res['ready_s']:.2f}s  "
+                  f"first / {res['first_root_s']:.2f}s  first /analyze done {res['first_analyze_s']:.2f}s  "
+                  f"({res['status']}, heavy modules at import: {', '.join(res['loaded_at_import']) or 'none'})")
+
+    print(f"median over {args.runs} runs ({args.rows} rows, render={args.render}, warmup={'off' if args.no_warmup else 'on'}):")
+    for key in ("import_s", "ready_s", "first_root_s", "first_accept_s", "first_analyze_s", "analyze_only_s"):
+        print(f"  {key:16} {statistics.median(r[key] for r in results):6.2f}s")
+
+if __name__ == "__main__":
+    main()
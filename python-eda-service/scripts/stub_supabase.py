@@ -0,0 +1,113 @@
+"""Minimal in-process stand-in for Supabase storage + REST, for local benchmarks.
+
+GET/HEAD serve objects from `FILES`, PUT/POST store them, PATCH is accepted and
+recorded in `REQUESTS`. Not a mock of Supabase semantics, just enough for main.py.
+
+For tests: `FAIL` makes the next n requests to a path answer 503, PUTs take
+`PUT_DELAY` seconds, `CALLS` records (method, path, client port, time) and
+`MAX_PUTS` the most PUTs seen in flight at once.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+FILES: Dict[str, bytes] = {}
+REQUESTS: List[Tuple[str, str]] = []
+FAIL: Dict[str, int] = {}
+PUT_DELAY = 0.0
+CALLS: List[Tuple[str, str, int, float]] = []
+MAX_PUTS = 0
+_puts = 0
+_lock = threading.Lock()
+
+def reset() -> None:
+    global PUT_DELAY, MAX_PUTS
+    for d in (FILES, REQUESTS, FAIL, CALLS):
+        d.clear()
+    PUT_DELAY, MAX_PUTS = 0.0, 0
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self) -> bytes:
+        n = int(self.headers.get("Content-Length") or 0)
+        if n:
+            return self.rfile.read(n)
+        out = b""
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return out
+                out += self.rfile.read(size)
+                self.rfile.readline()
+        return out
+
+    def _failed(self) -> bool:
+        """Record the call; answers 503 instead while FAIL has failures left for the path."""
+        path = self.path.split("?")[0]
+        with _lock:
+            CALLS.append((self.command, path, self.client_address[1], time.monotonic()))
+            if FAIL.get(path):
+                FAIL[path] -= 1
+                fail = True
+            else:
+                fail = False
+        if fail:
+            self._body()
+            self._send(503, b'{"error": "stub failure"}')
+        return fail
+
+    def _send(self, code: int, body: bytes = b"{}", ctype: str = "application/json") -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        if self._failed():
+            return
+        REQUESTS.append((self.command, self.path))
+        path = self.path.split("?")[0]
+        if path in FILES:
+            return self._send(200, FILES[path], "application/octet-stream")
+        self._send(404)
+
+    do_HEAD = do_GET
+
+    def do_PUT(self):
+        global _puts, MAX_PUTS
+        if self._failed():
+            return
+        with _lock:
+            _puts += 1
+            MAX_PUTS = max(MAX_PUTS, _puts)
+        time.sleep(PUT_DELAY)
+        with _lock:
+            _puts -= 1
+        FILES[self.path.split("?")[0]] = self._body()
+        REQUESTS.append((self.command, self.path))
+        self._send(200)
+
+    do_POST = do_PUT
+
+    def do_PATCH(self):
+        if self._failed():
+            return
+        json.loads(self._body() or b"{}")
+        REQUESTS.append((self.command, self.path))
+        self._send(200, b"[]")
+
+def start() -> Tuple[str, ThreadingHTTPServer]:
+    """Serve on a free localhost port in a daemon thread; returns (base url, server)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
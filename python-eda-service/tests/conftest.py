@@ -0,0 +1,90 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+import stub_supabase
+
+class StubProvider:
+    """OpenAI-compatible /chat/completions served from a local thread, as in scripts/stub_supabase.py.
+
+    Tests set `status`, `delay`, `answer` and `headers` for the next calls and
+    read `calls` to see how often the endpoint was hit.
+    """
+
+    def __init__(self):
+        self.status = 200
+        self.delay = 0.0
+        self.answer = {"summary": "ok"}
+        self.headers = {}
+        self.calls = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                stub.calls += 1
+                time.sleep(stub.delay)
+                if stub.status == 200:
+                    body = json.dumps({"choices": [{"message": {"content": json.dumps(stub.answer)}}]}).encode()
+                else:
+                    body = b'{"error": "stub"}'
+                self.send_response(stub.status)
+                for k, v in stub.headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stub_provider():
+    """Factory for stub provider servers; all of them are shut down after the test."""
+    servers = []
+    def make() -> StubProvider:
+        servers.append(StubProvider())
+        return servers[-1]
+    yield make
+    for s in servers:
+        s.close()
+
+@pytest.fixture(scope="session")
+def _supabase_server():
+    url, server = stub_supabase.start()
+    yield url
+    server.shutdown()
+
+@pytest.fixture
+def supabase(_supabase_server):
+    """(base url, stub module) of a local Supabase stub (scripts/stub_supabase.py), reset for each test."""
+    stub_supabase.reset()
+    return _supabase_server, stub_supabase
+
+@pytest.fixture(scope="session")
+def service(_supabase_server):
+    """app.main imported against the Supabase stub, with result cache, snapshots and warmup off."""
+    os.environ.update(SUPABASE_URL=_supabase_server, SUPABASE_SERVICE_ROLE_KEY="test", EDA_CACHE_DIR="",
+                      EDA_CACHE_MEMORY_MB="0", EDA_SNAPSHOT_DIR="", EDA_WARMUP="0", REPORT_UPDATE_INTERVAL_S="0.05")
+    for key in ("PY_SERVICE_TOKEN", "LOVABLE_API_KEY", "OPENAI_API_KEY"):
+        os.environ.pop(key, None)
+    from app import main
+    return main
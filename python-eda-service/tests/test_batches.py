@@ -0,0 +1,66 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.eda import combine_kpis
+from app.jobs import JobQueue, QueueFull
+from test_eda import sales_csv
+
+def item(url, report_id, path):
+    return {"reportId": report_id, "userId": "u1", "signedUrl": f"{url}{path}", "skipAI": True, "render": "data"}
+
+def test_submit_many_is_all_or_nothing():
+    q = JobQueue(lambda job, payload, progress: {}, workers=0, max_depth=3)
+    q.submit("a", None)
+    with pytest.raises(QueueFull):
+        q.submit_many([("b", None), ("c", None), ("d", None)], batch_id="big")
+    assert q.depth == 1
+    assert q.batch("big") is None
+    jobs = q.submit_many([("b", None), ("c", None)], batch_id="fits")
+    assert q.depth == 3
+    assert [j.id for j in q.batch("fits")] == [j.id for j in jobs]
+
+def test_batch_overflowing_the_queue_is_rejected(service, supabase, monkeypatch):
+    url, _ = supabase
+    monkeypatch.setattr(service, "batch_jobs", JobQueue(service.analyze_batch_item, workers=0, max_depth=2))
+    r = TestClient(service.app).post("/analyze/batch", json={"items": [item(url, f"r{i}", "/f.csv") for i in range(3)]})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "30"
+    assert service.batch_jobs.depth == 0
+
+def test_batch_status_combines_completed_reports(service, supabase):
+    url, stub = supabase
+    stub.FILES["/a.csv"], stub.FILES["/b.csv"] = sales_csv(300, seed=1), sales_csv(500, seed=2)
+    client = TestClient(service.app)
+    items = [item(url, "ra", "/a.csv"), item(url, "rb", "/b.csv"), item(url, "rc", "/missing.csv")]
+    batch = client.post("/analyze/batch", json={"items": items}).json()
+    deadline = time.monotonic() + 30
+    while not (status := client.get(batch["statusUrl"]).json())["done"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+    assert status["counts"] == {"completed": 2, "failed": 1}
+    kpis = {j["reportId"]: client.get(f"/jobs/{j['jobId']}").json()["result"]["chart_data"]["kpi"]
+            for j in batch["jobs"] if j["reportId"] != "rc"}
+    summary = status["summary"]
+    assert summary == combine_kpis(kpis)
+    assert summary["rows"] == 800
+    assert summary["total_sales"] == pytest.approx(kpis["ra"]["total_sales"] + kpis["rb"]["total_sales"])
+    # Items only count as done once their report rows are written
+    patched = " ".join(path for method, path in stub.REQUESTS if method == "PATCH")
+    assert all(f'"{r}"' in patched or f"%22{r}%22" in patched for r in ("ra", "rb", "rc"))
+
+def test_combine_kpis():
+    summary = combine_kpis({
+        "a": {"rows": 10, "total_sales": 300.0, "total_profit": 30.0, "profit_margin": 0.1, "average_order_value": 30.0},
+        "b": {"rows": 5, "total_sales": 100.0, "average_order_value": 20.0},
+        "c": {"rows": 2, "total_sales": float("nan"), "total_profit": 5.0},
+    })
+    assert summary["reports"] == 3 and summary["rows"] == 17
+    assert summary["total_sales"] == 400.0
+    assert summary["total_profit"] == 35.0
+    assert summary["profit_margin"] == pytest.approx(35.0 / 300.0)  # over the reports that have profit
+    assert [r["reportId"] for r in summary["by_report"]] == ["a", "b", "c"]
+    assert summary["by_report"][0]["share"] == 0.75
+    assert combine_kpis({})["by_report"] == []
@@ -0,0 +1,107 @@
+import io
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from app.cache import ResultCache, cache_key, content_hash
+
+def result(n: int, pdf: bool = True):
+    return {"kpi": {"rows": n}}, [(f"chart{n}.png", bytes(40))], io.BytesIO(b"%PDF" + bytes(56)) if pdf else None
+
+class Compute:
+    def __init__(self, n: int = 1, delay: float = 0.0, pdf: bool = True):
+        self.n, self.delay, self.pdf, self.calls = n, delay, pdf, 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return result(self.n, self.pdf)
+
+def age(cache: ResultCache, key: str, seconds: float) -> None:
+    t = time.time() - seconds
+    os.utime(os.path.join(cache.directory, key), (t, t))
+
+def test_content_hash_is_the_same_for_bytes_and_streams():
+    stream = io.BytesIO(b"a,b\n1,2\n")
+    stream.read(3)
+    digest = content_hash(stream)
+    assert digest == content_hash(b"a,b\n1,2\n")
+    assert stream.tell() == 0
+    assert cache_key(digest, "v1") == cache_key(digest, "v1") != cache_key(digest, "v2") != digest
+
+@pytest.mark.parametrize("directory", [False, True])
+def test_concurrent_callers_compute_once(tmp_path, directory):
+    cache = ResultCache(str(tmp_path) if directory else None, memory_bytes=10_000, disk_bytes=10_000)
+    compute = Compute(delay=0.2)
+    results = []
+    def call():
+        (chart_json, images, pdf), hit = cache.get_or_compute("k", compute)
+        results.append((chart_json, pdf.read(), hit))
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert compute.calls == 1
+    assert sorted(hit for _, _, hit in results) == [False] + [True] * 7
+    assert all(chart_json == {"kpi": {"rows": 1}} and pdf.startswith(b"%PDF") for chart_json, pdf, _ in results)
+
+def test_failed_compute_is_not_cached():
+    cache = ResultCache(None, memory_bytes=10_000, disk_bytes=0)
+    def fail():
+        raise ValueError("bad upload")
+    with pytest.raises(ValueError):
+        cache.get_or_compute("k", fail)
+    (_, _, pdf), hit = cache.get_or_compute("k", Compute())
+    assert not hit and pdf is not None
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(None, memory_bytes=250, disk_bytes=0)  # two 100-byte entries
+    for n in (1, 2):
+        cache.get_or_compute(f"k{n}", Compute(n))
+    cache.get("k1")
+    cache.get_or_compute("k3", Compute(3))
+    assert cache.get("k2") is None
+    assert cache.get("k1") is not None and cache.get("k3") is not None
+
+def test_disk_tier_evicts_oldest_and_its_memory_entry(tmp_path):
+    cache = ResultCache(str(tmp_path), memory_bytes=10_000, disk_bytes=10_000)
+    for n in (1, 2, 3):
+        cache.get_or_compute(f"k{n}", Compute(n))
+        age(cache, f"k{n}", 100 - n)
+    entry = sum(f.stat().st_size for f in (tmp_path / "k1").rglob("*") if f.is_file())
+    cache.disk_bytes = int(entry * 3.5)  # room for three entries
+    cache.get_or_compute("k4", Compute(4))
+    assert sorted(os.listdir(tmp_path)) == ["k2", "k3", "k4"]
+    compute = Compute(1)
+    _, hit = cache.get_or_compute("k1", compute)
+    assert not hit and compute.calls == 1
+
+def test_evicted_pdf_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path), memory_bytes=10_000, disk_bytes=10_000)
+    cache.get_or_compute("k", Compute())
+    shutil.rmtree(tmp_path / "k")  # evicted by another worker sharing the directory
+    compute = Compute()
+    (_, _, pdf), hit = cache.get_or_compute("k", compute)
+    assert not hit and compute.calls == 1
+    assert pdf.read().startswith(b"%PDF")
+
+def test_disk_entries_survive_a_restart(tmp_path):
+    cache = ResultCache(str(tmp_path), memory_bytes=10_000, disk_bytes=10_000)
+    cache.get_or_compute("k", Compute())
+    cache.get_or_compute("data", Compute(pdf=False))
+    cache.record_uploads("k", "u1", "u1/r1/report.pdf", ["u1/r1/images/chart1.png"])
+
+    restarted = ResultCache(str(tmp_path), memory_bytes=10_000, disk_bytes=10_000)
+    assert restarted.uploads_for("k", "u1") == {"pdf": "u1/r1/report.pdf", "images": ["u1/r1/images/chart1.png"]}
+    assert restarted.uploads_for("k", "u2") is None
+    compute = Compute()
+    (chart_json, images, pdf), hit = restarted.get_or_compute("k", compute)
+    assert hit and compute.calls == 0
+    assert chart_json == {"kpi": {"rows": 1}} and images == [("chart1.png", bytes(40))]
+    pdf.close()
+    (_, _, pdf), hit = restarted.get_or_compute("data", compute)
+    assert hit and pdf is None
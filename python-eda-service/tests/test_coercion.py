@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.coercion import (Coercer, DateFormat, NumberFormat, infer_date_format, infer_number_format,
+                          parse_dates, parse_numbers)
+from app.eda import add_helper_columns
+
+def numbers(values):
+    s = pd.Series(values, dtype=object)
+    fmt = infer_number_format(s)
+    return fmt, parse_numbers(s, fmt).tolist()
+
+@pytest.mark.parametrize("values, fmt, expected", [
+    (["₦1,200.50", "₦300", "₦12,000"], NumberFormat(",", ".", "₦"), [1200.5, 300.0, 12000.0]),
+    (["NGN 1,200", "NGN 45", "NGN 3,400.25"], NumberFormat(",", ".", "NGN"), [1200.0, 45.0, 3400.25]),
+    (["1.200,50", "3,25", "12.000"], NumberFormat(".", ","), [1200.5, 3.25, 12000.0]),
+    (["(300)", "1,200", "50"], NumberFormat(",", "."), [-300.0, 1200.0, 50.0]),
+    (["1 200,50", "3 400,00", "12,5"], NumberFormat(".", ","), [1200.5, 3400.0, 12.5]),
+])
+def test_number_formats(values, fmt, expected):
+    assert numbers(values) == (fmt, expected)
+
+def test_mixed_object_column_keeps_numeric_cells():
+    fmt, parsed = numbers([1200.5, "1,300.25", None, "N/A", 7])
+    assert fmt == NumberFormat(",", ".")
+    assert parsed[:2] == [1200.5, 1300.25] and parsed[4] == 7.0
+    assert np.isnan(parsed[2]) and np.isnan(parsed[3])
+
+def test_no_number_format_without_text_digits():
+    assert infer_number_format(pd.Series([1.5, 2.0])) is None
+    assert infer_number_format(pd.Series(["N/A", "-"], dtype=object)) is None
+
+def test_day_first_dates():
+    s = pd.Series(["13/01/2024", "02/03/2024", "25/12/2023"])
+    fmt = infer_date_format(s)
+    assert fmt == DateFormat("%d/%m/%Y", dayfirst=True)
+    assert parse_dates(s, fmt).tolist() == [pd.Timestamp(2024, 1, 13), pd.Timestamp(2024, 3, 2), pd.Timestamp(2023, 12, 25)]
+
+def test_month_first_dates_win_ties():
+    assert infer_date_format(pd.Series(["01/13/2024", "02/03/2024"])) == DateFormat("%m/%d/%Y")
+    assert infer_date_format(pd.Series(["02/03/2024", "04/05/2024"])) == DateFormat("%m/%d/%Y")
+
+def test_rejected_dates_fall_back_per_value():
+    s = pd.Series(["2024-01-05", "2024-02-10", "05 Mar 2024", "2024-03-07T10:30:00", "not a date"])
+    fmt = infer_date_format(s)
+    assert fmt.format == "%Y-%m-%d"
+    parsed = parse_dates(s, fmt)
+    assert parsed[:4].tolist() == [pd.Timestamp(2024, 1, 5), pd.Timestamp(2024, 2, 10),
+                                   pd.Timestamp(2024, 3, 5), pd.Timestamp(2024, 3, 7, 10, 30)]
+    assert pd.isna(parsed[4])
+
+def test_dates_no_single_format_fits():
+    s = pd.Series(["Jan 1st 2024", "Feb 2nd 2024", "Mar 3rd 2024"])
+    fmt = infer_date_format(s)
+    assert pd.to_datetime(s, format=fmt.format, errors="coerce").notna().sum() == 1
+    assert parse_dates(s, fmt).tolist() == [pd.Timestamp(2024, 1, 1), pd.Timestamp(2024, 2, 2), pd.Timestamp(2024, 3, 3)]
+    assert infer_date_format(pd.Series(["soon", "later"])) == DateFormat(None)
+
+def test_helper_columns_reuse_formats_across_chunks():
+    schema = {"date": "Date", "sales": "Sales", "qty": "Qty", "profit": "Profit"}
+    first = pd.DataFrame({"Date": ["13/01/2024", "14/01/2024"], "Sales": ["₦1,200.50", "₦300"],
+                          "Qty": [2, 3], "Profit": ["(50)", "20"]})
+    coercer = add_helper_columns(first, schema)
+    assert coercer.formats == {"Date": DateFormat("%d/%m/%Y", dayfirst=True),
+                               "Sales": NumberFormat(",", ".", "₦"), "Profit": NumberFormat(",", ".")}
+    assert first["Date"].tolist() == [pd.Timestamp(2024, 1, 13), pd.Timestamp(2024, 1, 14)]
+    assert first["_sales"].tolist() == [1200.5, 300.0]
+    assert first["_unit_price"].tolist() == [600.25, 100.0]
+    assert first["_profit"].tolist() == [-50.0, 20.0]
+    assert first["_discount"].isna().all()
+
+    # "02/03/2024" alone would read month-first; the first chunk's format decides
+    second = pd.DataFrame({"Date": ["02/03/2024"], "Sales": ["₦2,000"], "Qty": [4], "Profit": ["10"]})
+    add_helper_columns(second, schema, Coercer(coercer.formats))
+    assert second["Date"].tolist() == [pd.Timestamp(2024, 3, 2)]
+    assert second["_sales"].tolist() == [2000.0]
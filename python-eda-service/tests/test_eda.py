@@ -0,0 +1,120 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import eda
+from app.metrics import Trace
+from app.specs import ChartSpec, spec_series
+
+def sales_csv(rows: int, seed: int = 3) -> bytes:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "Order ID": [f"O-{i // 3}" for i in range(rows)],
+        "Order Date": pd.date_range("2023-01-01", periods=rows, freq="37min").strftime("%d/%m/%Y"),
+        "Customer Name": rng.choice([f"Customer {i}" for i in range(150)], rows),
+        "Category": rng.choice([f"Category {i}" for i in range(25)], rows),
+        "Region": rng.choice(["East", "West", "Central", "South"], rows),
+        "Quantity": rng.integers(1, 12, rows),
+        "Unit Price": rng.uniform(2, 900, rows).round(2),
+        "Profit": rng.normal(15, 40, rows).round(2),
+    })
+    return df.to_csv(index=False).encode()
+
+def assert_close(a, b, path="chart_data"):
+    """Equal up to float summation order."""
+    if isinstance(a, dict):
+        assert a.keys() == b.keys(), path
+        for k in a:
+            assert_close(a[k], b[k], f"{path}.{k}")
+    elif isinstance(a, (list, tuple)):
+        assert len(a) == len(b), path
+        for i, (x, y) in enumerate(zip(a, b)):
+            assert_close(x, y, f"{path}[{i}]")
+    elif isinstance(a, float):
+        assert a == pytest.approx(b, rel=1e-9, abs=1e-9, nan_ok=True), path
+    else:
+        assert a == b, path
+
+@pytest.mark.parametrize("chunk_rows", [701, 2500, 5000])
+def test_streamed_csv_matches_in_memory(monkeypatch, chunk_rows):
+    data = sales_csv(4000)
+    in_memory, _, _ = eda.eda_from_bytes(data, render="data")
+
+    monkeypatch.setattr(eda, "STREAM_BYTES", 0)
+    monkeypatch.setattr(eda, "CHUNK_ROWS", chunk_rows)
+    trace = Trace("test")
+    streamed, _, _ = eda.eda_from_bytes(data, render="data", trace=trace)
+
+    read = next(s for s in trace.to_dict()["spans"] if s["name"] == "read")
+    assert read["chunks"] == -(-4000 // chunk_rows)
+    if read["chunks"] > 1:
+        # Streamed grid edges come from the first chunk; every row is still binned
+        grid, expected = streamed["series"].pop("bubble_price_qty"), in_memory["series"].pop("bubble_price_qty")
+        assert grid["y_edges"] == expected["y_edges"]
+        width = expected["x_edges"][1] - expected["x_edges"][0]
+        assert grid["x_edges"][0] == pytest.approx(expected["x_edges"][0], abs=width)
+        assert grid["x_edges"][-1] == pytest.approx(expected["x_edges"][-1], abs=width)
+        assert np.sum(grid["rows"]) == pytest.approx(1, abs=0.01)  # cells are rounded to 4 digits
+    assert_close(in_memory, streamed)
+
+def test_density_grid_bins_every_row():
+    data = sales_csv(20000)
+    chart_data, _, _ = eda.eda_from_bytes(data, render="data")
+    grid = chart_data["series"]["bubble_price_qty"]
+    df = pd.read_csv(io.BytesIO(data))
+    # Quantities 1..11 get one row of cells each; their shares are the exact row shares
+    expected = df["Quantity"].value_counts(normalize=True).sort_index().to_numpy()
+    assert np.sum(grid["rows"], axis=1) == pytest.approx(expected, abs=2e-3)
+
+def test_approximate_aov_counts_orders_split_across_rows():
+    df = pd.read_csv(io.BytesIO(sales_csv(30000))).sample(frac=1, random_state=5)
+    data = df.to_csv(index=False).encode()
+    exact, _, _ = eda.eda_from_bytes(data, render="data")
+    approx, _, _ = eda.eda_from_bytes(data, render="data", approximate=True)
+
+    bounds = approx["approximate"]
+    error = 3 * bounds["average_order_value"]["relative_std_error"]
+    assert approx["kpi"]["average_order_value"] == pytest.approx(exact["kpi"]["average_order_value"], rel=error)
+    assert bounds["distinct_orders"]["estimate"] == pytest.approx(10000, rel=error)
+    # Shuffled rows split most orders into several runs; the histogram bound has to cover that
+    assert bounds["order_values"]["split_runs_max"] >= bounds["order_values"]["values"] - 10000
+
+def test_unwritable_snapshot_does_not_fail_the_analysis():
+    df = pd.read_csv(io.BytesIO(sales_csv(300)))
+    df["Order ID"] = [1001 + i // 3 if i % 2 else f"{1001 + i // 3}-A" for i in range(len(df))]  # ints and text
+    workbook = io.BytesIO()
+    df.to_excel(workbook, index=False)
+    expected, _, _ = eda.eda_from_bytes(workbook.getvalue(), render="data")
+
+    snapshot = io.BytesIO()
+    got, _, _ = eda.eda_from_bytes(workbook.getvalue(), render="data", snapshot=snapshot)
+    assert got == expected
+    assert snapshot.getvalue() == b""   # nothing half-written is left to publish
+
+def test_zero_sales_pareto_is_valid_json():
+    chart_data, _, _ = eda.eda_from_bytes(b"Order ID,Sales,Customer\n1,0,A\n2,0,B", render="data")
+    json.dumps(chart_data, allow_nan=False)
+    assert chart_data["series"]["pareto_customers"]["cumulative"] == [0.0, 0.0]
+
+def test_series_write_non_finite_values_as_null():
+    spec = ChartSpec("t.png", "T", "line", {"x": np.array([1.0, 2.0, 3.0]), "y": np.array([1.5, np.nan, np.inf])}, {})
+    assert spec_series(spec)["y"] == [1.5, None, None]
+
+def test_compact_downcasts_only_exact_floats():
+    df = eda.compact(pd.DataFrame({"Quantity": [1.0, np.nan, 12.0], "Rate": [0.5, 0.25, np.nan],
+                                   "Sales": [19.99, 1234567.89, 3.0], "Units": [1, 2, 3]}))
+    assert dict(df.dtypes.astype(str)) == {"Quantity": "float32", "Rate": "float32", "Sales": "float64", "Units": "int8"}
+
+def test_blank_quantities_give_the_same_report(monkeypatch):
+    data = sales_csv(2000)
+    df = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False)
+    df.loc[::7, "Quantity"] = ""
+    data = df.to_csv(index=False).encode()
+    assert eda.load_projected(data)[0]["Quantity"].dtype == "float32"
+    compacted, _, _ = eda.eda_from_bytes(data, render="data")
+    monkeypatch.setattr(eda, "compact", lambda frame: frame)
+    plain, _, _ = eda.eda_from_bytes(data, render="data")
+    assert_close(plain, compacted)
@@ -0,0 +1,85 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import incremental
+from app.coercion import DateFormat, NumberFormat
+from app.incremental import TAIL_ROWS, EdaState, refresh
+from test_eda import assert_close, sales_csv
+
+def head(data: bytes, rows: int) -> bytes:
+    return b"".join(data.splitlines(keepends=True)[:rows + 1])
+
+def edit(data: bytes, row: int, column: str, value) -> bytes:
+    df = pd.read_csv(io.BytesIO(data), dtype=str)
+    df.loc[row, column] = value
+    return df.to_csv(index=False).encode()
+
+def test_append_matches_full_rebuild():
+    data = sales_csv(3000)
+    first = refresh(head(data, 2000), None, render="data")
+    appended = refresh(data, first.state_bytes([]), render="data")
+    full = refresh(data, None, render="data")
+
+    assert (first.mode, appended.mode, full.mode) == ("full", "append", "full")
+    assert appended.new_rows == 1000
+    assert_close(full.chart_data["kpi"], appended.chart_data["kpi"])
+    series, expected = appended.chart_data["series"], full.chart_data["series"]
+    # The density grid keeps the edges fitted at the first build, so only its totals compare
+    for key in expected.keys() - {"bubble_price_qty"}:
+        assert_close(expected[key], series[key], key)
+    assert appended.state.density.rows.sum() == full.state.density.rows.sum() == 3000
+    assert appended.state.density.sales.sum() == pytest.approx(full.state.density.sales.sum())
+    assert appended.state.tail_hash == full.state.tail_hash
+
+def test_unchanged_reupload_does_no_work(monkeypatch):
+    data = sales_csv(1000)
+    first = refresh(data, None, render="data")
+    state = first.state_bytes(list(first.fingerprints))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("rows were coerced or aggregated again")
+    monkeypatch.setattr(incremental, "add_helper_columns", fail)
+    monkeypatch.setattr(incremental, "aggregate", fail)
+    again = refresh(data, state, render="data")
+    assert (again.mode, again.new_rows, again.changed) == ("unchanged", 0, [])
+    assert again.chart_data["kpi"] == first.chart_data["kpi"]
+
+@pytest.mark.parametrize("row", [2000 - TAIL_ROWS, 1999])
+def test_edited_tail_row_forces_full_rebuild(row):
+    data = sales_csv(3000)
+    state = refresh(head(data, 2000), None, render="data").state_bytes([])
+    edited = edit(data, row, "Quantity", "99")
+    result = refresh(edited, state, render="data")
+    assert result.mode == "full"
+    assert result.chart_data["kpi"] == refresh(edited, None, render="data").chart_data["kpi"]
+
+def test_changed_header_or_fewer_rows_rebuild():
+    data = sales_csv(2000)
+    state = refresh(data, None, render="data").state_bytes([])
+    assert refresh(head(data, 1500), state, render="data").mode == "full"
+    assert refresh(data.replace(b"Region", b"Territory", 1), state, render="data").mode == "full"
+
+def test_state_round_trip_keeps_formats():
+    state = refresh(sales_csv(500), None, render="data").state
+    state.formats.update({"Sales": NumberFormat(".", ",", "₦"), "Ship Date": DateFormat(None, dayfirst=True)})
+    loaded = EdaState.from_bytes(state.to_bytes())
+
+    assert loaded.formats == state.formats
+    assert loaded.formats["Order Date"] == DateFormat("%d/%m/%Y", dayfirst=True)
+    assert (loaded.header, loaded.schema, loaded.cat_dim, loaded.tail_hash) == (state.header, state.schema, state.cat_dim, state.tail_hash)
+    assert loaded.agg.rows == state.agg.rows and loaded.agg.total_sales == state.agg.total_sales
+    for dim, r in state.agg.by.items():
+        assert list(loaded.agg.by[dim].labels) == list(r.labels)
+        np.testing.assert_array_equal(loaded.agg.by[dim].sales, r.sales)
+    for k in ("x_edges", "y_edges", "rows", "sales"):
+        np.testing.assert_array_equal(getattr(loaded.density, k), getattr(state.density, k))
+
+def test_stale_or_broken_state_rebuilds():
+    data = sales_csv(500)
+    state = refresh(data, None, render="data").state
+    state.version = "0"
+    assert refresh(data, state.to_bytes(), render="data").mode == "full"
+    assert refresh(data, b"{not json", render="data").mode == "full"
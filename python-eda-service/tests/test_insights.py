@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+from app.insights import CircuitBreaker, Insights, InsightsError, Provider, ResponseCache
+
+def provider(stub, name, cooldown=60.0, timeout=5.0):
+    return Provider(name, stub.url, "key", f"model-{name}", timeout=timeout, cooldown=cooldown)
+
+@pytest.fixture
+def insights():
+    created = []
+    def make(providers, hedge_delay=2.0, cache=None):
+        created.append(Insights(providers, hedge_delay, cache or ResponseCache(16, 60)))
+        return created[-1]
+    yield make
+    for i in created:
+        i.close()
+
+def test_hedged_request_wins_over_slow_primary(stub_provider, insights):
+    slow, fast = stub_provider(), stub_provider()
+    slow.delay, slow.answer = 2.0, {"from": "primary"}
+    fast.answer = {"from": "secondary"}
+    ins = insights([provider(slow, "slow"), provider(fast, "fast")], hedge_delay=0.1)
+    t0 = time.perf_counter()
+    assert ins.generate("sys", "prompt") == {"from": "secondary"}
+    assert time.perf_counter() - t0 < 1.5
+    assert slow.calls == 1 and fast.calls == 1
+
+def test_fast_primary_is_not_hedged(stub_provider, insights):
+    primary, secondary = stub_provider(), stub_provider()
+    ins = insights([provider(primary, "a"), provider(secondary, "b")], hedge_delay=1.0)
+    assert ins.generate("sys", "prompt") == {"summary": "ok"}
+    assert secondary.calls == 0
+
+def test_breaker_opens_after_consecutive_failures(stub_provider):
+    stub = stub_provider()
+    stub.status = 500
+    p = provider(stub, "a")
+    for _ in range(p.breaker.threshold):
+        assert p.available
+        with pytest.raises(Exception):
+            p.complete("sys", "prompt")
+    assert not p.available
+    assert p.breaker.state == "open"
+    with pytest.raises(Exception, match="circuit open"):
+        p.complete("sys", "prompt")
+    assert stub.calls == p.breaker.threshold
+
+def test_breaker_opens_at_once_on_rate_limit(stub_provider):
+    stub = stub_provider()
+    stub.status, stub.headers = 429, {"Retry-After": "120"}
+    p = provider(stub, "a", cooldown=1.0)
+    with pytest.raises(Exception):
+        p.complete("sys", "prompt")
+    assert p.breaker.state == "open"
+    assert p.breaker.open_until - time.monotonic() > 60   # Retry-After outlasts the cooldown
+
+def test_breaker_half_opens_after_cooldown(stub_provider):
+    stub = stub_provider()
+    stub.status = 429
+    p = provider(stub, "a", cooldown=0.2)
+    with pytest.raises(Exception):
+        p.complete("sys", "prompt")
+    assert not p.available
+    time.sleep(0.3)
+    assert p.breaker.state == "half_open" and p.available
+
+    # A failed trial call opens it again for another cooldown
+    stub.status = 500
+    with pytest.raises(Exception):
+        p.complete("sys", "prompt")
+    assert p.breaker.state == "open"
+    time.sleep(0.3)
+
+    # A successful one closes it
+    stub.status = 200
+    assert p.complete("sys", "prompt") == {"summary": "ok"}
+    assert p.breaker.state == "closed" and p.breaker.failures == 0
+
+def test_half_open_lets_one_trial_call_through():
+    breaker = CircuitBreaker(cooldown=0.05)
+    breaker.failure(429)
+    time.sleep(0.1)
+    assert breaker.allow()
+    assert not breaker.allow()
+    assert not breaker.ready()
+    breaker.success()
+    assert breaker.allow() and breaker.allow()
+
+def test_cache_hit_skips_the_provider(stub_provider, insights):
+    stub = stub_provider()
+    ins = insights([provider(stub, "a")])
+    first = ins.generate("sys", "prompt")
+    first["summary"] = "mutated by the caller"
+    assert ins.generate("sys", "prompt") == {"summary": "ok"}
+    assert stub.calls == 1
+    ins.generate("sys", "other prompt")
+    assert stub.calls == 2
+
+def test_falls_back_when_primary_fails(stub_provider, insights):
+    primary, secondary = stub_provider(), stub_provider()
+    primary.status = 503
+    secondary.answer = {"from": "secondary"}
+    ins = insights([provider(primary, "a"), provider(secondary, "b")], hedge_delay=5.0)
+    assert ins.generate("sys", "prompt") == {"from": "secondary"}
+    assert primary.calls == 1 and secondary.calls == 1
+
+def test_every_provider_failing_raises(stub_provider, insights):
+    primary, secondary = stub_provider(), stub_provider()
+    primary.status, secondary.status = 500, 402
+    ins = insights([provider(primary, "a"), provider(secondary, "b")], hedge_delay=5.0)
+    with pytest.raises(InsightsError, match="status 500.*status 402"):
+        ins.generate("sys", "prompt")
+
+def test_no_available_provider_returns_none(stub_provider, insights):
+    stub = stub_provider()
+    p = provider(stub, "a")
+    p.breaker.failure(429)
+    assert insights([p]).generate("sys", "prompt") is None
+    assert stub.calls == 0
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.jobs import JobFailed, JobQueue, QueueFull
+
+class Gate:
+    """Job function that blocks until released; fails the reports named 'bad'."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def __call__(self, job, payload, progress):
+        self.release.wait(10)
+        if job.report_id == "bad":
+            raise JobFailed("bad upload")
+        return {"report": job.report_id}
+
+def wait_idle(q: JobQueue, jobs, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while any(j.status not in ("completed", "failed") for j in jobs):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    time.sleep(0.05)  # the worker prunes right after the last status change
+
+def test_full_queue_raises():
+    q = JobQueue(Gate(), workers=0, max_depth=2)
+    q.submit("a", None)
+    q.submit("b", None)
+    with pytest.raises(QueueFull):
+        q.submit("c", None)
+    assert q.depth == 2
+
+def test_retention_keeps_unfinished_jobs():
+    gate = Gate()
+    q = JobQueue(gate, workers=1, max_depth=10, retain=2)
+    jobs = [q.submit(r, None) for r in ("a", "bad", "c", "d", "e")]
+    # One running and four queued: all still visible although retain is 2
+    assert all(q.get(j.id) is j for j in jobs)
+
+    gate.release.set()
+    wait_idle(q, jobs)
+    assert [q.get(j.id) for j in jobs] == [None, None, None, jobs[3], jobs[4]]
+    assert jobs[1].status == "failed" and jobs[4].result == {"report": "e"}
+
+def test_retention_keeps_unfinished_batches():
+    gate = Gate()
+    q = JobQueue(gate, workers=1, max_depth=10, retain=2)
+    batches = [q.submit_many([(f"{b}{i}", None) for i in range(2)], batch_id=b) for b in ("w", "x", "y", "z")]
+    assert all(len(q.batch(b)) == 2 for b in ("w", "x", "y", "z"))
+
+    gate.release.set()
+    wait_idle(q, [j for batch in batches for j in batch])
+    assert q.batch("w") is None and q.batch("x") is None
+    assert q.batch("y") == []  # the batch is still known, its jobs are past the job limit
+    assert [j.status for j in q.batch("z")] == ["completed", "completed"]
+
+def test_full_queue_is_a_503(service, monkeypatch):
+    monkeypatch.setattr(service, "jobs", JobQueue(service.analyze_job, workers=0, max_depth=1))
+    client = TestClient(service.app)
+    body = {"reportId": "r1", "userId": "u1", "signedUrl": "http://127.0.0.1:9/f.csv"}
+    assert client.post("/analyze", json=body).status_code == 202
+    r = client.post("/analyze", json={**body, "reportId": "r2"})
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "30"
+    assert service.jobs.depth == 1
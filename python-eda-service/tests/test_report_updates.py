@@ -0,0 +1,92 @@
+import threading
+
+import requests
+
+from app.supa import ReportUpdates, Supa, SupaError
+
+class FakeSupa:
+    """Records update_reports calls; raises the queued errors first."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = []
+
+    def update_reports(self, report_ids, payload):
+        self.calls.append((list(report_ids), dict(payload)))
+        if self.errors:
+            raise self.errors.pop(0)
+
+def updates(supa, **kwargs):
+    # A long interval keeps the background flush out of the way; the tests flush by hand
+    return ReportUpdates(supa, interval=3600, backoff=0, **kwargs)
+
+def test_identical_updates_are_grouped():
+    supa = FakeSupa()
+    db = updates(supa)
+    db.update_report("a", {"processing_progress": 10})
+    db.update_report("a", {"processing_progress": 60})
+    db.update_report("b", {"processing_progress": 60})
+    assert db.flush() == 1
+    assert supa.calls == [(["a", "b"], {"processing_progress": 60})]
+
+def test_server_errors_are_retried_up_to_the_cap():
+    supa = FakeSupa(*[SupaError("Failed to update report: 503", 503)] * 10)
+    db = updates(supa, max_attempts=3)
+    db.update_report("a", {"processing_status": "completed"})
+    for _ in range(5):
+        db.flush()
+    assert len(supa.calls) == 3
+    assert not db.wait("a", timeout=1)
+
+def test_connection_errors_are_retried():
+    supa = FakeSupa(requests.ConnectionError("reset"))
+    db = updates(supa)
+    db.update_report("a", {"processing_status": "completed"})
+    db.flush()
+    db.flush()
+    assert len(supa.calls) == 2
+    assert db.wait("a", timeout=1)
+
+def test_client_errors_are_dropped():
+    supa = FakeSupa(SupaError("Failed to update report: 400", 400))
+    db = updates(supa)
+    db.update_report("a", {"processing_status": "completed"})
+    db.flush()
+    db.flush()
+    assert len(supa.calls) == 1
+    assert not db.wait("a", timeout=1)
+
+def test_retries_back_off():
+    supa = FakeSupa(SupaError("Failed to update report: 502", 502))
+    db = ReportUpdates(supa, interval=3600, backoff=60)
+    db.update_report("a", {"processing_status": "completed"})
+    db.flush()
+    assert db.flush() == 0                  # still backing off
+    assert db.flush(force=True) == 1
+    assert len(supa.calls) == 2
+
+def test_wait_returns_once_the_update_is_written():
+    supa = FakeSupa()
+    db = updates(supa)
+    db.update_report("a", {"processing_status": "completed"})
+    done = []
+    waiter = threading.Thread(target=lambda: done.append(db.wait("a", timeout=5)))
+    waiter.start()
+    waiter.join(0.1)
+    assert not done                         # nothing written yet
+    db.flush()
+    waiter.join(5)
+    assert done == [True]
+    assert db.wait("never-updated", timeout=0)
+
+def test_grouped_updates_are_sent_once_per_attempt(supabase):
+    url, stub = supabase
+    stub.FAIL["/rest/v1/reports"] = 10
+    supa = Supa(url, "key", max_retries=3, backoff=0)
+    db = updates(supa, max_attempts=3)
+    db.update_report("a", {"processing_status": "completed"})
+    for _ in range(5):
+        db.flush()
+    assert len(stub.CALLS) == 3             # no session-level retries underneath ReportUpdates
+    assert not db.wait("a", timeout=1)
+    supa.close()
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+
+from app.supa import AsyncSupa, Supa, SupaError
+
+def items(n, size=1000):
+    return [(f"r1/images/{i}.png", bytes([i % 256]) * size, "image/png") for i in range(n)]
+
+def ports(stub, method):
+    return {port for m, _, port, _ in stub.CALLS if m == method}
+
+def test_requests_reuse_pooled_connections(supabase):
+    url, stub = supabase
+    supa = Supa(url, "key")
+    for i in range(5):
+        supa.upload("reports", f"r1/{i}.png", b"x")
+        supa.update_report("r1", {"processing_progress": i})
+    assert len(ports(stub, "PUT") | ports(stub, "PATCH")) == 1
+    supa.close()
+
+def test_upload_many_is_bounded(supabase):
+    url, stub = supabase
+    stub.PUT_DELAY = 0.05
+    supa = Supa(url, "key", upload_concurrency=3)
+    done = []
+    paths = supa.upload_many("reports", items(12), on_uploaded=lambda path, secs: done.append(path))
+    assert paths == [path for path, _, _ in items(12)]
+    assert sorted(done) == sorted(paths)
+    assert stub.MAX_PUTS == 3
+    assert all(f"/storage/v1/object/reports/{p}" in stub.FILES for p in paths)
+    supa.close()
+
+def test_server_errors_are_retried_with_backoff(supabase):
+    url, stub = supabase
+    stub.FAIL["/storage/v1/object/reports/r1/a.png"] = 2
+    supa = Supa(url, "key", max_retries=3, backoff=0.2)
+    assert supa.upload("reports", "r1/a.png", b"x")
+    times = [t for m, _, _, t in stub.CALLS]
+    assert len(times) == 3
+    assert times[2] - times[1] >= 0.3  # urllib3 backs off 0.2 * 2 before the second retry
+    supa.close()
+
+def test_retries_give_up(supabase):
+    url, stub = supabase
+    stub.FAIL["/storage/v1/object/reports/r1/a.png"] = 10
+    supa = Supa(url, "key", max_retries=2, backoff=0)
+    with pytest.raises(SupaError) as e:
+        supa.upload("reports", "r1/a.png", b"x")
+    assert e.value.status == 503
+    assert len(stub.CALLS) == 3
+    supa.close()
+
+def test_async_client(supabase):
+    url, stub = supabase
+    stub.PUT_DELAY = 0.05
+    stub.FILES["/storage/v1/object/reports/in.csv"] = b"a,b\n1,2\n"
+
+    async def run():
+        supa = AsyncSupa(url, "key", upload_concurrency=2)
+        try:
+            paths = await supa.upload_many("reports", items(6))
+            await supa.update_report("r1", {"processing_progress": 50})
+            data = await supa.download("reports/in.csv")
+            missing = await supa.download("reports/missing.csv")
+        finally:
+            await supa.aclose()
+        return paths, data.read(), missing
+
+    paths, data, missing = asyncio.run(run())
+    assert paths == [path for path, _, _ in items(6)]
+    assert stub.MAX_PUTS == 2
+    assert len(ports(stub, "PUT") | ports(stub, "PATCH") | ports(stub, "GET")) <= 2  # the pool's connections
+    assert data == b"a,b\n1,2\n" and missing is None
+
+def test_async_client_retries_once_per_attempt(supabase):
+    url, stub = supabase
+    stub.FAIL["/rest/v1/reports"] = 2
+
+    async def run():
+        supa = AsyncSupa(url, "key", max_retries=3, backoff=0.1)
+        try:
+            t0 = time.monotonic()
+            await supa.update_report("r1", {"processing_progress": 50})
+            return time.monotonic() - t0
+        finally:
+            await supa.aclose()
+
+    elapsed = asyncio.run(run())
+    assert len(stub.CALLS) == 3             # two 503s and the success, nothing retried underneath
+    assert elapsed >= 0.5 * 0.1 * (1 + 2)   # jittered backoff of at least half of 0.1, 0.2
@@ -153,7 +153,7 @@ serve(async (req) => {
     }
 
     const result = await resp.json();
-    console.log('Python service completed successfully:', { reportId, hasPdf: !!result.pdf });
+    console.log('Python service accepted job:', { reportId, jobId: result.jobId });
 
     // Optionally, you can return the Python result directly
     return new Response(JSON.stringify({
@@ -0,0 +1,4 @@
+-- Per-stage progress written by the Python EDA job workers
+alter table spreadsheet_reports
+  add column if not exists processing_stage text,
+  add column if not exists processing_progress smallint;